@@ -0,0 +1,367 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from curves import CURVES
+from engine import renewal_offset
+from poly import Linear, Exponential
+
+
+class BatchRegionResult(NamedTuple):
+    """
+    The outcome of a single region for every scenario of a batch, one array element per scenario.
+    """
+
+    start_price: np.ndarray
+    renewal_price: np.ndarray
+    # NaN where no sellout price has been set.
+    sellout_price: np.ndarray
+
+
+class _Invariants(NamedTuple):
+    """
+    The values of a region step that only depend on the configuration and settings of the scenarios.
+    """
+
+    # Whether the region of every scenario has a renewal block, and whether they all do.
+    has_renewal: np.ndarray
+    all_renewal: bool
+    # The lead-in factor at the renewal block.
+    renewal_factor: np.ndarray
+    # Whether the region of every scenario is at least one block long, and whether they all are.
+    evaluated: np.ndarray
+    all_evaluated: bool
+    ideal: np.ndarray
+    # The number of cores offered beyond the ideal.
+    surplus: np.ndarray
+    # Whether the cores offered are limited in every scenario, and whether they all are.
+    limited: np.ndarray
+    all_limited: bool
+
+
+class BatchCalculatePrice:
+    """
+    Struct-of-arrays counterpart of `CalculatePrice` that holds many scenarios at once.
+    Every attribute of `CalculatePrice` (including the configuration values) is a NumPy array with one element per scenario,
+    and every method moves all scenarios forward with array operations.
+    A missing sellout price is represented by NaN and a missing `limit_cores_offered` or `ideal_bulk_proportion` by 0.
+    The values of a step that do not change from one region to the next (the lead-in factor at the renewal block, the
+    ideal number of cores sold, ...) are cached until an attribute they depend on is replaced: change the configuration
+    and settings by assigning new arrays, not by writing into them.
+    """
+
+    def __init__(
+        self,
+        size,
+        interlude_length,
+        leadin_length,
+        region_length,
+        ideal_bulk_proportion,
+        limit_cores_offered,
+        renewal_bump,
+        linear=False,
+        factor=1,
+        price=1000,
+        initial_bought_price=1000,
+        new_buy_price=1000,
+        sellout_price=np.nan,
+        cores_sold_in_renewal=40,
+        cores_sold_in_sale=6,
+        curve=None,
+    ):
+        self.size = size
+        # The name of a curve registered in `curves.CURVES` used by every scenario instead of the linear or exponential curve, if set.
+        self.curve = curve
+        # Configuration values, see `Config`.
+        self.interlude_length = self.__array(interlude_length)
+        self.leadin_length = self.__array(leadin_length)
+        self.region_length = self.__array(region_length)
+        self.ideal_bulk_proportion = self.__array(ideal_bulk_proportion, none=0)
+        self.limit_cores_offered = self.__array(limit_cores_offered, none=0)
+        self.renewal_bump = self.__array(renewal_bump)
+        # Settings and state, see `CalculatePrice`.
+        self.linear = self.__array(linear, dtype=bool)
+        self.factor = self.__array(factor)
+        self.price = self.__array(price)
+        self.initial_bought_price = self.__array(initial_bought_price)
+        self.new_buy_price = self.__array(new_buy_price)
+        self.sellout_price = self.__array(sellout_price, none=np.nan)
+        self.cores_sold_in_renewal = self.__array(cores_sold_in_renewal)
+        self.cores_sold_in_sale = self.__array(cores_sold_in_sale)
+        self.cores_sold = self.cores_sold_in_renewal + self.cores_sold_in_sale
+
+        # The renewal block only depends on the lengths, so it is computed once per distinct pair.
+        lengths, inverse = np.unique(
+            np.stack([self.interlude_length, self.region_length], axis=1),
+            axis=0,
+            return_inverse=True,
+        )
+        offsets = np.array(
+            [renewal_offset(_ConfigView(*pair)) for pair in lengths], dtype=float
+        )
+        self.renewal_offset = offsets[inverse.reshape(-1)]
+        self._invariants = None
+
+    def __array(self, values, dtype=float, none=None):
+        if none is not None:
+            if values is None:
+                values = none
+            elif np.ndim(values):
+                values = [none if value is None else value for value in values]
+        if not np.ndim(values):
+            return np.full(self.size, values, dtype=dtype)
+        array = np.array(np.broadcast_to(np.asarray(values, dtype=dtype), (self.size,)))
+        return array
+
+    @classmethod
+    def from_calculators(cls, price_calculators):
+        """
+        Create a batch from the current state of `CalculatePrice` objects, one scenario per object.
+
+        :param price_calculators: List of `CalculatePrice` objects.
+        """
+        curves = {calculator.curve for calculator in price_calculators}
+        if len(curves) > 1:
+            raise ValueError("All scenarios of a batch must use the same registered curve.")
+        config_values = [calculator.config.as_dict() for calculator in price_calculators]
+        return cls(
+            len(price_calculators),
+            **{key: [values[key] for values in config_values] for key in _CONFIG_KEYS},
+            **{
+                key: [getattr(calculator, key) for calculator in price_calculators]
+                for key in _STATE_KEYS
+            },
+            curve=curves.pop() if curves else None,
+        )
+
+    @classmethod
+    def from_calculator(cls, price_calculator, size):
+        """
+        Create a batch of `size` identical scenarios from the current state of a `CalculatePrice` object.
+        """
+        return cls(
+            size,
+            **price_calculator.config.as_dict(),
+            **{key: getattr(price_calculator, key) for key in _STATE_KEYS},
+            curve=price_calculator.curve,
+        )
+
+    def __len__(self):
+        return self.size
+
+    def take(self, indices):
+        """
+        Create a batch from the current state of some scenarios of this batch, which may be repeated.
+
+        :param indices: The indices of the scenarios of the new batch.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        batch = object.__new__(type(self))
+        for name, value in vars(self).items():
+            setattr(batch, name, value[indices] if isinstance(value, np.ndarray) else value)
+        batch.size = len(indices)
+        return batch
+
+    def leadin_factor_at(self, through):
+        """
+        Calculate the lead-in factor (LF) of every scenario, choosing linear or exponential per scenario.
+
+        :param through: The fraction of the lead-in period that has passed, one element per scenario.
+        """
+        if self.curve is not None:
+            return CURVES.get(self.curve)(through, self.factor)
+        return np.where(
+            self.linear,
+            Linear.leadin_factor_at(through, factor=self.factor),
+            Exponential.leadin_factor_at(through, factor=self.factor),
+        )
+
+    def ideal_cores_sold(self):
+        """
+        The ideal number of cores sold of every scenario.
+        """
+        return np.floor(self.ideal_bulk_proportion * self.limit_cores_offered)
+
+    def __invariants(self):
+        """
+        The `_Invariants` of the current configuration and settings, computed again only once one of them is replaced.
+        """
+        sources = (
+            self.renewal_offset,
+            self.leadin_length,
+            self.region_length,
+            self.linear,
+            self.factor,
+            self.ideal_bulk_proportion,
+            self.limit_cores_offered,
+        )
+        # The cache holds on to the arrays, so their ids identify them.
+        key = (*map(id, sources), self.curve, CURVES.generation(self.curve) if self.curve is not None else None)
+        cached = self._invariants
+        if cached is None or cached[1] != key:
+            has_renewal = ~np.isnan(self.renewal_offset)
+            through = np.clip(np.nan_to_num(self.renewal_offset), 0, self.leadin_length) / self.leadin_length
+            evaluated = self.region_length >= 1
+            limited = self.limit_cores_offered != 0
+            ideal = self.ideal_cores_sold()
+            invariants = _Invariants(
+                has_renewal=has_renewal,
+                all_renewal=bool(has_renewal.all()),
+                renewal_factor=self.leadin_factor_at(through),
+                evaluated=evaluated,
+                all_evaluated=bool(evaluated.all()),
+                ideal=ideal,
+                surplus=self.limit_cores_offered - ideal,
+                limited=limited,
+                all_limited=bool(limited.all()),
+            )
+            self._invariants = cached = (sources, key, invariants)
+        return cached[2]
+
+    def update_renewal_price(self):
+        """
+        Update the renewal price based on the initial bought price and the new buy price.
+        See `CalculatePrice.update_renewal_price`.
+        """
+        price_cap = self.initial_bought_price * (1 + self.renewal_bump)
+        self.initial_bought_price = np.minimum(price_cap, self.new_buy_price)
+
+    def rotate_sale(self, renewed_cores, sold_cores):
+        """
+        Calculate the starting price for the upcoming sale based on the number of cores sold.
+        See `CalculatePrice.rotate_sale`.
+
+        :param renewed_cores: The number of cores sold in renewal, scalar or one element per scenario.
+        :param sold_cores: The number of cores sold in the previous sale, scalar or one element per scenario.
+        """
+        self.cores_sold_in_renewal = self.__array(renewed_cores)
+        self.cores_sold_in_sale = self.__array(sold_cores)
+        self.cores_sold = self.cores_sold_in_renewal + self.cores_sold_in_sale
+
+        invariants = self.__invariants()
+        ideal = invariants.ideal
+        cores_sold = self.cores_sold
+        # Sold more than the ideal amount: adapt the last purchase price before the sell-out,
+        # sold less than the ideal: adapt the regular price. No cores offered: no purchase price.
+        purchase_price = np.where(
+            cores_sold >= ideal, self.sellout_price, self.price
+        )
+        adapt = ~np.isnan(purchase_price)
+        if not invariants.all_limited:
+            adapt &= invariants.limited
+
+        # `Linear.adapt_price`, both branches evaluated at once.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            adapted = np.where(
+                cores_sold <= ideal,
+                np.maximum(cores_sold, 1) / ideal,
+                1 + (cores_sold - ideal) / invariants.surplus,
+            )
+        self.price = np.where(adapt, adapted * purchase_price, self.price)
+
+    def sellout_price_update(self):
+        """
+        Update the sellout price, see `CalculatePrice.__sellout_price_update`.
+        """
+        update = (
+            (self.cores_sold_in_renewal <= self.__invariants().ideal)
+            & (self.cores_sold_in_sale > 0)
+        ) | np.isnan(self.sellout_price)
+        self.sellout_price = np.where(update, self.price, self.sellout_price)
+
+    def renew_price(self):
+        """
+        Set the new buy price from the renewal price at the renewal block of the region, see `engine.renewal_offset`.
+        Scenarios without a renewal block keep their new buy price.
+        """
+        invariants = self.__invariants()
+        sale_price = invariants.renewal_factor * self.price
+        cap_price = self.initial_bought_price * (1 + self.renewal_bump)
+        renewal_price = np.minimum(cap_price, sale_price)
+        self.new_buy_price = (
+            renewal_price
+            if invariants.all_renewal
+            else np.where(invariants.has_renewal, renewal_price, self.new_buy_price)
+        )
+
+    def step_region(self, renewed_cores, sold_cores):
+        """
+        Move every scenario forward by one region, see `engine.RegionEngine.step`.
+
+        :param renewed_cores: The number of cores sold in renewal, scalar or one element per scenario.
+        :param sold_cores: The number of cores sold in the sale, scalar or one element per scenario.
+        :return: The `BatchRegionResult` of the region.
+        """
+        self.renew_price()
+        invariants = self.__invariants()
+        sellout_price = self.sellout_price
+        self.sellout_price_update()
+        if not invariants.all_evaluated:
+            self.sellout_price = np.where(invariants.evaluated, self.sellout_price, sellout_price)
+
+        start_price = self.price
+        sellout_price = self.sellout_price
+
+        # Recalculate the price of renewal of the core
+        self.update_renewal_price()
+        renewal_price = self.initial_bought_price
+
+        # Recalculate the price at the end of the region
+        self.rotate_sale(renewed_cores, sold_cores)
+
+        return BatchRegionResult(start_price, renewal_price, sellout_price)
+
+    def run(self, region_nb, renewed_cores, sold_cores):
+        """
+        Move every scenario forward by `region_nb` regions.
+
+        :param region_nb: The number of regions to simulate.
+        :param renewed_cores: The number of cores renewed in each region, either a dictionary keyed by region number
+            starting at 1 (as used by the app) or an array of shape (region_nb,) or (region_nb, size).
+        :param sold_cores: The number of cores sold in each region, in the same form as `renewed_cores`.
+        :return: `BatchRegionResult` whose arrays have shape (region_nb, size).
+        """
+        renewed_cores = _schedule(renewed_cores, region_nb)
+        sold_cores = _schedule(sold_cores, region_nb)
+
+        start_prices = np.empty((region_nb, self.size))
+        renewal_prices = np.empty((region_nb, self.size))
+        sellout_prices = np.empty((region_nb, self.size))
+        for region_i in range(region_nb):
+            result = self.step_region(renewed_cores[region_i], sold_cores[region_i])
+            start_prices[region_i] = result.start_price
+            renewal_prices[region_i] = result.renewal_price
+            sellout_prices[region_i] = result.sellout_price
+        return BatchRegionResult(start_prices, renewal_prices, sellout_prices)
+
+
+_CONFIG_KEYS = (
+    "interlude_length",
+    "leadin_length",
+    "region_length",
+    "ideal_bulk_proportion",
+    "limit_cores_offered",
+    "renewal_bump",
+)
+
+_STATE_KEYS = (
+    "linear",
+    "factor",
+    "price",
+    "initial_bought_price",
+    "new_buy_price",
+    "sellout_price",
+    "cores_sold_in_renewal",
+    "cores_sold_in_sale",
+)
+
+
+class _ConfigView(NamedTuple):
+    interlude_length: float
+    region_length: float
+
+
+def _schedule(cores, region_nb):
+    if isinstance(cores, dict):
+        return np.array([cores.get(region_i + 1, 0) for region_i in range(region_nb)])
+    return np.asarray(cores)
@@ -0,0 +1,303 @@
+"""
+Benchmarks of the pricing hot paths.
+
+Run all benchmarks and compare them with the saved baseline:
+
+    python benchmark.py --baseline benchmark_baseline.json
+
+Save the results as the new baseline:
+
+    python benchmark.py --baseline benchmark_baseline.json --save
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from batch import BatchCalculatePrice
+from cache import SimulationCache
+from config import Config
+from engine import RegionEngine
+from fixed import FixedBatchCalculatePrice
+from poly import Linear
+from price import CalculatePrice
+from render import chart_data
+
+# Blocks per day of the demo configuration used by the app and on Polkadot.
+DEMO_BLOCKS_PER_DAY = 5
+PRODUCTION_BLOCKS_PER_DAY = 14_400
+
+
+class Benchmark(NamedTuple):
+    """
+    A benchmark scenario.
+    """
+
+    name: str
+    # Prepares the state of a run and returns the function that is timed.
+    setup: Callable[[], Callable[[], object]]
+    # The number of calls (blocks, regions, ...) made by one run, used for the calls per second.
+    calls: int
+
+
+def create_config(blocks_per_day):
+    return Config(
+        interlude_length=7 * blocks_per_day,
+        leadin_length=7 * blocks_per_day,
+        region_length=28 * blocks_per_day,
+        ideal_bulk_proportion=0.6,
+        limit_cores_offered=50,
+        renewal_bump=0.05,
+    )
+
+
+def create_calculator(config):
+    price_calculator = CalculatePrice(config)
+    price_calculator.change_linear(True)
+    return price_calculator
+
+
+def schedule(region_nb):
+    """
+    A renewal/sales schedule that alternates between selling below and above the ideal number of cores.
+    """
+    monthly_renewals = {month: 20 + 15 * (month % 2) for month in range(1, region_nb + 1)}
+    monthly_sales = {month: 5 for month in range(1, region_nb + 1)}
+    return monthly_renewals, monthly_sales
+
+
+def _calculate_price(config, block_nb):
+    def setup():
+        price_calculator = create_calculator(config)
+        step = config.region_length / block_nb
+
+        def run():
+            for i in range(block_nb):
+                price_calculator.calculate_price(0, i * step)
+
+        return run
+
+    return setup
+
+
+def _rotate_sale(config, call_nb):
+    def setup():
+        price_calculator = create_calculator(config)
+
+        def run():
+            for i in range(call_nb):
+                price_calculator.rotate_sale(20 + i % 20, 5)
+
+        return run
+
+    return setup
+
+
+def _adapt_price(call_nb):
+    def setup():
+        def run():
+            for i in range(call_nb):
+                Linear.adapt_price(i % 50, 30, 50)
+
+        return run
+
+    return setup
+
+
+def _engine(config, region_nb):
+    monthly_renewals, monthly_sales = schedule(region_nb)
+
+    def setup():
+        engine = RegionEngine(create_calculator(config))
+        return lambda: engine.run(region_nb, monthly_renewals, monthly_sales)
+
+    return setup
+
+
+def _region_loop(config, region_nb):
+    """
+    The region loop of `StreamlitApp._plot_graph` on a cold cache: every region curve is computed and downsampled for the chart.
+    """
+    monthly_renewals, monthly_sales = schedule(region_nb)
+
+    def setup():
+        price_calculator = create_calculator(config)
+
+        def run():
+            regions = SimulationCache().simulate(
+                price_calculator, region_nb, monthly_renewals, monthly_sales
+            )
+            return chart_data(config, regions)
+
+        return run
+
+    return setup
+
+
+def _batch(config, region_nb, size, fixed):
+    """
+    `BatchCalculatePrice.run`, or `FixedBatchCalculatePrice.run` if `fixed`, on an exponential curve with sales around
+    the ideal, so that the fixed-point prices stay int64. The fixed-point run should take less than 8 times the float one.
+    """
+    rng = np.random.default_rng(0)
+    renewals = np.full((region_nb, size), 25)
+    sales = rng.integers(4, 7, (region_nb, size))
+
+    def setup():
+        price_calculator = CalculatePrice(config)
+        price_calculator.change_factor(5)
+        if fixed:
+            batch = FixedBatchCalculatePrice.from_calculator(price_calculator, size, unit=10**10)
+        else:
+            batch = BatchCalculatePrice.from_calculator(price_calculator, size)
+        return lambda: batch.run(region_nb, renewals, sales)
+
+    return setup
+
+
+def benchmarks(quick=False):
+    """
+    The benchmark scenarios, parameterized over the demo and production configurations and the number of regions.
+
+    :param quick: Only run the small scenarios.
+    """
+    region_counts = (1, 20) if quick else (1, 20, 500)
+    scenarios = [
+        Benchmark("adapt_price", _adapt_price(10_000), 10_000),
+    ]
+    batch_config = create_config(DEMO_BLOCKS_PER_DAY)
+    batch_size = 2_000 if quick else 20_000
+    for label, fixed in (("float", False), ("fixed", True)):
+        scenarios.append(
+            Benchmark(f"batch[{label}]", _batch(batch_config, 50, batch_size, fixed), 50 * batch_size)
+        )
+    for label, blocks_per_day in (
+        ("demo", DEMO_BLOCKS_PER_DAY),
+        ("production", PRODUCTION_BLOCKS_PER_DAY),
+    ):
+        config = create_config(blocks_per_day)
+        block_nb = min(config.region_length, 20_000)
+        scenarios.extend(
+            [
+                Benchmark(f"calculate_price[{label}]", _calculate_price(config, block_nb), block_nb),
+                Benchmark(f"rotate_sale[{label}]", _rotate_sale(config, 10_000), 10_000),
+            ]
+        )
+        for region_nb in region_counts:
+            scenarios.append(
+                Benchmark(f"engine[{label},{region_nb}]", _engine(config, region_nb), region_nb)
+            )
+            # The app shows at most 20 regions, and 500 production regions of curves would not fit in memory.
+            if label == "demo" or region_nb <= 20:
+                scenarios.append(
+                    Benchmark(
+                        f"region_loop[{label},{region_nb}]",
+                        _region_loop(config, region_nb),
+                        region_nb * config.region_length,
+                    )
+                )
+    return scenarios
+
+
+def measure(benchmark, repeat=5):
+    """
+    Run a benchmark `repeat` times and once more under `tracemalloc` for the peak memory.
+
+    :return: Dictionary with the median wall time in seconds, the peak memory in bytes and the calls per second.
+    """
+    times = []
+    for _ in range(repeat):
+        run = benchmark.setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    run = benchmark.setup()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    seconds = statistics.median(times)
+    return {
+        "seconds": seconds,
+        "peak_bytes": peak_bytes,
+        "calls_per_second": benchmark.calls / seconds if seconds > 0 else float("inf"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Find the benchmarks that got slower than the baseline by more than `threshold` (a fraction).
+
+    :return: List of (name, baseline seconds, seconds) tuples.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        baseline_seconds = baseline[name]["seconds"]
+        if result["seconds"] > baseline_seconds * (1 + threshold):
+            regressions.append((name, baseline_seconds, result["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", help="JSON file with the baseline results.")
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before flagging a regression, as a fraction.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per benchmark.")
+    parser.add_argument("--quick", action="store_true", help="Only run the small scenarios.")
+    parser.add_argument("--filter", default="", help="Only run the benchmarks whose name contains this text.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for benchmark in benchmarks(quick=args.quick):
+        if args.filter not in benchmark.name:
+            continue
+        result = measure(benchmark, repeat=args.repeat)
+        results[benchmark.name] = result
+        print(
+            f"{benchmark.name:<34} {result['seconds'] * 1000:>10.3f} ms"
+            f" {result['peak_bytes'] / 2**20:>9.2f} MiB"
+            f" {result['calls_per_second']:>14,.0f} calls/s"
+        )
+
+    if args.baseline and args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "benchmarks": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["benchmarks"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, baseline_seconds, seconds in regressions:
+            print(
+                f"REGRESSION {name}: {baseline_seconds * 1000:.3f} ms -> {seconds * 1000:.3f} ms"
+                f" (+{(seconds / baseline_seconds - 1) * 100:.0f}%)"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
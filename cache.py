@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+
+import instrument
+from curves import CURVES
+from engine import SALE_START, RegionEngine, RegionResult
+from price import PriceState
+
+# Rough size in bytes of the Python objects kept per cached region, besides the price curve.
+REGION_OVERHEAD = 512
+
+
+class CachedRegion(NamedTuple):
+    """
+    A simulated region as kept by the `SimulationCache`.
+    """
+
+    result: RegionResult
+    # The price curve of the region, evaluated at `region_blocks`.
+    prices: np.ndarray
+    # The state of the price calculator after the region.
+    state: PriceState
+
+
+def scenario_key(price_calculator, sale_start=SALE_START):
+    """
+    A hashable snapshot of everything that determines a simulation apart from the renewal/sales schedule:
+    the configuration values, the curve settings (including the generation of the registered curve, see
+    `curves.CurveRegistry.generation`) and the prices the price calculator starts from.
+    """
+    return (
+        tuple(price_calculator.config.as_dict().values()),
+        price_calculator.snapshot(),
+        CURVES.generation(price_calculator.get_curve()),
+        sale_start,
+    )
+
+
+def schedule_key(region_nb, monthly_renewals, monthly_sales):
+    """
+    The renewal/sales schedule of `region_nb` regions as a tuple of (renewed cores, sold cores) pairs.
+    """
+    return tuple(
+        (monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0))
+        for region_i in range(region_nb)
+    )
+
+
+class SimulationCache:
+    """
+    LRU cache of simulated regions, keyed by the scenario (see `scenario_key`) and the renewal/sales schedule.
+
+    A region only depends on the schedule of the regions before it, so a simulation reuses the
+    regions of the cached schedule that shares the longest prefix with the requested one and
+    only computes the regions after the first change.
+    The least recently used schedules are evicted once more than `max_entries` are cached or
+    their price curves take more than `max_bytes`. Schedules sharing a prefix share its regions,
+    whose price curves are counted once in `nbytes`.
+    The cache may be shared by many threads: a simulation that is already being computed by another
+    thread is waited for instead of being computed twice.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.regions_reused = 0
+        self.regions_computed = 0
+        self._entries = OrderedDict()
+        # The number of entries holding each cached price curve, keyed by its `id`.
+        self._curve_refs = {}
+        # Events set once the simulations being computed, keyed like the entries, are stored.
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._curve_refs.clear()
+            self.nbytes = 0
+
+    def __longest_prefix(self, key, schedule):
+        best_schedule, best_length = None, 0
+        for cached_key, cached_schedule in self._entries:
+            if cached_key != key:
+                continue
+            length = 0
+            for cached, requested in zip(cached_schedule, schedule):
+                if cached != requested:
+                    break
+                length += 1
+            if length > best_length:
+                best_schedule, best_length = cached_schedule, length
+        if best_schedule is None:
+            return ()
+        self._entries.move_to_end((key, best_schedule))
+        return self._entries[(key, best_schedule)][:best_length]
+
+    def __store(self, key, schedule, regions):
+        entry_key = (key, schedule)
+        if entry_key in self._entries:
+            self._entries.move_to_end(entry_key)
+            return
+        self._entries[entry_key] = regions
+        for region in regions:
+            curve_id = id(region.prices)
+            if curve_id not in self._curve_refs:
+                self._curve_refs[curve_id] = 0
+                self.nbytes += _nbytes(region)
+            self._curve_refs[curve_id] += 1
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.nbytes > self.max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            for region in evicted:
+                curve_id = id(region.prices)
+                self._curve_refs[curve_id] -= 1
+                if not self._curve_refs[curve_id]:
+                    # No other entry keeps the curve alive, so its id may be reused from now on.
+                    del self._curve_refs[curve_id]
+                    self.nbytes -= _nbytes(region)
+
+    def simulate(
+        self, price_calculator, region_nb, monthly_renewals, monthly_sales, sale_start=SALE_START
+    ):
+        """
+        Simulate `region_nb` regions, reusing cached regions where possible.
+        The price calculator is left in the same state as after simulating every region.
+
+        :param price_calculator: The `CalculatePrice` object to simulate from.
+        :param region_nb: The number of regions to simulate.
+        :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+        :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+        :param sale_start: The first block of the first region.
+        :return: Tuple of `CachedRegion`, one per region.
+        """
+        key = scenario_key(price_calculator, sale_start)
+        schedule = schedule_key(region_nb, monthly_renewals, monthly_sales)
+
+        while True:
+            with self._lock:
+                regions = self.__longest_prefix(key, schedule)
+                if len(regions) == region_nb:
+                    self.hits += 1
+                    self.regions_reused += region_nb
+                    self.__store(key, schedule, regions)
+                    break
+                # Wait for another thread computing the same simulation, then look again.
+                in_flight = self._in_flight.get((key, schedule))
+                if in_flight is None:
+                    self.misses += 1
+                    self.regions_reused += len(regions)
+                    self.regions_computed += region_nb - len(regions)
+                    computing = self._in_flight[(key, schedule)] = threading.Event()
+                    break
+            in_flight.wait()
+
+        if regions:
+            price_calculator.restore(regions[-1].state)
+        if len(regions) == region_nb:
+            instrument.increment("cache_hits")
+            return tuple(regions)
+        instrument.increment("cache_misses")
+
+        try:
+            engine = RegionEngine(price_calculator, sale_start)
+            computed = []
+            for region_i in range(len(regions), region_nb):
+                # Cached curves are shared between schedules, and are read-only.
+                region = engine.step_curve(region_i, *schedule[region_i])
+                computed.append(
+                    CachedRegion(region.result, region.prices, price_calculator.snapshot())
+                )
+
+            regions = tuple(regions) + tuple(computed)
+            with self._lock:
+                self.__store(key, schedule, regions)
+        finally:
+            with self._lock:
+                del self._in_flight[(key, schedule)]
+            computing.set()
+        return regions
+
+
+def _nbytes(region):
+    return region.prices.nbytes + REGION_OVERHEAD
@@ -0,0 +1,273 @@
+"""
+Calibration of the configuration and lead-in curve to an observed price path.
+
+Given the start price and renewal price observed in every region, `Calibrator.fit` looks for the
+`ideal_bulk_proportion`, `renewal_bump`, lead-in `factor` and linear or exponential curve that reproduce them best.
+Candidates are scored by the mean squared relative error of the simulated prices (see `Calibrator.score`), and
+every batch of candidates is simulated together in one `BatchCalculatePrice`.
+
+The search starts from random points of the parameter space, keeps the best of them and improves each with a
+coordinate search: one parameter at a time, a grid of candidates around the current value is evaluated at once,
+and the bracket around the best candidate is narrowed (or widened when the best candidate is at its edge) until it
+is smaller than the tolerance. Scores are cached by parameter values, so fitting again, e.g. with more restarts or
+a smaller tolerance, only simulates the points that were not evaluated before.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from batch import BatchCalculatePrice
+from config import Config
+
+# The continuous parameters and their default bounds.
+BOUNDS = {
+    "ideal_bulk_proportion": (0.0, 1.0),
+    "renewal_bump": (0.0, 0.5),
+}
+
+# The lead-in factors tried by default, the range of the factor slider of the app.
+FACTORS = tuple(range(1, 11))
+
+# Continuous values are rounded to this many decimals in the cache keys.
+KEY_DECIMALS = 12
+
+
+class Point(NamedTuple):
+    """
+    A candidate parameter set.
+    """
+
+    linear: bool
+    factor: int
+    ideal_bulk_proportion: float
+    renewal_bump: float
+
+
+class Calibration(NamedTuple):
+    """
+    The best parameter set found by `Calibrator.fit`.
+    """
+
+    point: Point
+    # The configuration with the calibrated values.
+    config: Config
+    # The mean squared relative error of the simulated prices.
+    score: float
+    # The number of points simulated and the number of points answered from the cache during the fit.
+    evaluations: int
+    cache_hits: int
+
+
+def _key(point):
+    return (
+        bool(point.linear),
+        int(point.factor),
+        round(float(point.ideal_bulk_proportion), KEY_DECIMALS),
+        round(float(point.renewal_bump), KEY_DECIMALS),
+    )
+
+
+class Calibrator:
+    """
+    Fits the parameters of a scenario to observed prices, see the module documentation.
+
+    :param price_calculator: The `CalculatePrice` object the observed history starts from: its configuration
+        (apart from the calibrated values) and state are used for every candidate. It is not modified.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param start_prices: The observed start price of every region, NaN where unknown.
+    :param renewal_prices: The observed renewal price of every region, NaN where unknown, or None.
+    :param renewal_weight: The weight of the renewal price errors relative to the start price errors.
+    """
+
+    def __init__(
+        self,
+        price_calculator,
+        monthly_renewals,
+        monthly_sales,
+        start_prices,
+        renewal_prices=None,
+        renewal_weight=1.0,
+    ):
+        self.price_calculator = price_calculator
+        self.start_prices = np.asarray(start_prices, dtype=float)
+        self.region_nb = len(self.start_prices)
+        self.renewal_prices = (
+            np.full(self.region_nb, np.nan) if renewal_prices is None else np.asarray(renewal_prices, dtype=float)
+        )
+        if len(self.renewal_prices) != self.region_nb:
+            raise ValueError("There must be as many observed renewal prices as start prices.")
+        self.renewal_weight = renewal_weight
+        self.renewed = np.array([monthly_renewals.get(region_i + 1, 0) for region_i in range(self.region_nb)])
+        self.sold = np.array([monthly_sales.get(region_i + 1, 0) for region_i in range(self.region_nb)])
+        # Scores of the evaluated points, keyed by `_key`.
+        self.cache = {}
+        self.evaluations = 0
+        self.cache_hits = 0
+        self.__base = BatchCalculatePrice.from_calculator(price_calculator, 1)
+
+    def simulate(self, points):
+        """
+        Simulate every point in one batch.
+
+        :param points: List of `Point`.
+        :return: `BatchRegionResult` whose arrays have shape (region_nb, len(points)).
+        """
+        batch = self.__base.take(np.zeros(len(points), dtype=np.intp))
+        batch.linear = np.array([point.linear for point in points], dtype=bool)
+        for name in ("factor", "ideal_bulk_proportion", "renewal_bump"):
+            setattr(batch, name, np.array([getattr(point, name) for point in points], dtype=float))
+        return batch.run(self.region_nb, self.renewed, self.sold)
+
+    def score(self, points):
+        """
+        The mean squared relative error of the start prices, plus `renewal_weight` times the one of the renewal
+        prices, of every point. Observed prices that are NaN are left out. Cached scores are not simulated again.
+
+        :param points: List of `Point`.
+        :return: NumPy array of scores, one per point.
+        """
+        keys = [_key(point) for point in points]
+        missing = {}
+        for key, point in zip(keys, points):
+            if key not in self.cache and key not in missing:
+                missing[key] = point
+        self.cache_hits += len(points) - len(missing)
+        if missing:
+            results = self.simulate(list(missing.values()))
+            scores = self.__error(results.start_price, self.start_prices)
+            if self.renewal_weight:
+                scores = scores + self.renewal_weight * self.__error(results.renewal_price, self.renewal_prices)
+            self.cache.update(zip(missing, scores.tolist()))
+            self.evaluations += len(missing)
+        return np.array([self.cache[key] for key in keys])
+
+    @staticmethod
+    def __error(simulated, observed):
+        known = ~np.isnan(observed)
+        if not known.any():
+            return np.zeros(simulated.shape[1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            relative = (simulated[known] - observed[known, None]) / np.abs(observed[known, None])
+        relative = np.where(np.isfinite(relative), relative, np.inf)
+        return np.mean(relative ** 2, axis=0)
+
+    def fit(
+        self,
+        bounds=None,
+        factors=FACTORS,
+        curves=(True, False),
+        restarts=8,
+        samples=256,
+        grid=9,
+        tolerance=1e-4,
+        max_rounds=50,
+        rng=None,
+    ):
+        """
+        Find the best parameter set.
+
+        :param bounds: Dictionary of (low, high) pairs of the continuous parameters, see `BOUNDS`.
+        :param factors: The lead-in factors to consider.
+        :param curves: The values of `linear` to consider.
+        :param restarts: The number of best random points the coordinate search starts from.
+        :param samples: The number of random points drawn.
+        :param grid: The number of candidates evaluated along a continuous parameter at once, at least 3.
+        :param tolerance: The width of the bracket of a continuous parameter at which the search stops.
+        :param max_rounds: The maximum number of rounds over all parameters.
+        :param rng: The `np.random.Generator` to draw from.
+        :return: The `Calibration`.
+        """
+        if grid < 3:
+            # The bracket is only narrowed around a candidate between its edges.
+            raise ValueError("The grid needs at least 3 candidates.")
+        bounds = {**BOUNDS, **(bounds or {})}
+        factors = tuple(factors)
+        curves = tuple(curves)
+        rng = rng if rng is not None else np.random.default_rng()
+        evaluations, cache_hits = self.evaluations, self.cache_hits
+
+        # Random restart stage: the best distinct random points start a coordinate search each.
+        current = Point(
+            linear=bool(self.price_calculator.linear),
+            factor=int(self.price_calculator.factor),
+            ideal_bulk_proportion=float(np.clip(self.__base.ideal_bulk_proportion[0], *bounds["ideal_bulk_proportion"])),
+            renewal_bump=float(np.clip(self.__base.renewal_bump[0], *bounds["renewal_bump"])),
+        )
+        if current.factor not in factors or current.linear not in curves:
+            current = current._replace(factor=factors[0], linear=curves[0])
+        candidates = [current] + [
+            Point(
+                linear=curves[rng.integers(len(curves))],
+                factor=factors[rng.integers(len(factors))],
+                ideal_bulk_proportion=float(rng.uniform(*bounds["ideal_bulk_proportion"])),
+                renewal_bump=float(rng.uniform(*bounds["renewal_bump"])),
+            )
+            for _ in range(samples)
+        ]
+        scores = self.score(candidates)
+        starts = []
+        for i in np.argsort(scores, kind="stable"):
+            if candidates[i] not in starts:
+                starts.append(candidates[i])
+            if len(starts) == restarts:
+                break
+
+        best = min(
+            (self.__coordinate_search(start, bounds, factors, curves, grid, tolerance, max_rounds) for start in starts),
+            key=lambda found: found[1],
+        )
+        point, score = best
+        config = Config(
+            **{
+                **self.price_calculator.config.as_dict(),
+                "ideal_bulk_proportion": point.ideal_bulk_proportion,
+                "renewal_bump": point.renewal_bump,
+            }
+        )
+        return Calibration(
+            point=point,
+            config=config,
+            score=score,
+            evaluations=self.evaluations - evaluations,
+            cache_hits=self.cache_hits - cache_hits,
+        )
+
+    def __coordinate_search(self, point, bounds, factors, curves, grid, tolerance, max_rounds):
+        """
+        Improve a point one parameter at a time, see the module documentation.
+
+        :return: Tuple of the best point and its score.
+        """
+        score = float(self.score([point])[0])
+        widths = {name: (high - low) / 4 for name, (low, high) in bounds.items()}
+        for _ in range(max_rounds):
+            improved = False
+            # The discrete parameters are tried in full, every candidate in one batch.
+            for name, values in (("linear", curves), ("factor", factors)):
+                candidates = [point._replace(**{name: value}) for value in values]
+                candidate_scores = self.score(candidates)
+                i = int(np.argmin(candidate_scores))
+                if candidate_scores[i] < score:
+                    point, score, improved = candidates[i], float(candidate_scores[i]), True
+
+            for name, (low, high) in bounds.items():
+                value, width = getattr(point, name), widths[name]
+                values = np.linspace(max(low, value - width), min(high, value + width), grid)
+                candidates = [point._replace(**{name: float(candidate)}) for candidate in values]
+                candidate_scores = self.score(candidates)
+                i = int(np.argmin(candidate_scores))
+                if candidate_scores[i] < score:
+                    point, score, improved = candidates[i], float(candidate_scores[i]), True
+                at_edge = (i == 0 and values[0] > low) or (i == grid - 1 and values[-1] < high)
+                if at_edge and candidate_scores[i] <= score:
+                    # The minimum may lie beyond the bracket.
+                    widths[name] = min(2 * width, high - low)
+                else:
+                    # The minimum is bracketed by the neighbours of the best candidate. The bracket at least
+                    # halves, also when the grid is too coarse for its spacing to do so.
+                    widths[name] = max(min(values[1] - values[0], width / 2), tolerance / 2)
+
+            if not improved and all(width <= tolerance for width in widths.values()):
+                break
+        return point, score
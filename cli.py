@@ -0,0 +1,290 @@
+"""
+Run coretime price simulations from the command line, without the Streamlit app.
+
+Simulate 12 regions with 30 renewals and 5 sales per region and print the results as CSV:
+
+    python cli.py --regions 12 --renewals 30 --sales 5
+
+Read the scenario from a TOML or JSON file and write the results as Parquet:
+
+    python cli.py --config scenario.toml --output results.parquet
+
+Also write the per-block prices of every region as a Parquet dataset partitioned by region:
+
+    python cli.py --config scenario.toml --output results.csv --trace trace/
+
+Time the pricing hot paths and print the metrics in the Prometheus text format to stderr:
+
+    python cli.py --regions 500 --metrics prometheus
+
+A scenario file holds the same settings as the flags, with the configuration values in a `config` table:
+
+    regions = 12
+    linear = true
+    renewals = [30, 32, 35]
+    sales = 5
+
+    [config]
+    ideal_bulk_proportion = 0.6
+"""
+import argparse
+import csv
+import json
+import sys
+
+import instrument
+from config import Config
+from engine import SALE_START, RegionEngine
+from scenario import Scenario
+
+BLOCKS_PER_DAY = 5
+
+DEFAULT_CONFIG = {
+    "interlude_length": 7 * BLOCKS_PER_DAY,
+    "leadin_length": 7 * BLOCKS_PER_DAY,
+    "region_length": 28 * BLOCKS_PER_DAY,
+    "ideal_bulk_proportion": 0.6,
+    "limit_cores_offered": 50,
+    "renewal_bump": 0.05,
+}
+
+DEFAULT_SETTINGS = {
+    "regions": 2,
+    "linear": True,
+    "factor": 1,
+    "price": 1000,
+    "initial_bought_price": 1000,
+    "renewals": 10,
+    "sales": 0,
+}
+
+COLUMNS = ["region", "region_start", "start_price", "renewal_price", "sellout_price"]
+
+FORMATS = ("csv", "json", "parquet")
+
+METRICS_FORMATS = ("json", "prometheus")
+
+
+def load_file(path):
+    """
+    Load scenario settings from a TOML or JSON file.
+    """
+    if path.endswith(".json"):
+        with open(path) as f:
+            return json.load(f)
+    try:
+        import tomllib
+    except ImportError:
+        # Python < 3.11
+        import toml
+
+        with open(path) as f:
+            return toml.load(f)
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def parse_schedule(value):
+    """
+    Parse the number of cores renewed or sold per region: a single number for all regions or a comma separated list.
+    """
+    if isinstance(value, str):
+        value = [int(cores) for cores in value.split(",")] if "," in value else int(value)
+    return value
+
+
+def monthly_schedule(value, region_nb):
+    """
+    Turn a schedule (a number for all regions or a list with one number per region) into a dictionary keyed by region number starting at 1.
+    """
+    if isinstance(value, (list, tuple)):
+        return {month: cores for month, cores in enumerate(value, start=1)}
+    return {month: value for month in range(1, region_nb + 1)}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--config", dest="config_file", help="TOML or JSON file with the scenario settings.")
+    for key in DEFAULT_CONFIG:
+        value_type = float if key in ("ideal_bulk_proportion", "renewal_bump") else int
+        parser.add_argument(f"--{key.replace('_', '-')}", type=value_type, help=f"Config value `{key}`.")
+    parser.add_argument("--regions", type=int, help="Number of regions to simulate.")
+    curve = parser.add_mutually_exclusive_group()
+    curve.add_argument("--linear", dest="linear", action="store_true", default=None, help="Linear lead-in factor curve.")
+    curve.add_argument("--exponential", dest="linear", action="store_false", help="Exponential lead-in factor curve.")
+    parser.add_argument("--factor", type=float, help="Factor of the lead-in factor curve.")
+    parser.add_argument("--price", type=float, help="Starting price of the sale.")
+    parser.add_argument("--initial-bought-price", type=float, help="Price of the core bought in the previous region.")
+    parser.add_argument("--renewals", type=parse_schedule, help="Cores renewed per region: a number or a comma separated list.")
+    parser.add_argument("--sales", type=parse_schedule, help="Cores sold per region: a number or a comma separated list.")
+    parser.add_argument("--output", "-o", default="-", help="Output file, or - for stdout.")
+    parser.add_argument("--format", choices=FORMATS, help="Output format, by default from the output file extension or csv.")
+    parser.add_argument("--trace", help="Also write the per-block prices as a Parquet dataset partitioned by region to this directory.")
+    parser.add_argument("--metrics", choices=METRICS_FORMATS, help="Time the pricing hot paths and write the metrics in this format.")
+    parser.add_argument("--metrics-output", default="-", help="Metrics output file, or - for stderr.")
+    return parser
+
+
+def merge_settings(values, source="scenario"):
+    """
+    Merge scenario settings, as read from a scenario file, over the defaults.
+
+    :param values: Dictionary of settings, with the configuration values in a `config` dictionary.
+    :param source: The name of the settings in error messages.
+    :return: Tuple of (config values, settings).
+    """
+    values = dict(values)
+    config_values = dict(DEFAULT_CONFIG)
+    file_config = values.pop("config", {})
+    unknown = (set(values) - set(DEFAULT_SETTINGS)) | (set(file_config) - set(DEFAULT_CONFIG))
+    if unknown:
+        raise ValueError(f"Unknown settings in {source}: {', '.join(sorted(unknown))}")
+    config_values.update(file_config)
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(values)
+    return config_values, settings
+
+
+def resolve_settings(args):
+    """
+    Merge the defaults, the scenario file and the flags, in increasing order of precedence.
+
+    :return: Tuple of (config values, settings).
+    """
+    if args.config_file:
+        config_values, settings = merge_settings(load_file(args.config_file), args.config_file)
+    else:
+        config_values, settings = dict(DEFAULT_CONFIG), dict(DEFAULT_SETTINGS)
+
+    for key in config_values:
+        if getattr(args, key) is not None:
+            config_values[key] = getattr(args, key)
+    for key in settings:
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+    return config_values, settings
+
+
+def build_scenario(config_values, settings):
+    """
+    Build the `Scenario` and the renewal/sales schedules of the given settings.
+
+    :return: Tuple of (scenario, monthly renewals, monthly sales).
+    """
+    scenario = Scenario(
+        config=Config(**config_values),
+        linear=settings["linear"],
+        factor=settings["factor"],
+        price=settings["price"],
+        initial_bought_price=settings["initial_bought_price"],
+    )
+    region_nb = settings["regions"]
+    return (
+        scenario,
+        monthly_schedule(parse_schedule(settings["renewals"]), region_nb),
+        monthly_schedule(parse_schedule(settings["sales"]), region_nb),
+    )
+
+
+def simulate(config_values, settings):
+    """
+    Run the region loop of the app for the given settings.
+
+    :return: List of `RegionResult`.
+    """
+    scenario, monthly_renewals, monthly_sales = build_scenario(config_values, settings)
+    engine = RegionEngine(scenario.create_calculator(), sale_start=SALE_START)
+    return engine.run(settings["regions"], monthly_renewals, monthly_sales)
+
+
+def write_trace(path, config_values, settings):
+    """
+    Write the per-block prices of every region as a Parquet dataset, see `export.export_trace`.
+
+    :return: The number of rows written.
+    """
+    from export import export_trace
+
+    scenario, monthly_renewals, monthly_sales = build_scenario(config_values, settings)
+    return export_trace(
+        path,
+        scenario.create_calculator(),
+        settings["regions"],
+        monthly_renewals,
+        monthly_sales,
+        sale_start=SALE_START,
+    )
+
+
+def write_results(results, output, output_format):
+    """
+    Write the region results to a file or stdout.
+    """
+    rows = [[getattr(result, column) for column in COLUMNS] for result in results]
+    if output_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if output == "-":
+            raise ValueError("Parquet output needs an output file.")
+        table = pa.table({column: [row[i] for row in rows] for i, column in enumerate(COLUMNS)})
+        pq.write_table(table, output)
+        return
+
+    f = sys.stdout if output == "-" else open(output, "w", newline="")
+    try:
+        if output_format == "json":
+            json.dump([dict(zip(COLUMNS, row)) for row in rows], f, indent=2)
+            f.write("\n")
+        else:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(rows)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+
+def write_metrics(metrics, output, metrics_format):
+    """
+    Write the instrumentation metrics to a file or stderr.
+    """
+    text = metrics.to_prometheus() if metrics_format == "prometheus" else metrics.to_json() + "\n"
+    if output == "-":
+        sys.stderr.write(text)
+    else:
+        with open(output, "w") as f:
+            f.write(text)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config_values, settings = resolve_settings(args)
+    output_format = args.format
+    if output_format is None:
+        extension = args.output.rsplit(".", 1)[-1] if "." in args.output else ""
+        output_format = extension if extension in FORMATS else "csv"
+
+    if args.metrics:
+        instrument.METRICS.reset()
+        instrument.enable()
+    try:
+        with instrument.timer("simulate_regions"):
+            results = simulate(config_values, settings)
+        with instrument.timer("write_results"):
+            write_results(results, args.output, output_format)
+        if args.trace:
+            with instrument.timer("write_trace"):
+                write_trace(args.trace, config_values, settings)
+    finally:
+        if args.metrics:
+            instrument.disable()
+    if args.metrics:
+        write_metrics(instrument.METRICS, args.metrics_output, args.metrics)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,3 +29,16 @@ class Config:
         for key, value in updated_values.items():
             if hasattr(self, key):
                 setattr(self, key, value)
+
+    def as_dict(self):
+        """
+        Return the configuration values as a dictionary keyed by attribute name.
+        """
+        return {
+            "interlude_length": self.interlude_length,
+            "leadin_length": self.leadin_length,
+            "region_length": self.region_length,
+            "ideal_bulk_proportion": self.ideal_bulk_proportion,
+            "limit_cores_offered": self.limit_cores_offered,
+            "renewal_bump": self.renewal_bump,
+        }
@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from poly import Linear, Exponential
+
+
+class CurveRegistry:
+    """
+    Registry of lead-in factor curves, with a cache of dense factor tables.
+
+    A curve is a function `leadin_factor_at(when, factor)` like `Linear.leadin_factor_at`, where `when` is the
+    fraction of the lead-in period that has passed (a scalar or a NumPy array).
+    For every (curve, factor, leadin_length) in use, the factors of all whole numbers of blocks into the lead-in
+    are computed once and kept in a table, so that evaluating the curve at whole blocks is a lookup. Grids of
+    fractional blocks that are evaluated again and again, like the blocks of `engine.region_blocks`, get a table
+    of their own, see `grid_table`.
+    The least recently used tables are evicted once more than `max_tables` are cached.
+
+    Every curve name has a generation, increased when the curve is registered or unregistered: tables computed
+    with a replaced function are never cached, and caches of simulation results include it in their keys.
+    """
+
+    def __init__(self, max_tables=16):
+        self.max_tables = max_tables
+        self.hits = 0
+        self.misses = 0
+        self._curves = {}
+        self._generations = {}
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, leadin_factor_at):
+        """
+        Register a lead-in factor curve, replacing the curve of the same name and its cached tables.
+
+        :param name: The name of the curve.
+        :param leadin_factor_at: Function `leadin_factor_at(when, factor)`.
+        """
+        with self._lock:
+            self._curves[name] = leadin_factor_at
+            self.__invalidate(name)
+
+    def unregister(self, name):
+        """
+        Remove a curve and its cached tables.
+        """
+        with self._lock:
+            self._curves.pop(name, None)
+            self.__invalidate(name)
+
+    def __invalidate(self, name):
+        # Called with the lock held.
+        self._generations[name] = self._generations.get(name, 0) + 1
+        for key in [key for key in self._tables if key[0] == name]:
+            del self._tables[key]
+
+    def generation(self, name):
+        """
+        The number of times a curve name has been registered or unregistered.
+        """
+        return self._generations.get(name, 0)
+
+    def get(self, name):
+        """
+        Get the function of a registered curve.
+        """
+        try:
+            return self._curves[name]
+        except KeyError:
+            raise ValueError(f"Unknown lead-in curve: {name}") from None
+
+    def names(self):
+        return list(self._curves)
+
+    def clear_tables(self):
+        with self._lock:
+            self._tables.clear()
+
+    def table(self, name, factor, leadin_length):
+        """
+        The factor table of a curve: `table[num]` is the lead-in factor `num` blocks into a lead-in of `leadin_length` blocks.
+
+        :return: Read-only NumPy array of length `leadin_length + 1`.
+        """
+        return self.__cached(
+            (name, factor, leadin_length), lambda: np.arange(int(leadin_length) + 1), name, factor, leadin_length
+        )
+
+    def grid_table(self, name, factor, leadin_length, grid, num):
+        """
+        The lead-in factors at a grid of blocks that is evaluated repeatedly, computed on the first call only.
+
+        :param grid: Hashable key that identifies `num` among the grids of the same curve, factor and lead-in length.
+        :param num: Function returning the NumPy array of the numbers of blocks into the lead-in of the grid.
+        :return: Read-only NumPy array with the shape of `num()`.
+        """
+        return self.__cached((name, factor, leadin_length, grid), num, name, factor, leadin_length)
+
+    def __cached(self, key, num, name, factor, leadin_length):
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return table
+            self.misses += 1
+            generation = self.generation(name)
+            function = self.get(name)
+
+        # Computed without the lock, and only cached if the curve has not been replaced in the meantime.
+        table = function(num() / leadin_length, factor)
+        table = np.asarray(table, dtype=float)
+        table.flags.writeable = False
+
+        with self._lock:
+            if self.generation(name) == generation:
+                self._tables[key] = table
+                while len(self._tables) > self.max_tables:
+                    self._tables.popitem(last=False)
+        return table
+
+    def leadin_factor(self, name, factor, leadin_length, num):
+        """
+        The lead-in factor `num` blocks into a lead-in of `leadin_length` blocks.
+        Arrays of whole numbers of blocks are looked up in the factor table; scalars, for which a lookup costs more
+        than the curve itself, and fractional blocks are evaluated with the curve function.
+
+        :param num: The number of blocks into the lead-in, between 0 and `leadin_length`; a scalar or a NumPy array.
+        :return: The lead-in factor, with the same shape as `num`.
+        """
+        if (
+            isinstance(num, np.ndarray)
+            and leadin_length > 0
+            and leadin_length == int(leadin_length)
+            and np.array_equal(num, np.floor(num))
+        ):
+            return self.table(name, factor, leadin_length)[num.astype(np.intp)]
+        return self.get(name)(num / leadin_length, factor)
+
+
+CURVES = CurveRegistry()
+CURVES.register("linear", Linear.leadin_factor_at)
+CURVES.register("exponential", Exponential.leadin_factor_at)
+
+
+def register_curve(name, leadin_factor_at):
+    """
+    Register a lead-in factor curve in the registry used by `CalculatePrice`, see `CurveRegistry.register`.
+    """
+    CURVES.register(name, leadin_factor_at)
@@ -0,0 +1,191 @@
+import math
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+# The first block of the first region, shared by the app and every simulation.
+SALE_START = 0
+
+
+class RegionResult(NamedTuple):
+    """
+    The outcome of a single region of the simulation.
+    """
+
+    # The number of the region, starting at 1 like the keys of the monthly renewals and sales.
+    region: int
+    # The first block of the region.
+    region_start: float
+    # The price at which the sale of the region starts (before the lead-in factor is applied).
+    start_price: float
+    # The price paid for renewing a core in the region.
+    renewal_price: float
+    # The sellout price at the end of the region.
+    sellout_price: Optional[float]
+
+
+class RegionCurve(NamedTuple):
+    """
+    The outcome of a single region of the simulation together with its per-block price curve.
+    """
+
+    result: RegionResult
+    # The blocks of the region, see `region_blocks`. Read-only.
+    blocks: np.ndarray
+    # The price at every block of `blocks`. Read-only.
+    prices: np.ndarray
+
+
+def region_offsets(config):
+    """
+    The offsets from the region start of `region_blocks`, the same in every region.
+
+    :param config: The configuration object.
+    :return: NumPy array of offsets.
+    """
+    return np.linspace(0, config.region_length, config.region_length)
+
+
+def region_blocks(config, region_start):
+    """
+    The blocks at which the price curve of a region is evaluated.
+
+    :param config: The configuration object.
+    :param region_start: The starting block of the region.
+    :return: NumPy array of blocks.
+    """
+    return region_start + region_offsets(config)
+
+
+def renewal_offset(config):
+    """
+    The offset from the region start of the last block of `region_blocks` that falls into the interlude period.
+    This is the block whose renewal price ends up as the new buy price of the region.
+
+    :param config: The configuration object.
+    :return: The offset, or None if no block falls into the interlude period.
+    """
+    region_length = config.region_length
+    interlude_length = config.interlude_length
+    if region_length < 1 or interlude_length <= 0:
+        return None
+    if region_length == 1:
+        return 0
+
+    if region_length < interlude_length:
+        # The whole region, including its last block, is in the interlude period.
+        return region_length
+
+    # Same spacing as `np.linspace`, whose last block is exactly the region end.
+    step = region_length / (region_length - 1)
+    i = min(math.ceil(interlude_length / step) - 1, region_length - 2)
+    while i + 1 <= region_length - 2 and (i + 1) * step < interlude_length:
+        i += 1
+    while i > 0 and i * step >= interlude_length:
+        i -= 1
+    return i * step
+
+
+class RegionEngine:
+    """
+    Steps the state of a `CalculatePrice` object from one region to the next, by default without evaluating the per-block price curve.
+    The state after each step is the same as after evaluating every block of `region_blocks` with `calculate_price`,
+    followed by `update_renewal_price` and `rotate_sale`.
+    """
+
+    def __init__(self, price_calculator, sale_start=SALE_START):
+        self.price_calculator = price_calculator
+        self.sale_start = sale_start
+
+    def step(self, region_i, renewed_cores, sold_cores):
+        """
+        Move the state forward by one region.
+
+        :param region_i: The index of the region, starting at 0.
+        :param renewed_cores: The number of cores sold in renewal.
+        :param sold_cores: The number of cores sold in the sale.
+        :return: The `RegionResult` of the region.
+        """
+        calculator = self.price_calculator
+        config = calculator.config
+        region_start = self.sale_start + region_i * config.region_length
+
+        # Only the last renewal block leaves its price behind (as the new buy price),
+        # while every block updates the sellout price the same way.
+        offset = renewal_offset(config)
+        if offset is None:
+            offset = config.region_length
+        if config.region_length >= 1:
+            calculator.calculate_price(region_start, region_start + offset)
+
+        start_price = calculator.price
+        sellout_price = calculator.sellout_price
+
+        # Recalculate the price of renewal of the core
+        calculator.update_renewal_price()
+        renewal_price = calculator.initial_bought_price
+
+        # Recalculate the price at the end of the region
+        calculator.rotate_sale(renewed_cores, sold_cores)
+
+        return RegionResult(
+            region=region_i + 1,
+            region_start=region_start,
+            start_price=start_price,
+            renewal_price=renewal_price,
+            sellout_price=sellout_price,
+        )
+
+    def step_curve(self, region_i, renewed_cores, sold_cores):
+        """
+        Move the state forward by one region, evaluating the price at every block of `region_blocks` on the way.
+
+        :param region_i: The index of the region, starting at 0.
+        :param renewed_cores: The number of cores sold in renewal.
+        :param sold_cores: The number of cores sold in the sale.
+        :return: The `RegionCurve` of the region.
+        """
+        calculator = self.price_calculator
+        config = calculator.config
+        region_start = self.sale_start + region_i * config.region_length
+
+        blocks, prices = calculator.calculate_region_curve(region_start)
+        blocks.flags.writeable = False
+        prices.flags.writeable = False
+
+        start_price = calculator.price
+        sellout_price = calculator.sellout_price
+
+        # Recalculate the price of renewal of the core
+        calculator.update_renewal_price()
+        renewal_price = calculator.initial_bought_price
+
+        # Recalculate the price at the end of the region
+        calculator.rotate_sale(renewed_cores, sold_cores)
+
+        result = RegionResult(
+            region=region_i + 1,
+            region_start=region_start,
+            start_price=start_price,
+            renewal_price=renewal_price,
+            sellout_price=sellout_price,
+        )
+        return RegionCurve(result, blocks, prices)
+
+    def run(self, region_nb, monthly_renewals, monthly_sales):
+        """
+        Move the state forward by `region_nb` regions.
+
+        :param region_nb: The number of regions to simulate.
+        :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+        :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+        :return: List of `RegionResult`, one per region.
+        """
+        return [
+            self.step(
+                region_i,
+                monthly_renewals.get(region_i + 1, 0),
+                monthly_sales.get(region_i + 1, 0),
+            )
+            for region_i in range(region_nb)
+        ]
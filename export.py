@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from engine import SALE_START, region_blocks
+
+# The phases of a region: renewals in the interlude, the sale price falling through the lead-in and a fixed sale price after it.
+PHASES = ("interlude", "leadin", "fixed")
+
+SCHEMA = pa.schema(
+    [
+        ("region", pa.int32()),
+        ("block", pa.float64()),
+        ("phase", pa.dictionary(pa.int8(), pa.string())),
+        ("price", pa.float64()),
+        ("renewal_cap", pa.float64()),
+        ("sellout_price", pa.float64()),
+    ]
+)
+
+
+def trace_batches(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    sale_start=SALE_START,
+    batch_rows=65_536,
+):
+    """
+    Simulate `region_nb` regions and yield their per-block prices as Arrow record batches of at most `batch_rows` rows.
+    Regions are evaluated in slices of `batch_rows` blocks, so only one batch is held in memory at a time.
+
+    :param price_calculator: The `CalculatePrice` object to simulate from. It is moved forward by every region.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param sale_start: The first block of the first region.
+    :param batch_rows: The maximum number of rows per batch.
+    :return: Iterator of `pa.RecordBatch` with the schema `SCHEMA`.
+    """
+    config = price_calculator.config
+    phases = pa.array(PHASES)
+    for region_i in range(region_nb):
+        region_start = sale_start + region_i * config.region_length
+        blocks = region_blocks(config, region_start)
+        renewal_cap = price_calculator.initial_bought_price * (1 + config.renewal_bump)
+
+        for start in range(0, len(blocks), batch_rows):
+            batch_blocks = blocks[start:start + batch_rows]
+            prices = price_calculator.calculate_region_prices(region_start, batch_blocks)
+            offsets = batch_blocks - region_start
+            phase = np.where(
+                offsets < config.interlude_length,
+                0,
+                np.where(offsets < config.interlude_length + config.leadin_length, 1, 2),
+            ).astype(np.int8)
+            sellout_price = price_calculator.sellout_price
+            size = len(batch_blocks)
+
+            yield pa.RecordBatch.from_arrays(
+                [
+                    pa.array(np.full(size, region_i + 1, dtype=np.int32)),
+                    pa.array(batch_blocks),
+                    pa.DictionaryArray.from_arrays(pa.array(phase), phases),
+                    pa.array(prices),
+                    pa.array(np.full(size, renewal_cap, dtype=float)),
+                    pa.array(
+                        np.full(size, np.nan if sellout_price is None else sellout_price),
+                        from_pandas=True,
+                    ),
+                ],
+                schema=SCHEMA,
+            )
+
+        # Recalculate the price of renewal of the core
+        price_calculator.update_renewal_price()
+        # Recalculate the price at the end of each region
+        price_calculator.rotate_sale(
+            monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0)
+        )
+
+
+def export_trace(
+    path,
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    sale_start=SALE_START,
+    batch_rows=65_536,
+    max_rows_per_file=4_194_304,
+):
+    """
+    Simulate `region_nb` regions and write their per-block prices as a Parquet dataset partitioned by region
+    (`path/region=1/part-0.parquet`, ...). Every batch of `trace_batches` is written as a row group as soon as
+    it is produced, so memory stays bounded however long the trace is.
+
+    :param path: The directory of the dataset. Existing files of the same partitions are overwritten.
+    :param price_calculator: The `CalculatePrice` object to simulate from. It is moved forward by every region.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param sale_start: The first block of the first region.
+    :param batch_rows: The maximum number of rows per record batch and Parquet row group.
+    :param max_rows_per_file: The maximum number of rows per Parquet file.
+    :return: The number of rows written.
+    """
+    # The region is stored in the partition directory names, not in the files.
+    file_schema = SCHEMA.remove(SCHEMA.get_field_index("region"))
+    rows = 0
+    writer, region, file_i, file_rows = None, None, 0, 0
+    try:
+        for batch in trace_batches(
+            price_calculator,
+            region_nb,
+            monthly_renewals,
+            monthly_sales,
+            sale_start=sale_start,
+            batch_rows=batch_rows,
+        ):
+            batch_region = batch.column(0)[0].as_py()
+            if batch_region != region or file_rows + batch.num_rows > max_rows_per_file:
+                if writer is not None:
+                    writer.close()
+                file_i = file_i + 1 if batch_region == region else 0
+                region, file_rows = batch_region, 0
+                directory = os.path.join(path, f"region={region}")
+                os.makedirs(directory, exist_ok=True)
+                if file_i == 0:
+                    for name in os.listdir(directory):
+                        os.remove(os.path.join(directory, name))
+                writer = pq.ParquetWriter(
+                    os.path.join(directory, f"part-{file_i}.parquet"), file_schema
+                )
+            writer.write_batch(
+                pa.RecordBatch.from_arrays(batch.columns[1:], schema=file_schema)
+            )
+            file_rows += batch.num_rows
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
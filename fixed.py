@@ -0,0 +1,465 @@
+"""
+Exact fixed-point counterpart of `batch.BatchCalculatePrice`, with the arithmetic and rounding of the broker pallet.
+
+On chain, prices are integer balances, lead-in factors and adapted prices are `FixedU64` (a fraction of
+`ACCURACY`) and the renewal bump and ideal bulk proportion are `Perbill` (parts of `ACCURACY`):
+- `FixedU64::from_rational` rounds to the nearest value, halves down (`from_rational`),
+- `FixedU64::saturating_mul_int` rounds down (`mul_int`),
+- `Perbill * balance` rounds to the nearest value, halves down (`perbill_mul`).
+
+Values are held in int64 NumPy arrays. The products of a fixed-point value and a balance overflow int64, but
+their quotient by `ACCURACY` is estimated in float64 and corrected from the remainder, which is exact in
+wrapping int64 arithmetic. Larger balances are split into limbs of `ACCURACY`, multiplied and recombined, and
+once a result no longer fits int64, the arrays are turned into object arrays of Python integers, which are exact
+at any size but slower.
+"""
+import numpy as np
+
+from batch import _CONFIG_KEYS, _STATE_KEYS, BatchRegionResult, _ConfigView, _schedule
+from engine import renewal_offset
+
+# The denominator of `FixedU64` and of `Perbill`.
+ACCURACY = 1_000_000_000
+
+# The sellout price of the scenarios without one.
+NO_PRICE = -1
+
+# Products below this bound are computed in int64.
+_NARROW_LIMIT = 2**62
+
+# The adapt factors of batches with per-scenario schedules are tabulated up to this number of cores sold.
+_ADAPT_TABLE_LIMIT = 1 << 20
+
+
+def _int_array(values):
+    array = np.asarray(values)
+    if array.dtype == object:
+        return array
+    return array.astype(np.int64, copy=False)
+
+
+def _wide(array):
+    """
+    The values of an integer array as an object array of Python integers.
+    """
+    array = np.asarray(array)
+    if array.dtype == object:
+        return array
+    return np.array(array.tolist(), dtype=object).reshape(array.shape)
+
+
+def _narrow(*arrays):
+    return all(np.asarray(array).dtype != object for array in arrays)
+
+
+def _divmod(numerator, denominator):
+    # `np.divmod` has no loop for object arrays.
+    if _narrow(numerator, denominator):
+        return np.divmod(numerator, denominator)
+    return numerator // denominator, numerator % denominator
+
+
+def _divmod_accuracy(value):
+    """
+    `np.divmod(value, ACCURACY)` of a non-negative int64 array, several times faster than integer division.
+    The quotient is estimated in float64, which is off by at most 1, and corrected from the exact remainder.
+    """
+    quotient = (value * (1 / ACCURACY)).astype(np.int64)
+    remainder = value - quotient * ACCURACY
+    below = remainder < 0
+    above = remainder >= ACCURACY
+    quotient += above
+    quotient -= below
+    remainder += below * ACCURACY
+    remainder -= above * ACCURACY
+    return quotient, remainder
+
+
+def _max(array):
+    return int(np.max(array)) if np.size(array) else 0
+
+
+def _min(array):
+    return int(np.min(array)) if np.size(array) else 0
+
+
+def to_fixed(value):
+    """
+    The `FixedU64` of a number, rounded to the nearest value.
+    """
+    return _int_array(np.rint(np.asarray(value, dtype=float) * ACCURACY))
+
+
+def to_perbill(value):
+    """
+    The `Perbill` parts of a proportion, rounded to the nearest part.
+    """
+    return _int_array(np.rint(np.asarray(value, dtype=float) * ACCURACY))
+
+
+def from_rational(numerator, denominator):
+    """
+    `FixedU64::from_rational`: the `FixedU64` of `numerator / denominator`, rounded to the nearest value, halves down.
+
+    :param numerator: Non-negative integer or integer array, below 2**63 / `ACCURACY` in int64 arrays.
+    :param denominator: Positive integer or integer array.
+    """
+    numerator = _int_array(numerator)
+    denominator = _int_array(denominator)
+    quotient, remainder = _divmod(numerator * ACCURACY, denominator)
+    return quotient + (2 * remainder > denominator)
+
+
+def _mul_divmod(first, second):
+    """
+    The quotient and remainder of `first * second` divided by `ACCURACY`, for non-negative integer arrays.
+    """
+    first = _int_array(first)
+    second = _int_array(second)
+    if _narrow(first, second):
+        first_max = _max(first)
+        second_max = _max(second)
+        if first_max * second_max < 2**50 * ACCURACY and max(first_max, second_max) < 2**53:
+            # The float64 quotient is off by at most 1, and the remainder of that quotient is small enough to be
+            # exact in int64 even though `first * second` wraps around.
+            estimate = np.multiply(first, second, dtype=float)
+            estimate *= 1 / ACCURACY
+            # The factors are non-negative, so truncating is rounding down.
+            quotient = estimate.astype(np.int64)
+            remainder = first * second
+            remainder -= quotient * ACCURACY
+        elif min(first_max, second_max) < 2**33 and first_max * second_max < _NARROW_LIMIT * ACCURACY:
+            # first * second = first * high * ACCURACY + first * low with second = high * ACCURACY + low,
+            # taking `first` as the smaller factor, so that first * low < 2**33 * ACCURACY fits int64.
+            if first_max > second_max:
+                first, second = second, first
+            high, low = _divmod_accuracy(second)
+            quotient, remainder = _divmod_accuracy(first * low)
+            return first * high + quotient, remainder
+        else:
+            return _divmod(_wide(first) * _wide(second), ACCURACY)
+        above = remainder >= ACCURACY
+        below = remainder < 0
+        quotient += above
+        quotient -= below
+        remainder += below * ACCURACY
+        remainder -= above * ACCURACY
+        return quotient, remainder
+    return _divmod(_wide(first) * _wide(second), ACCURACY)
+
+
+def mul_int(fixed, value):
+    """
+    `FixedU64::saturating_mul_int`: `fixed * value`, rounded down, without saturating.
+
+    :param fixed: `FixedU64` array.
+    :param value: Non-negative integer array, e.g. balances.
+    :return: Integer array, int64 when every result fits and an object array otherwise.
+    """
+    return _mul_divmod(fixed, value)[0]
+
+
+def perbill_mul(parts, value):
+    """
+    `Perbill * value`: the proportion of an integer, rounded to the nearest integer, halves down.
+
+    :param parts: `Perbill` parts array, at most `ACCURACY`.
+    :param value: Non-negative integer array, e.g. balances or numbers of cores.
+    """
+    quotient, remainder = _mul_divmod(parts, value)
+    return quotient + (2 * remainder > ACCURACY)
+
+
+def _fixed_mul(first, second):
+    # `FixedU64` multiplication, rounded to the nearest value, halves down.
+    quotient, remainder = _mul_divmod(first, second)
+    return quotient + (2 * remainder > ACCURACY)
+
+
+def leadin_factor_at(through, linear, factor):
+    """
+    The `FixedU64` lead-in factor, see `poly.Linear.leadin_factor_at` and `poly.Exponential.leadin_factor_at`.
+    The linear factor is exact, the exponential one is a product of `factor` roundings like `FixedU64::saturating_pow`.
+
+    :param through: The `FixedU64` fraction of the lead-in period that has passed, one element per scenario.
+    :param linear: Whether each scenario uses the linear curve.
+    :param factor: The whole factor of each scenario.
+    """
+    through = _int_array(through)
+    linear = np.broadcast_to(np.asarray(linear, dtype=bool), through.shape)
+    factor = np.broadcast_to(np.asarray(factor), through.shape)
+    if np.any(factor != np.floor(factor)):
+        raise ValueError("The fixed-point lead-in factor needs whole factors.")
+    factor = _int_array(factor)
+    linear_factor = ACCURACY + factor * (ACCURACY - through)
+    if linear.all():
+        return linear_factor
+
+    # Every scenario at once, one multiplication per unit of the largest factor. The factors stay int64 unless
+    # they no longer fit, when `_mul_divmod` turns them into Python integers.
+    base = 2 * ACCURACY - through
+    exponential_factor = np.full(through.shape, ACCURACY, dtype=np.int64)
+    for power in range(_max(factor)):
+        exponential_factor = np.where(factor > power, _fixed_mul(exponential_factor, base), exponential_factor)
+    return np.where(linear, linear_factor, exponential_factor)
+
+
+def adapt_price(sold, target, limit):
+    """
+    `Linear::adapt_price` of the pallet as a `FixedU64`, see `poly.Linear.adapt_price`.
+    Like the pallet, a target of 0 cores is taken as 1 core; so is a limit equal to the target.
+    """
+    sold = _int_array(sold)
+    target = _int_array(target)
+    limit = _int_array(limit)
+    below = from_rational(np.maximum(sold, 1), np.maximum(target, 1))
+    above = ACCURACY + from_rational(np.maximum(sold - target, 0), np.maximum(limit - target, 1))
+    return np.where(sold <= target, below, above)
+
+
+class FixedBatchCalculatePrice:
+    """
+    Struct-of-arrays price calculator in exact fixed-point arithmetic, see the module documentation.
+    Prices are integer balances, e.g. in plancks, and the renewal bump and ideal bulk proportion are `Perbill` parts.
+    A missing sellout price is `NO_PRICE` and a missing `limit_cores_offered` or `ideal_bulk_proportion` is 0.
+
+    The regions are stepped like `batch.BatchCalculatePrice.run`, except that the renewal happens at the last whole
+    block of the interlude (the floor of `engine.renewal_offset`), since blocks are whole on chain.
+    Only the linear and exponential lead-in curves are supported.
+    """
+
+    def __init__(
+        self,
+        size,
+        interlude_length,
+        leadin_length,
+        region_length,
+        ideal_bulk_proportion,
+        limit_cores_offered,
+        renewal_bump,
+        linear=False,
+        factor=1,
+        price=1000,
+        initial_bought_price=1000,
+        new_buy_price=1000,
+        sellout_price=NO_PRICE,
+        cores_sold_in_renewal=40,
+        cores_sold_in_sale=6,
+    ):
+        self.size = size
+        # Configuration values, see `Config`. The proportions are `Perbill` parts.
+        self.interlude_length = self.__array(interlude_length)
+        self.leadin_length = self.__array(leadin_length)
+        self.region_length = self.__array(region_length)
+        self.ideal_bulk_proportion = self.__array(ideal_bulk_proportion, none=0)
+        self.limit_cores_offered = self.__array(limit_cores_offered, none=0)
+        self.renewal_bump = self.__array(renewal_bump)
+        # Settings and state, see `CalculatePrice`. Prices are balances.
+        self.linear = self.__array(linear, dtype=bool)
+        self.factor = self.__array(factor)
+        self.price = self.__array(price)
+        self.initial_bought_price = self.__array(initial_bought_price)
+        self.new_buy_price = self.__array(new_buy_price)
+        self.sellout_price = self.__array(sellout_price, none=NO_PRICE)
+        self.cores_sold_in_renewal = self.__array(cores_sold_in_renewal)
+        self.cores_sold_in_sale = self.__array(cores_sold_in_sale)
+        self.cores_sold = self.cores_sold_in_renewal + self.cores_sold_in_sale
+
+        lengths, inverse = np.unique(
+            np.stack([self.interlude_length, self.region_length], axis=1),
+            axis=0,
+            return_inverse=True,
+        )
+        offsets = np.array(
+            [renewal_offset(_ConfigView(*pair)) for pair in lengths.tolist()], dtype=float
+        )
+        # The renewal block of every scenario as a whole number of blocks into the region, -1 without one.
+        self.renewal_block = _int_array(np.floor(np.nan_to_num(offsets[inverse.reshape(-1)], nan=-1)))
+
+    def __array(self, values, dtype=np.int64, none=None):
+        if none is not None:
+            if values is None:
+                values = none
+            elif np.ndim(values):
+                values = [none if value is None else value for value in values]
+        values = np.asarray(values)
+        if dtype is np.int64 and values.dtype == object:
+            # Balances too large for int64 stay Python integers.
+            return np.array(np.broadcast_to(values, (self.size,)), dtype=object)
+        return np.array(np.broadcast_to(values.astype(dtype), (self.size,)))
+
+    @classmethod
+    def from_calculators(cls, price_calculators, unit=1):
+        """
+        Create a batch from the current state of `CalculatePrice` objects, one scenario per object.
+
+        :param price_calculators: List of `CalculatePrice` objects using the linear or exponential curve.
+        :param unit: The balance of a price of 1, e.g. 10**10 plancks per DOT. Prices are rounded to whole balances.
+        """
+        if any(calculator.curve is not None for calculator in price_calculators):
+            raise ValueError("The fixed-point calculator only supports the linear and exponential curves.")
+        config_values = [calculator.config.as_dict() for calculator in price_calculators]
+        values = {key: [config[key] for config in config_values] for key in _CONFIG_KEYS}
+        values.update(
+            {key: [getattr(calculator, key) for calculator in price_calculators] for key in _STATE_KEYS}
+        )
+        return cls(len(price_calculators), **_fixed_values(values, unit))
+
+    @classmethod
+    def from_calculator(cls, price_calculator, size, unit=1):
+        """
+        Create a batch of `size` identical scenarios from the current state of a `CalculatePrice` object.
+        """
+        return cls.from_calculators([price_calculator], unit).take(np.zeros(size, dtype=np.intp))
+
+    def __len__(self):
+        return self.size
+
+    def take(self, indices):
+        """
+        Create a batch from the current state of some scenarios of this batch, which may be repeated.
+
+        :param indices: The indices of the scenarios of the new batch.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        batch = object.__new__(type(self))
+        for name, value in vars(self).items():
+            setattr(batch, name, value[indices] if isinstance(value, np.ndarray) else value)
+        batch.size = len(indices)
+        return batch
+
+    def ideal_cores_sold(self):
+        """
+        The ideal number of cores sold of every scenario, `ideal_bulk_proportion * limit_cores_offered` as on chain.
+        """
+        return perbill_mul(self.ideal_bulk_proportion, self.limit_cores_offered)
+
+    def run(self, region_nb, renewed_cores, sold_cores):
+        """
+        Move every scenario forward by `region_nb` regions, see `batch.BatchCalculatePrice.run`.
+
+        :param region_nb: The number of regions to simulate.
+        :param renewed_cores: The number of cores renewed in each region, either a dictionary keyed by region number
+            starting at 1 or an array of shape (region_nb,) or (region_nb, size).
+        :param sold_cores: The number of cores sold in each region, in the same form as `renewed_cores`.
+        :return: `BatchRegionResult` of integer arrays of shape (region_nb, size), with `NO_PRICE` where no sellout
+            price has been set. The arrays are object arrays once a price no longer fits int64.
+        """
+        renewed_cores = _int_array(_schedule(renewed_cores, region_nb))
+        sold_cores = _int_array(_schedule(sold_cores, region_nb))
+
+        has_renewal = self.renewal_block >= 0
+        leadin_length = np.maximum(self.leadin_length, 1)
+        through = from_rational(np.clip(self.renewal_block, 0, self.leadin_length), leadin_length)
+        renewal_factor = leadin_factor_at(through, self.linear, self.factor)
+        bump = self.renewal_bump
+        evaluated = self.region_length >= 1
+        ideal = self.ideal_cores_sold()
+        offered = self.limit_cores_offered
+        limited = offered != 0
+        all_renewal, all_evaluated, all_limited = has_renewal.all(), evaluated.all(), limited.all()
+        shared_schedule = renewed_cores.ndim == 1 and sold_cores.ndim == 1
+        adapt_factors = {}
+        adapt_table = None
+        if not shared_schedule and self.size and _narrow(ideal, offered, renewed_cores, sold_cores):
+            most_cores = _max(renewed_cores) + _max(sold_cores)
+            uniform = ideal.min() == ideal.max() and offered.min() == offered.max()
+            if uniform and min(_min(renewed_cores), _min(sold_cores)) >= 0 and most_cores < _ADAPT_TABLE_LIMIT:
+                # Every scenario has the same ideal and limit: the factor only depends on the number of cores sold.
+                adapt_table = adapt_price(np.arange(most_cores + 1), ideal[0], offered[0])
+        if renewed_cores.ndim == 1:
+            renewed_cores = renewed_cores.tolist()
+        if sold_cores.ndim == 1:
+            sold_cores = sold_cores.tolist()
+
+        price = self.price
+        initial_bought_price = self.initial_bought_price
+        new_buy_price = self.new_buy_price
+        sellout_price = self.sellout_price
+        cores_sold_in_renewal = self.cores_sold_in_renewal
+        cores_sold_in_sale = self.cores_sold_in_sale
+        results = _Results(region_nb, self.size)
+
+        for region_i in range(region_nb):
+            # `do_renew`: the price is capped at the price paid plus the renewal bump.
+            bumped = perbill_mul(bump, initial_bought_price)
+            if _narrow(initial_bought_price, bumped) and _max(initial_bought_price) + _max(bumped) >= 2**63:
+                # The cap no longer fits int64.
+                initial_bought_price = _wide(initial_bought_price)
+            cap_price = initial_bought_price + bumped
+            renewal_price = np.minimum(cap_price, mul_int(renewal_factor, price))
+            new_buy_price = renewal_price if all_renewal else np.where(has_renewal, renewal_price, new_buy_price)
+            update = ((cores_sold_in_renewal <= ideal) & (cores_sold_in_sale > 0)) | (sellout_price == NO_PRICE)
+            if not all_evaluated:
+                update &= evaluated
+            sellout_price = np.where(update, price, sellout_price)
+            results.set(0, region_i, price)
+            results.set(2, region_i, sellout_price)
+
+            initial_bought_price = np.minimum(cap_price, new_buy_price)
+            results.set(1, region_i, initial_bought_price)
+
+            # `rotate_sale`
+            cores_sold_in_renewal = renewed_cores[region_i]
+            cores_sold_in_sale = sold_cores[region_i]
+            cores_sold = cores_sold_in_renewal + cores_sold_in_sale
+            if shared_schedule:
+                # Only a few numbers of cores sold occur, each with the same factor in every region.
+                if cores_sold not in adapt_factors:
+                    adapt_factors[cores_sold] = adapt_price(cores_sold, ideal, offered)
+                adapt_factor = adapt_factors[cores_sold]
+            elif adapt_table is not None:
+                adapt_factor = adapt_table[cores_sold]
+            else:
+                adapt_factor = adapt_price(cores_sold, ideal, offered)
+            purchase_price = np.where(cores_sold >= ideal, sellout_price, price)
+            adapt = purchase_price != NO_PRICE
+            if not all_limited:
+                adapt &= limited
+            adapted = mul_int(adapt_factor, np.where(adapt, purchase_price, 0))
+            price = np.where(adapt, adapted, price)
+
+        self.price = price
+        self.initial_bought_price = initial_bought_price
+        self.new_buy_price = new_buy_price
+        self.sellout_price = sellout_price
+        if region_nb:
+            self.cores_sold_in_renewal = self.__array(cores_sold_in_renewal)
+            self.cores_sold_in_sale = self.__array(cores_sold_in_sale)
+            self.cores_sold = self.cores_sold_in_renewal + self.cores_sold_in_sale
+        return BatchRegionResult(*results.arrays)
+
+
+def _fixed_values(values, unit):
+    """
+    The arguments of `FixedBatchCalculatePrice` from the float values of `CalculatePrice` objects.
+    """
+    def balance(price):
+        if price is None or price != price:
+            return NO_PRICE
+        return int(round(price * unit))
+
+    def perbill(proportion):
+        return None if proportion is None else int(round(proportion * ACCURACY))
+
+    fixed_values = dict(values)
+    for key in ("ideal_bulk_proportion", "renewal_bump"):
+        fixed_values[key] = [perbill(value) for value in values[key]]
+    for key in ("price", "initial_bought_price", "new_buy_price", "sellout_price"):
+        balances = [balance(value) for value in values[key]]
+        fixed_values[key] = np.array(balances, dtype=object if max(balances, default=0) >= 2**63 else np.int64)
+    return fixed_values
+
+
+class _Results:
+    """
+    The result arrays of `FixedBatchCalculatePrice.run`, int64 until a price no longer fits.
+    """
+
+    def __init__(self, region_nb, size):
+        self.arrays = [np.empty((region_nb, size), dtype=np.int64) for _ in BatchRegionResult._fields]
+
+    def set(self, column, region_i, values):
+        if self.arrays[column].dtype != object and np.asarray(values).dtype == object:
+            self.arrays[column] = self.arrays[column].astype(object)
+        self.arrays[column][region_i] = values
@@ -0,0 +1,312 @@
+"""
+Opt-in timers and counters of the pricing hot paths.
+
+Nothing is measured until `enable` is called: the hot paths are then wrapped with timing code,
+and `disable` puts the original functions back, so there is no overhead at all while disabled.
+
+    import instrument
+
+    with instrument.profile() as metrics:
+        engine.run(region_nb, monthly_renewals, monthly_sales)
+    print(metrics.to_prometheus())
+
+Timers are inclusive: the time of `calculate_price` also counts towards the lead-in factor and sellout price updates it calls.
+
+When several users share one process (the sessions of the web application run in threads of the same server),
+`collect` records only the calls made by the current thread, into metrics of its own:
+
+    with instrument.collect(session_metrics):
+        ...
+"""
+import functools
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, NamedTuple, Optional
+
+
+class HotPath(NamedTuple):
+    """
+    A function that is timed while instrumentation is enabled.
+    """
+
+    # The name of the timer.
+    name: str
+    # The module that defines the function.
+    module: str
+    # The path of the function within the module, e.g. "CalculatePrice.rotate_sale".
+    attribute: str
+    # The counter that is increased by every call, if any.
+    counter: Optional[str] = None
+    # The amount a call increases the counter by, from its return value; 1 by default.
+    count: Optional[Callable[[object], int]] = None
+
+
+HOT_PATHS = (
+    HotPath("calculate_price", "price", "CalculatePrice.calculate_price", "blocks_evaluated"),
+    HotPath(
+        "calculate_region_prices",
+        "price",
+        "CalculatePrice.calculate_region_prices",
+        "blocks_evaluated",
+        lambda prices: prices.size,
+    ),
+    HotPath(
+        "calculate_region_curve",
+        "price",
+        "CalculatePrice.calculate_region_curve",
+        "blocks_evaluated",
+        lambda curve: curve[1].size,
+    ),
+    HotPath("sellout_price_update", "price", "CalculatePrice._CalculatePrice__sellout_price_update"),
+    HotPath("leadin_factor", "curves", "CurveRegistry.leadin_factor"),
+    HotPath("rotate_sale", "price", "CalculatePrice.rotate_sale", "regions_rotated"),
+    HotPath("region_step", "engine", "RegionEngine.step"),
+    HotPath("region_step_curve", "engine", "RegionEngine.step_curve"),
+    HotPath("simulate", "cache", "SimulationCache.simulate"),
+    HotPath("chart_data", "render", "chart_data"),
+)
+
+
+class Metrics:
+    """
+    Per-phase timers (number of calls and total seconds) and counters.
+    """
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def add_time(self, name, seconds):
+        """
+        Record a call of `seconds` to the timer `name`.
+        """
+        with self._lock:
+            calls, total = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (calls + 1, total + seconds)
+
+    def increment(self, name, value=1):
+        """
+        Increase the counter `name` by `value`.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        """
+        :return: Dictionary with the timers, as {"calls": ..., "seconds": ...} per phase, and the counters.
+        """
+        with self._lock:
+            return {
+                "timers": {
+                    name: {"calls": calls, "seconds": seconds}
+                    for name, (calls, seconds) in sorted(self.timers.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2)
+
+    def to_prometheus(self, prefix="coretime_"):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        metrics = self.as_dict()
+        lines = [
+            f"# HELP {prefix}phase_calls_total Number of calls of each instrumented phase.",
+            f"# TYPE {prefix}phase_calls_total counter",
+        ]
+        lines.extend(
+            f'{prefix}phase_calls_total{{phase="{name}"}} {timer["calls"]}'
+            for name, timer in metrics["timers"].items()
+        )
+        lines.extend(
+            [
+                f"# HELP {prefix}phase_seconds_total Time spent in each instrumented phase.",
+                f"# TYPE {prefix}phase_seconds_total counter",
+            ]
+        )
+        lines.extend(
+            f'{prefix}phase_seconds_total{{phase="{name}"}} {timer["seconds"]!r}'
+            for name, timer in metrics["timers"].items()
+        )
+        for name, value in metrics["counters"].items():
+            lines.append(f"# TYPE {prefix}{name}_total counter")
+            lines.append(f"{prefix}{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+# The original functions of the wrapped hot paths, keyed by (owner, attribute name).
+_originals = {}
+# The `Metrics` recorded to while instrumentation is enabled.
+_active = None
+# The number of threads collecting their own metrics, see `collect`.
+_collecting = 0
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def enabled():
+    """
+    Whether the calls of the current thread are measured.
+    """
+    return _target() is not None
+
+
+def _target():
+    """
+    The `Metrics` the current thread records to: its own while in `collect`, otherwise the enabled ones, if any.
+    """
+    metrics = getattr(_local, "metrics", None)
+    return metrics if metrics is not None else _active
+
+
+def _resolve(hot_path):
+    owner = sys.modules[hot_path.module]
+    *path, attribute = hot_path.attribute.split(".")
+    for name in path:
+        owner = getattr(owner, name)
+    return owner, attribute
+
+
+def _wrap(function, hot_path):
+    name, counter, count = hot_path.name, hot_path.counter, hot_path.count
+    perf_counter = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        metrics = _target()
+        if metrics is None:
+            return function(*args, **kwargs)
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            metrics.add_time(name, perf_counter() - start)
+        if counter is not None:
+            metrics.increment(counter, 1 if count is None else count(result))
+        return result
+
+    return wrapper
+
+
+def enable(hot_paths=HOT_PATHS, metrics=METRICS):
+    """
+    Start timing the hot paths. Only the modules imported so far are instrumented,
+    so that enabling the metrics of the command line does not import the app.
+
+    :param hot_paths: The `HotPath`s to time.
+    :param metrics: The `Metrics` to record to.
+    """
+    global _active
+    with _lock:
+        _active = metrics
+        _patch(hot_paths)
+
+
+def disable():
+    """
+    Stop timing the hot paths, restoring the original functions unless a thread is still collecting.
+    The recorded metrics are kept.
+    """
+    global _active
+    with _lock:
+        _active = None
+        if not _collecting:
+            _unpatch()
+
+
+def _patch(hot_paths):
+    for hot_path in hot_paths:
+        if hot_path.module not in sys.modules:
+            continue
+        owner, attribute = _resolve(hot_path)
+        if (owner, attribute) in _originals:
+            continue
+        function = owner.__dict__[attribute]
+        _originals[(owner, attribute)] = function
+        setattr(owner, attribute, _wrap(function, hot_path))
+
+
+def _unpatch():
+    for (owner, attribute), function in _originals.items():
+        setattr(owner, attribute, function)
+    _originals.clear()
+
+
+@contextmanager
+def collect(metrics, hot_paths=HOT_PATHS):
+    """
+    Record the calls made by the current thread to `metrics` for the duration of a block,
+    while the calls of other threads are recorded to their own metrics, or not at all.
+    The hot paths stay wrapped while any thread is collecting or instrumentation is enabled.
+
+    :param metrics: The `Metrics` to record to.
+    :param hot_paths: The `HotPath`s to time.
+    """
+    global _collecting
+    with _lock:
+        _collecting += 1
+        _patch(hot_paths)
+    previous = getattr(_local, "metrics", None)
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+        with _lock:
+            _collecting -= 1
+            if not _collecting and _active is None:
+                _unpatch()
+
+
+@contextmanager
+def timer(name):
+    """
+    Time a block of code as the phase `name`, if instrumentation is enabled.
+    """
+    metrics = _target()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_time(name, time.perf_counter() - start)
+
+
+def increment(name, value=1):
+    """
+    Increase the counter `name` by `value`, if instrumentation is enabled.
+    """
+    metrics = _target()
+    if metrics is not None:
+        metrics.increment(name, value)
+
+
+@contextmanager
+def profile(hot_paths=HOT_PATHS, metrics=METRICS):
+    """
+    Enable instrumentation for the duration of a block, starting from reset metrics.
+
+    :return: The `Metrics` recorded to.
+    """
+    metrics.reset()
+    enable(hot_paths, metrics)
+    try:
+        yield metrics
+    finally:
+        disable()
+
@@ -0,0 +1,288 @@
+"""
+Compiled region loop for many scenarios, with `CalculatePrice` as the reference backend.
+
+`region_kernel` steps every scenario through every region (and, for price curves, every block) with scalar loops
+that follow `CalculatePrice` and `engine.RegionEngine` operation for operation. With the "numba" backend it is
+compiled to native code by Numba, which is only imported if it is installed; with the "python" backend every
+scenario is simulated by its own `CalculatePrice` instead. The backend is chosen per call or process-wide with
+`set_backend`, and defaults to "python": with Numba, the price curves of the exponential lead-in may differ from
+those of `CalculatePrice.calculate_region_prices` in the last bit, where NumPy's vectorized `pow` rounds
+differently from the scalar one.
+"""
+import math
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from batch import _schedule
+from engine import SALE_START, RegionEngine, renewal_offset
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ("python", "numba")
+
+
+class KernelResult(NamedTuple):
+    """
+    The outcome of every region of every scenario, arrays of shape (region_nb, scenarios).
+    """
+
+    start_price: np.ndarray
+    renewal_price: np.ndarray
+    # NaN where no sellout price has been set.
+    sellout_price: np.ndarray
+    # The price at every block of `engine.region_blocks`, of shape (region_nb, scenarios, region_length), or None.
+    prices: Optional[np.ndarray]
+
+
+_backend = None
+_compiled = None
+
+
+def available_backends():
+    """
+    The backends that can be used in this environment.
+    """
+    return [backend for backend in BACKENDS if backend != "numba" or numba is not None]
+
+
+def set_backend(backend):
+    """
+    Select the backend used when none is given, or None for the default "python" backend.
+    """
+    global _backend
+    if backend is not None:
+        _check_backend(backend)
+    _backend = backend
+
+
+def get_backend():
+    """
+    The backend used when none is given.
+    """
+    return "python" if _backend is None else _backend
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}. Use one of {', '.join(BACKENDS)}.")
+    if backend == "numba" and numba is None:
+        raise ValueError("The numba backend needs Numba to be installed.")
+
+
+def _leadin_factor(linear, factor, num, leadin_length):
+    # `poly.Linear.leadin_factor_at` and `poly.Exponential.leadin_factor_at` at `num / leadin_length`.
+    when = num / leadin_length
+    if linear:
+        return 1 + factor * (1 - when)
+    return math.pow(2 - when, factor)
+
+
+if numba is not None:
+    # Compiled once for both backends, so that the compiled kernel can call it.
+    _leadin_factor = numba.njit(cache=True)(_leadin_factor)
+
+
+def region_kernel(
+    sale_start,
+    interlude_length,
+    leadin_length,
+    region_length,
+    ideal,
+    offered,
+    renewal_bump,
+    linear,
+    factor,
+    offset,
+    price,
+    initial_bought_price,
+    new_buy_price,
+    sellout_price,
+    cores_sold_in_renewal,
+    cores_sold_in_sale,
+    renewed_cores,
+    sold_cores,
+    start_prices,
+    renewal_prices,
+    sellout_prices,
+    prices,
+):
+    """
+    Move every scenario forward by `len(renewed_cores)` regions, like `RegionEngine.step` or, when `prices` has
+    one column per block, like `RegionEngine.step_curve`. Scalar loops only, so that Numba can compile it.
+
+    The configuration values (`ideal` and `offered` are the numbers of cores, `offset` the renewal block of
+    `engine.renewal_offset`, or the region length without one) and the state are arrays with one element per
+    scenario; the state arrays are updated in place, with NaN for a missing sellout price. The schedules and the
+    outputs have one row per region, and `prices` is of shape (regions, scenarios, blocks).
+    """
+    for i in range(len(price)):
+        curve = prices.shape[2] == region_length[i] and region_length[i] >= 1
+        cap_factor = 1 + renewal_bump[i]
+        for region_i in range(renewed_cores.shape[0]):
+            region_start = sale_start + region_i * region_length[i]
+            leadin_start = region_start + interlude_length[i]
+            if curve:
+                blocks = prices.shape[2]
+                step = region_length[i] / (blocks - 1) if blocks > 1 else 0.0
+                cap_price = initial_bought_price[i] * cap_factor
+                for j in range(blocks):
+                    # The offsets of `engine.region_offsets`, whose last offset is exactly the region length.
+                    block_offset = j * step
+                    if blocks > 1 and j == blocks - 1:
+                        block_offset = region_length[i]
+                    renewal = block_offset < interlude_length[i]
+                    num = block_offset - (0.0 if renewal else interlude_length[i])
+                    num = min(max(num, 0.0), leadin_length[i])
+                    block_price = _leadin_factor(linear[i], factor[i], num, leadin_length[i]) * price[i]
+                    if renewal:
+                        block_price = min(cap_price, block_price)
+                        new_buy_price[i] = block_price
+                    prices[region_i, i, j] = block_price
+            elif region_length[i] >= 1:
+                # Only the renewal block leaves its price behind, see `RegionEngine.step`.
+                block = region_start + offset[i]
+                if block < leadin_start:
+                    num = min(max(block - region_start, 0.0), leadin_length[i])
+                    sale_price = _leadin_factor(linear[i], factor[i], num, leadin_length[i]) * price[i]
+                    new_buy_price[i] = min(initial_bought_price[i] * cap_factor, sale_price)
+            if region_length[i] >= 1:
+                # `CalculatePrice.__sellout_price_update`
+                if (cores_sold_in_renewal[i] <= ideal[i] and cores_sold_in_sale[i] > 0) or math.isnan(sellout_price[i]):
+                    sellout_price[i] = price[i]
+            start_prices[region_i, i] = price[i]
+            sellout_prices[region_i, i] = sellout_price[i]
+
+            # `CalculatePrice.update_renewal_price`
+            initial_bought_price[i] = min(initial_bought_price[i] * cap_factor, new_buy_price[i])
+            renewal_prices[region_i, i] = initial_bought_price[i]
+
+            # `CalculatePrice.rotate_sale`
+            cores_sold_in_renewal[i] = renewed_cores[region_i, i]
+            cores_sold_in_sale[i] = sold_cores[region_i, i]
+            cores_sold = cores_sold_in_renewal[i] + cores_sold_in_sale[i]
+            if offered[i] != 0:
+                purchase_price = sellout_price[i] if cores_sold >= ideal[i] else price[i]
+                if not math.isnan(purchase_price):
+                    if cores_sold <= ideal[i]:
+                        adapt = max(cores_sold, 1) / ideal[i]
+                    else:
+                        adapt = 1 + (cores_sold - ideal[i]) / (offered[i] - ideal[i])
+                    price[i] = adapt * purchase_price
+
+
+def _compiled_kernel():
+    global _compiled
+    if _compiled is None:
+        _compiled = numba.njit(cache=True)(region_kernel)
+    return _compiled
+
+
+def _python_run(price_calculators, region_nb, renewed, sold, sale_start, curves):
+    size = len(price_calculators)
+    start_prices = np.empty((region_nb, size))
+    renewal_prices = np.empty((region_nb, size))
+    sellout_prices = np.empty((region_nb, size))
+    prices = None
+    for i, calculator in enumerate(price_calculators):
+        engine = RegionEngine(calculator.fork(), sale_start)
+        for region_i in range(region_nb):
+            if curves:
+                region = engine.step_curve(region_i, renewed[region_i, i], sold[region_i, i])
+                if prices is None:
+                    prices = np.empty((region_nb, size, len(region.prices)))
+                prices[region_i, i] = region.prices
+                result = region.result
+            else:
+                result = engine.step(region_i, renewed[region_i, i], sold[region_i, i])
+            start_prices[region_i, i] = result.start_price
+            renewal_prices[region_i, i] = result.renewal_price
+            sellout_prices[region_i, i] = np.nan if result.sellout_price is None else result.sellout_price
+    return KernelResult(start_prices, renewal_prices, sellout_prices, prices)
+
+
+def _kernel_arguments(price_calculators):
+    """
+    The per-scenario arrays of `region_kernel` from the state of `CalculatePrice` objects.
+    """
+    configs = [calculator.config for calculator in price_calculators]
+
+    def column(values, dtype=float):
+        return np.array(list(values), dtype=dtype)
+
+    offered = [config.limit_cores_offered or 0 for config in configs]
+    ideal = [int((config.ideal_bulk_proportion or 0) * cores) for config, cores in zip(configs, offered)]
+    offsets = []
+    for config in configs:
+        offset = renewal_offset(config)
+        offsets.append(config.region_length if offset is None else offset)
+    return [
+        column(config.interlude_length for config in configs),
+        column(config.leadin_length for config in configs),
+        column(config.region_length for config in configs),
+        column(ideal),
+        column(offered),
+        column(config.renewal_bump for config in configs),
+        column((calculator.linear for calculator in price_calculators), dtype=bool),
+        column(calculator.factor for calculator in price_calculators),
+        column(offsets),
+        column(calculator.price for calculator in price_calculators),
+        column(calculator.initial_bought_price for calculator in price_calculators),
+        column(calculator.new_buy_price for calculator in price_calculators),
+        column(np.nan if calculator.sellout_price is None else calculator.sellout_price for calculator in price_calculators),
+        column(calculator.cores_sold_in_renewal for calculator in price_calculators),
+        column(calculator.cores_sold_in_sale for calculator in price_calculators),
+    ]
+
+
+def run(
+    price_calculators,
+    region_nb,
+    renewed_cores,
+    sold_cores,
+    sale_start=SALE_START,
+    curves=False,
+    backend=None,
+):
+    """
+    Simulate `region_nb` regions of every scenario. The price calculators are not modified.
+
+    :param price_calculators: List of `CalculatePrice` objects, one per scenario.
+    :param region_nb: The number of regions to simulate.
+    :param renewed_cores: The number of cores renewed in each region, either a dictionary keyed by region number
+        starting at 1 or an array of shape (region_nb,) or (region_nb, scenarios).
+    :param sold_cores: The number of cores sold in each region, in the same form as `renewed_cores`.
+    :param sale_start: The first block of the first region.
+    :param curves: Also evaluate the price at every block of every region. All scenarios must then have the same
+        region length.
+    :param backend: One of `BACKENDS`, by default `get_backend()`. Scenarios with a curve registered in
+        `curves.CURVES` are always simulated with the "python" backend.
+    :return: The `KernelResult`.
+    """
+    backend = get_backend() if backend is None else backend
+    _check_backend(backend)
+    size = len(price_calculators)
+    renewed = np.broadcast_to(_schedule(renewed_cores, region_nb).reshape(region_nb, -1), (region_nb, size))
+    sold = np.broadcast_to(_schedule(sold_cores, region_nb).reshape(region_nb, -1), (region_nb, size))
+    region_lengths = {calculator.config.region_length for calculator in price_calculators}
+    if curves and len(region_lengths) > 1:
+        raise ValueError("All scenarios must have the same region length to evaluate their price curves.")
+
+    if backend == "python" or any(calculator.curve is not None for calculator in price_calculators):
+        return _python_run(price_calculators, region_nb, renewed, sold, sale_start, curves)
+
+    blocks = int(region_lengths.pop()) if curves and size else 0
+    outputs = [np.empty((region_nb, size)) for _ in range(3)]
+    prices = np.empty((region_nb, size, blocks))
+    _compiled_kernel()(
+        float(sale_start),
+        *_kernel_arguments(price_calculators),
+        np.ascontiguousarray(renewed, dtype=float),
+        np.ascontiguousarray(sold, dtype=float),
+        *outputs,
+        prices,
+    )
+    return KernelResult(*outputs, prices if curves else None)
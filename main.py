@@ -1,9 +1,7 @@
 from config import Config
-from price import CalculatePrice
 from streamlitapp import StreamlitApp
 
 BLOCKS_PER_DAY = 5
-SALE_START = 0
 
 def main():
     # Initial configuration
@@ -15,8 +13,7 @@ def main():
         limit_cores_offered=50,
         renewal_bump=0.05,
     )
-    price_calculator = CalculatePrice(config)
-    app = StreamlitApp(config, price_calculator)
+    app = StreamlitApp(config)
 
     # Plotting and displaying results
     app.run()
@@ -0,0 +1,215 @@
+"""
+Event-driven market of buyer agents.
+
+Instead of assuming that every core is bought at the lowest price of the sale (as `CalculatePrice` does), each
+agent renews or buys at a block of its own choosing, as an event on a heap ordered by block. An agent holding
+a core renews it during the interlude if the renewal price is within its renewal budget, and otherwise looks
+for a core in the sale like the agents without one: it waits until it arrives at the sale and the price has
+fallen to its budget, then buys if any core is left. The sellout price and the number of cores sold that
+`rotate_sale` adapts the price to come from the purchases that actually happened.
+
+The work is proportional to the number of events, at most one renewal and one purchase per agent and region,
+never to the number of blocks.
+"""
+import heapq
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from curves import CURVES
+from engine import SALE_START
+
+# Event kinds, in the order in which events of the same block are handled.
+RENEW = 0
+BUY = 1
+REGION_END = 2
+
+
+class Agents:
+    """
+    The population of buyer agents, one element per agent in every array.
+
+    :param budget: The highest price an agent pays for a core in the sale.
+    :param renewal_budget: The highest price an agent pays to renew its core.
+    :param arrival: When an agent starts looking for a core, as a fraction of the sale period, rounded up to a whole block.
+    :param renew_at: When an agent renews, as a fraction of the interlude, rounded down to a whole block.
+    :param holding: Whether an agent holds a core before the first region.
+    :param paid: The price paid for the core held, which caps its renewal price.
+    """
+
+    def __init__(self, budget, renewal_budget, arrival, renew_at, holding=None, paid=None):
+        self.budget = np.asarray(budget, dtype=float)
+        size = len(self.budget)
+        self.renewal_budget = np.asarray(renewal_budget, dtype=float)
+        self.arrival = np.asarray(arrival, dtype=float)
+        self.renew_at = np.asarray(renew_at, dtype=float)
+        self.holding = np.zeros(size, dtype=bool) if holding is None else np.array(holding, dtype=bool)
+        self.paid = np.zeros(size) if paid is None else np.array(paid, dtype=float)
+
+    def __len__(self):
+        return len(self.budget)
+
+    @classmethod
+    def random(cls, size, rng, budget=(500, 3000), renewal_premium=(1.0, 1.5), holding=0, paid=1000):
+        """
+        Agents with budgets uniform in `budget`, renewal budgets a uniform multiple of their budget and uniform
+        arrival and renewal times.
+
+        :param size: The number of agents.
+        :param rng: The `np.random.Generator` to draw from.
+        :param holding: The number of agents holding a core before the first region.
+        :param paid: The price paid for the cores held before the first region.
+        """
+        budgets = rng.uniform(*budget, size)
+        return cls(
+            budget=budgets,
+            renewal_budget=budgets * rng.uniform(*renewal_premium, size),
+            arrival=rng.uniform(0, 1, size),
+            renew_at=rng.uniform(0, 1, size),
+            holding=np.arange(size) < holding,
+            paid=np.full(size, float(paid)),
+        )
+
+
+class MarketRegion(NamedTuple):
+    """
+    The outcome of a single region of the market.
+    """
+
+    # The number of the region, starting at 1.
+    region: int
+    # The price at which the sale of the region starts.
+    start_price: float
+    # The number of cores renewed and bought.
+    renewals: int
+    sales: int
+    # The number of agents that were ready to buy after the sale sold out.
+    missed: int
+    # The price of the purchase that reached the ideal number of cores sold, if any.
+    sellout_price: Optional[float]
+    # The total price paid for renewals and purchases.
+    revenue: float
+    # The number of events handled in the region.
+    events: int
+
+
+class MarketEngine:
+    """
+    Runs the agents' renewals and purchases as events, and rotates the sale of the `CalculatePrice` object at the
+    end of every region from the cores actually renewed and sold.
+    The lead-in curve is assumed not to increase, like the linear and exponential curves: agents schedule
+    their purchase at the first block at which the running minimum of the price is within their budget.
+    """
+
+    def __init__(self, price_calculator, agents, sale_start=SALE_START):
+        self.price_calculator = price_calculator
+        self.agents = agents
+        self.sale_start = sale_start
+
+    def __purchase_offset(self, price, descending, budget, arrival_offset):
+        """
+        The offsets from the sale start at which the agents can afford a core, or -1.
+
+        :param descending: The negated running minimum of the lead-in factor table.
+        """
+        config = self.price_calculator.config
+        sale_length = config.region_length - config.interlude_length
+        # The first whole block into the lead-in at which the price is within budget, the end factor holding after it.
+        if price > 0:
+            first = np.searchsorted(descending, -budget / price, side="left")
+        else:
+            first = np.zeros(np.shape(budget), dtype=np.intp)
+        offset = np.maximum(np.ceil(arrival_offset), first)
+        return np.where((first < len(descending)) & (offset <= sale_length), offset, -1)
+
+    def run(self, region_nb):
+        """
+        Run the market for `region_nb` regions.
+
+        :param region_nb: The number of regions to simulate.
+        :return: List of `MarketRegion`, one per region.
+        """
+        calculator = self.price_calculator
+        config = calculator.config
+        agents = self.agents
+        interlude_length = config.interlude_length
+        sale_length = config.region_length - interlude_length
+        offered = config.limit_cores_offered if config.limit_cores_offered is not None else 0
+        ideal = int((config.ideal_bulk_proportion or 0) * offered)
+        table = CURVES.table(calculator.get_curve(), calculator.factor, config.leadin_length)
+        descending = -np.minimum.accumulate(table)
+
+        events = [(self.sale_start, REGION_END, -1)]
+        results = []
+        region_i = -1
+        while events:
+            block, kind, agent = heapq.heappop(events)
+
+            if kind == REGION_END:
+                if region_i >= 0:
+                    # Adapt the price to the cores actually renewed and sold.
+                    calculator.rotate_sale(renewed, sold)
+                    results.append(
+                        MarketRegion(region_i + 1, start_price, renewed, sold, missed, calculator.sellout_price,
+                                     revenue, handled)
+                    )
+                region_i += 1
+                if region_i == region_nb:
+                    break
+                region_start = self.sale_start + region_i * config.region_length
+                start_price = calculator.price
+                calculator.sellout_price = None
+                renewed = sold = missed = handled = 0
+                revenue = 0.0
+
+                holders = np.flatnonzero(agents.holding)
+                seekers = np.flatnonzero(~agents.holding)
+                agents.holding[:] = False
+                offsets = self.__purchase_offset(
+                    start_price, descending, agents.budget[seekers], agents.arrival[seekers] * sale_length
+                )
+                buying = offsets >= 0
+                new_events = [
+                    (region_start + interlude_length + offset, BUY, i)
+                    for offset, i in zip(offsets[buying].tolist(), seekers[buying].tolist())
+                ]
+                new_events.extend(
+                    (region_start + offset, RENEW, i)
+                    for offset, i in zip(
+                        np.floor(agents.renew_at[holders] * interlude_length).tolist(), holders.tolist()
+                    )
+                )
+                new_events.append((region_start + config.region_length, REGION_END, -1))
+                events.extend(new_events)
+                heapq.heapify(events)
+                continue
+
+            handled += 1
+            if kind == RENEW:
+                price = calculator.quote_price(region_start, block, bought_price=agents.paid[agent])
+                if price <= agents.renewal_budget[agent] and renewed < offered:
+                    agents.holding[agent] = True
+                    agents.paid[agent] = price
+                    renewed += 1
+                    revenue += price
+                else:
+                    # Look for a core in the sale instead.
+                    offset = self.__purchase_offset(
+                        start_price, descending, agents.budget[agent], agents.arrival[agent] * sale_length
+                    )
+                    if offset >= 0:
+                        heapq.heappush(events, (region_start + interlude_length + float(offset), BUY, agent))
+            else:
+                price = calculator.quote_price(region_start, block)
+                if price > agents.budget[agent]:
+                    continue
+                if renewed + sold >= offered:
+                    missed += 1
+                    continue
+                agents.holding[agent] = True
+                agents.paid[agent] = price
+                sold += 1
+                revenue += price
+                if calculator.sellout_price is None and renewed + sold >= ideal:
+                    calculator.sellout_price = price
+        return results
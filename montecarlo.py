@@ -0,0 +1,310 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from batch import BatchCalculatePrice
+
+METRICS = ("start_price", "renewal_price", "sellout_price")
+
+# The number of consecutive paths that draw from the same random stream. Chunks hold whole streams, so that the
+# results of a seed do not depend on the chunk size.
+STREAM_PATHS = 1024
+
+
+class PriceElasticDemand:
+    """
+    Stochastic demand for renewals and new purchases that reacts to the current prices.
+
+    The number of renewals and purchases in a region are Poisson distributed around the expected
+    numbers, scaled by a constant price elasticity relative to a reference price:
+    `expected * (price / reference_price) ** -elasticity`.
+    Renewals react to the renewal price cap and purchases to the start price of the sale.
+    Draws are clipped so that no more cores than `limit_cores_offered` are renewed and sold.
+    """
+
+    def __init__(
+        self,
+        renewals,
+        sales,
+        reference_price=1000,
+        renewal_elasticity=0.0,
+        sale_elasticity=1.0,
+    ):
+        # The expected number of cores renewed and sold at the reference price.
+        self.renewals = renewals
+        self.sales = sales
+        self.reference_price = reference_price
+        self.renewal_elasticity = renewal_elasticity
+        self.sale_elasticity = sale_elasticity
+
+    def __expected(self, expected, price, elasticity):
+        relative_price = np.maximum(price, 0) / self.reference_price
+        with np.errstate(divide="ignore"):
+            return expected * np.power(relative_price, -elasticity)
+
+    def sample(self, rng, batch):
+        """
+        Draw the number of cores renewed and sold in the coming region of every path.
+
+        :param rng: The `np.random.Generator` of the paths.
+        :param batch: The `BatchCalculatePrice` holding the state of the paths.
+        :return: Tuple of arrays (renewed cores, sold cores), one element per path.
+        """
+        renewal_price = batch.initial_bought_price * (1 + batch.renewal_bump)
+        renewed = rng.poisson(
+            np.minimum(self.__expected(self.renewals, renewal_price, self.renewal_elasticity), 1e9)
+        )
+        sold = rng.poisson(
+            np.minimum(self.__expected(self.sales, batch.price, self.sale_elasticity), 1e9)
+        )
+
+        offered = batch.limit_cores_offered
+        limited = offered > 0
+        renewed = np.where(limited, np.minimum(renewed, offered), renewed)
+        sold = np.where(limited, np.minimum(sold, offered - renewed), sold)
+        return renewed, sold
+
+
+class RegionAggregator:
+    """
+    Fixed-memory online aggregator of per-region statistics over many simulation paths.
+
+    For every region and metric it keeps the count, sum, sum of squares, minimum, maximum and a
+    histogram with logarithmically spaced buckets. Quantiles read from the histogram have a relative
+    error of at most `relative_accuracy` for values between `min_value` and `max_value`; smaller
+    values are counted in a bucket at zero and larger values in a bucket at `max_value`.
+    Memory does not depend on the number of paths, and aggregators of the same shape can be merged.
+    """
+
+    def __init__(
+        self,
+        region_nb,
+        metrics=METRICS,
+        relative_accuracy=0.01,
+        min_value=1e-3,
+        max_value=1e12,
+    ):
+        self.region_nb = region_nb
+        self.metrics = tuple(metrics)
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_index = math.floor(math.log(min_value) / self.log_gamma)
+        # Bucket 0 holds the values below `min_value`, the last bucket the values above `max_value`.
+        self.bucket_nb = math.ceil(math.log(max_value) / self.log_gamma) - self.min_index + 2
+
+        shape = (region_nb, len(self.metrics))
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape)
+        self.total_squares = np.zeros(shape)
+        self.minimum = np.full(shape, np.inf)
+        self.maximum = np.full(shape, -np.inf)
+        self.histogram = np.zeros(shape + (self.bucket_nb,), dtype=np.int64)
+
+    def __bucket(self, values):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            index = np.ceil(np.log(values) / self.log_gamma) - self.min_index
+        index = np.where(values < self.min_value, 0, index)
+        return np.clip(index, 0, self.bucket_nb - 1).astype(np.int64)
+
+    def __bucket_value(self, index):
+        index = np.asarray(index)
+        value = 2 * np.power(self.gamma, index + self.min_index) / (self.gamma + 1)
+        value = np.where(index == 0, 0.0, value)
+        return np.where(index == self.bucket_nb - 1, self.max_value, value)
+
+    def update(self, region_i, metric, values):
+        """
+        Add the values of a metric in a region. NaN values (e.g. a missing sellout price) are skipped.
+
+        :param region_i: The index of the region, starting at 0.
+        :param metric: The name of the metric.
+        :param values: NumPy array of values, one per path.
+        """
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+        metric_i = self.metrics.index(metric)
+        key = (region_i, metric_i)
+        self.count[key] += values.size
+        self.total[key] += values.sum()
+        self.total_squares[key] += np.square(values).sum()
+        self.minimum[key] = min(self.minimum[key], values.min())
+        self.maximum[key] = max(self.maximum[key], values.max())
+        self.histogram[key] += np.bincount(self.__bucket(values), minlength=self.bucket_nb)
+
+    def merge(self, other):
+        """
+        Add the statistics of another aggregator of the same shape.
+        """
+        if (
+            other.histogram.shape != self.histogram.shape
+            or other.metrics != self.metrics
+            or other.gamma != self.gamma
+        ):
+            raise ValueError("Aggregators of different shapes cannot be merged.")
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.histogram += other.histogram
+        return self
+
+    def mean(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.total / self.count
+
+    def std(self):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = self.total_squares / self.count - np.square(self.mean())
+        return np.sqrt(np.maximum(variance, 0))
+
+    def quantile(self, q):
+        """
+        The approximate q-quantile of every region and metric.
+
+        :param q: The quantile, between 0 and 1.
+        :return: Array of shape (region_nb, number of metrics), NaN where there are no values.
+        """
+        cumulative = np.cumsum(self.histogram, axis=-1)
+        rank = np.floor(q * np.maximum(self.count - 1, 0))[..., None]
+        index = np.argmax(cumulative > rank, axis=-1)
+        value = np.clip(self.__bucket_value(index), self.minimum, self.maximum)
+        return np.where(self.count > 0, value, np.nan)
+
+    def tail_mean(self, q):
+        """
+        The approximate mean of the values at or above the q-quantile (the expected shortfall of a price).
+
+        :param q: The quantile, between 0 and 1.
+        :return: Array of shape (region_nb, number of metrics), NaN where there are no values.
+        """
+        threshold = np.floor(q * np.maximum(self.count - 1, 0))[..., None]
+        cumulative = np.cumsum(self.histogram, axis=-1)
+        # Number of values of each bucket that lie at or above the quantile.
+        in_tail = np.clip(cumulative - threshold, 0, self.histogram)
+        values = np.clip(
+            self.__bucket_value(np.arange(self.bucket_nb)),
+            self.minimum[..., None],
+            self.maximum[..., None],
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (in_tail * values).sum(axis=-1) / in_tail.sum(axis=-1)
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95), tail=0.95):
+        """
+        Summarize the statistics as a DataFrame with one row per region and metric.
+
+        :param quantiles: The quantiles to report.
+        :param tail: The quantile above which the tail mean is reported.
+        """
+        region, metric = np.meshgrid(
+            np.arange(1, self.region_nb + 1), np.arange(len(self.metrics)), indexing="ij"
+        )
+        columns = {
+            "region": region.ravel(),
+            "metric": np.array(self.metrics)[metric.ravel()],
+            "count": self.count.ravel(),
+            "mean": self.mean().ravel(),
+            "std": self.std().ravel(),
+            "min": np.where(self.count > 0, self.minimum, np.nan).ravel(),
+            "max": np.where(self.count > 0, self.maximum, np.nan).ravel(),
+        }
+        for q in quantiles:
+            columns[f"q{q * 100:g}"] = self.quantile(q).ravel()
+        columns[f"tail_mean{tail * 100:g}"] = self.tail_mean(tail).ravel()
+        return pd.DataFrame(columns)
+
+
+def simulate_chunk(
+    chunk_i, price_calculator, demand, region_nb, chunk_size, path_nb, seed, aggregator_options
+):
+    """
+    Simulate one chunk of paths and aggregate their results.
+    Every `STREAM_PATHS` consecutive paths draw from their own random stream, derived from `seed` and the index
+    of their first path like `np.random.SeedSequence(seed).spawn`, so the results depend neither on which process
+    runs the chunk nor on the chunk size, a multiple of `STREAM_PATHS`.
+
+    :return: The `RegionAggregator` of the chunk.
+    """
+    first_path = chunk_i * chunk_size
+    size = min(chunk_size, path_nb - first_path)
+    starts = range(0, size, STREAM_PATHS)
+    rngs = [
+        np.random.default_rng(np.random.SeedSequence(seed, spawn_key=((first_path + start) // STREAM_PATHS,)))
+        for start in starts
+    ]
+    batch = BatchCalculatePrice.from_calculator(price_calculator, size)
+    aggregator = RegionAggregator(region_nb, **aggregator_options)
+
+    for region_i in range(region_nb):
+        if len(rngs) == 1:
+            renewed, sold = demand.sample(rngs[0], batch)
+        else:
+            renewed, sold = np.empty(size, dtype=np.int64), np.empty(size, dtype=np.int64)
+            for start, rng in zip(starts, rngs):
+                paths = np.arange(start, min(start + STREAM_PATHS, size))
+                renewed[paths], sold[paths] = demand.sample(rng, batch.take(paths))
+        result = batch.step_region(renewed, sold)
+        for metric in aggregator.metrics:
+            aggregator.update(region_i, metric, getattr(result, metric))
+    return aggregator
+
+
+def run_monte_carlo(
+    price_calculator,
+    demand,
+    region_nb,
+    path_nb,
+    seed=0,
+    chunk_size=10_000,
+    max_workers=1,
+    **aggregator_options,
+):
+    """
+    Simulate `path_nb` paths of `region_nb` regions with stochastic demand, starting from the state of `price_calculator`.
+
+    Paths are simulated in chunks of `chunk_size` with `BatchCalculatePrice` and only their aggregated
+    statistics are kept, so memory does not grow with the number of paths.
+
+    :param price_calculator: The `CalculatePrice` object whose state every path starts from.
+    :param demand: The demand model, e.g. `PriceElasticDemand`.
+    :param region_nb: The number of regions to simulate.
+    :param path_nb: The number of paths to simulate.
+    :param seed: The seed of the random streams.
+    :param chunk_size: The number of paths simulated at once, rounded up to a multiple of `STREAM_PATHS`. It does
+        not change the results.
+    :param max_workers: The number of worker processes. With 1 the paths are simulated in the current process.
+    :param aggregator_options: Keyword arguments for `RegionAggregator`.
+    :return: The `RegionAggregator` with the statistics of all paths.
+    """
+    chunk_size = max(math.ceil(chunk_size / STREAM_PATHS), 1) * STREAM_PATHS
+    chunk_nb = math.ceil(path_nb / chunk_size)
+    worker = partial(
+        simulate_chunk,
+        price_calculator=price_calculator,
+        demand=demand,
+        region_nb=region_nb,
+        chunk_size=chunk_size,
+        path_nb=path_nb,
+        seed=seed,
+        aggregator_options=aggregator_options,
+    )
+
+    aggregator = RegionAggregator(region_nb, **aggregator_options)
+    if max_workers == 1:
+        for chunk_i in range(chunk_nb):
+            aggregator.merge(worker(chunk_i))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for chunk_aggregator in executor.map(worker, range(chunk_nb)):
+                aggregator.merge(chunk_aggregator)
+    return aggregator
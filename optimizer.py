@@ -0,0 +1,199 @@
+"""
+Minimum-cost renew-or-buy policy of a single buyer over a horizon of regions.
+
+The market (the start price of every sale) follows the simulation of a `CalculatePrice` object and a
+renewal/sales schedule; the buyer is a price taker. Each region the buyer either
+- renews the core held in the previous region during the interlude, paying `renewal_price(p, t)`:
+  the sale price at block t capped at `p * (1 + renewal_bump)`, where p is the price paid last,
+- buys a core in the sale, paying the lead-in price at the block of purchase,
+- or, in a region where no core is needed, goes without and loses the right to renew.
+
+Renewing in a region where no core is needed keeps the renewal cap, which may be cheaper than buying again
+later, so the decision is taken over the whole horizon by dynamic programming. The states of a stage are
+the Pareto frontier of (total cost, price paid last) pairs of the buyer holding a core, plus the cheapest
+way of not holding one.
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from curves import CURVES
+from engine import SALE_START, RegionEngine, renewal_offset
+
+RENEW = "renew"
+BUY = "buy"
+SKIP = "skip"
+
+
+class Decision(NamedTuple):
+    """
+    The decision of the buyer in one region.
+    """
+
+    # The number of the region, starting at 1.
+    region: int
+    # One of RENEW, BUY or SKIP.
+    action: str
+    # The block of the renewal or purchase, None when skipping.
+    block: Optional[float]
+    # The price paid, 0 when skipping.
+    price: float
+
+
+class Policy(NamedTuple):
+    """
+    The minimum-cost policy over the horizon.
+    """
+
+    # The total price paid.
+    cost: float
+    decisions: tuple
+
+
+def market_prices(price_calculator, region_nb, monthly_renewals, monthly_sales, sale_start=SALE_START):
+    """
+    The start price of the sale of every region, simulated on a fork of `price_calculator`.
+
+    :return: NumPy array of `region_nb` prices.
+    """
+    engine = RegionEngine(price_calculator.fork(), sale_start)
+    return np.array(
+        [result.start_price for result in engine.run(region_nb, monthly_renewals, monthly_sales)],
+        dtype=float,
+    )
+
+
+def _pareto(costs, paid):
+    """
+    The indices of the (cost, paid) pairs that no other pair beats in both, sorted by paid price.
+    """
+    order = np.lexsort((costs, paid))
+    if len(order) == 0:
+        return order
+    best = np.minimum.accumulate(costs[order])
+    keep = np.empty(len(order), dtype=bool)
+    keep[0] = True
+    keep[1:] = costs[order][1:] < best[:-1]
+    return order[keep]
+
+
+def optimize_purchases(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    needed=None,
+    sellout=None,
+    time_steps=64,
+    holding=True,
+    sale_start=SALE_START,
+):
+    """
+    Compute the minimum-cost renew-or-buy policy over `region_nb` regions.
+
+    :param price_calculator: The `CalculatePrice` object the market is simulated from. It is not modified.
+        Its `initial_bought_price` is the price the buyer paid for the core held before the first region.
+    :param region_nb: The number of regions.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param needed: Whether the buyer needs a core in each region, keyed by region number; needed if missing.
+    :param sellout: The fraction of the sale period (from the end of the interlude to the end of the region)
+        after which the sale of a region is sold out, keyed by region number; never sold out if missing.
+    :param time_steps: The number of renewal and purchase times considered in each region.
+    :param holding: Whether the buyer holds a core before the first region.
+    :param sale_start: The first block of the first region.
+    :return: The `Policy`.
+    """
+    config = price_calculator.config
+    needed = needed or {}
+    sellout = sellout or {}
+    prices = market_prices(price_calculator, region_nb, monthly_renewals, monthly_sales, sale_start)
+
+    # Lead-in factors at the renewal times (during the interlude, relative to the region start as in
+    # `CalculatePrice.calculate_price`) and at the purchase times (during the sale period).
+    leadin_length = config.leadin_length
+    interlude_length = config.interlude_length
+    curve = price_calculator.get_curve()
+    renewal_offsets = np.linspace(0, interlude_length, time_steps, endpoint=False)
+    sale_offsets = np.linspace(interlude_length, config.region_length, time_steps)
+    renewal_factors = CURVES.leadin_factor(
+        curve, price_calculator.factor, leadin_length, np.clip(renewal_offsets, 0, leadin_length)
+    )
+    sale_factors = CURVES.leadin_factor(
+        curve, price_calculator.factor, leadin_length, np.clip(sale_offsets - interlude_length, 0, leadin_length)
+    )
+    sale_fractions = np.linspace(0, 1, time_steps)
+    bump = 1 + config.renewal_bump
+    # Without an interlude there is no time to renew at, and every core is bought in the sale.
+    can_renew = renewal_offset(config) is not None
+
+    # The frontier of holding states: their total cost and the price paid last; and the cost of holding no core.
+    costs = np.array([0.0]) if holding else np.empty(0)
+    paid = np.array([float(price_calculator.initial_bought_price)]) if holding else np.empty(0)
+    none_cost = np.inf if holding else 0.0
+    # Per stage: the (parent, action, block, price) of every frontier state, and the parent of the none state.
+    # Parents are indices into the frontier of the previous stage, or -1 for its none state.
+    stages = []
+
+    for region_i in range(region_nb):
+        region = region_i + 1
+        region_start = sale_start + region_i * config.region_length
+        price = prices[region_i]
+
+        # Renew: every holding state at every renewal time, (F, T).
+        renewal = np.minimum(paid[:, None] * bump, renewal_factors[None, :] * price)
+        renewal_t = renewal.argmin(axis=1) if len(paid) else np.empty(0, dtype=np.intp)
+        renewal_price = renewal[np.arange(len(paid)), renewal_t]
+        if not can_renew:
+            renewal_price = np.full(len(paid), np.inf)
+
+        # Buy: the cheapest purchase time before the sellout, from the cheapest state.
+        available = sale_fractions < sellout.get(region, np.inf)
+        purchase_prices = np.where(available, sale_factors * price, np.inf)
+        buy_t = int(purchase_prices.argmin())
+        buy_price = purchase_prices[buy_t]
+        best_i = int(costs.argmin()) if len(costs) else -1
+        best_cost = costs[best_i] if len(costs) else np.inf
+        from_none = none_cost <= best_cost
+        buy_from_cost = min(best_cost, none_cost)
+
+        candidate_costs = np.append(costs + renewal_price, buy_from_cost + buy_price)
+        candidate_paid = np.append(renewal_price, buy_price)
+        # (parent frontier index or -1 for the none state, action, block, price)
+        candidates = [
+            (i, RENEW, region_start + renewal_offsets[renewal_t[i]], renewal_price[i])
+            for i in range(len(paid))
+        ]
+        candidates.append((-1 if from_none else best_i, BUY, region_start + sale_offsets[buy_t], buy_price))
+
+        finite = np.isfinite(candidate_costs)
+        kept = _pareto(candidate_costs[finite], candidate_paid[finite])
+        kept = np.flatnonzero(finite)[kept]
+
+        # Skip: only if no core is needed in the region, from the cheapest state.
+        if needed.get(region, True):
+            none = (None, np.inf)
+        else:
+            none = (-1 if from_none else best_i, buy_from_cost)
+
+        stages.append(([candidates[i] for i in kept], none[0]))
+        costs, paid = candidate_costs[kept], candidate_paid[kept]
+        none_cost = none[1]
+
+    best_cost = costs.min() if len(costs) else np.inf
+    if not np.isfinite(min(best_cost, none_cost)):
+        raise ValueError("No policy holds a core in every region where one is needed.")
+
+    # Follow the back-pointers from the cheapest final state.
+    state = -1 if none_cost < best_cost else int(costs.argmin())
+    decisions = []
+    for region_i in range(region_nb - 1, -1, -1):
+        frontier, none_parent = stages[region_i]
+        if state == -1:
+            decisions.append(Decision(region_i + 1, SKIP, None, 0.0))
+            state = none_parent
+        else:
+            parent, action, block, price = frontier[state]
+            decisions.append(Decision(region_i + 1, action, float(block), float(price)))
+            state = parent
+    return Policy(float(min(best_cost, none_cost)), tuple(reversed(decisions)))
@@ -1,9 +1,13 @@
+import numpy as np
+
+
 class Linear:
     @staticmethod
     def leadin_factor_at(when, factor = 1):
         """
         Factor represents the slope of the linear function
         Factor is not a parameter that is originally used in the `broker pallet code`.
+        `when` can be a scalar or a NumPy array, the result has the same shape.
 
         Function follows the code in: https://github.com/paritytech/polkadot-sdk/blob/2610450a18e64079abfe98f0a5b57069bbb61009/substrate/frame/broker/src/adapt_price.rs#L50 
         """
@@ -13,7 +17,22 @@ class Linear:
     def adapt_price(sold, target, limit):
         """
         Function follows the code in: https://github.com/paritytech/polkadot-sdk/blob/2610450a18e64079abfe98f0a5b57069bbb61009/substrate/frame/broker/src/adapt_price.rs#L54C13-L54C13
+        `sold`, `target` and `limit` can also be NumPy arrays, in which case each branch is only evaluated where it applies.
         """
+        if isinstance(sold, np.ndarray) or isinstance(target, np.ndarray) or isinstance(limit, np.ndarray):
+            sold, target, limit = np.broadcast_arrays(
+                np.asarray(sold, dtype=float),
+                np.asarray(target, dtype=float),
+                np.asarray(limit, dtype=float),
+            )
+            below = sold <= target
+            adapted = np.empty(sold.shape)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                np.divide(np.maximum(sold, 1), target, out=adapted, where=below)
+                np.divide(sold - target, limit - target, out=adapted, where=~below)
+            adapted[~below] += 1
+            return adapted
+
         if sold <= target:
             return max(sold, 1) / target
         else:
@@ -29,6 +48,7 @@ class Exponential:
     def leadin_factor_at(when, factor: int = 1):
         # Exponential decay model for the lead-in factor
         # Factor is not a parameter that is originally used in the `broker pallet code`.
+        # `when` can be a scalar or a NumPy array, the result has the same shape.
         return pow(2 - when, factor)
 
     @staticmethod
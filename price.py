@@ -1,4 +1,57 @@
-from poly import Linear, Exponential
+import itertools
+
+import numpy as np
+
+from curves import CURVES
+from engine import SALE_START, RegionEngine, region_offsets
+from poly import Linear
+
+
+class PriceState:
+    """
+    Immutable snapshot of the state of a `CalculatePrice` object, see `CalculatePrice.snapshot`.
+    Snapshots are hashable and compare equal when every value is equal.
+    """
+
+    __slots__ = (
+        "linear",
+        "factor",
+        "curve",
+        "initial_bought_price",
+        "new_buy_price",
+        "sellout_price",
+        "price",
+        "cores_sold_in_renewal",
+        "cores_sold_in_sale",
+        "cores_sold",
+    )
+
+    def __init__(self, **values):
+        for attribute in self.__slots__:
+            object.__setattr__(self, attribute, values[attribute])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PriceState is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("PriceState is immutable.")
+
+    def astuple(self):
+        return tuple(getattr(self, attribute) for attribute in self.__slots__)
+
+    def __eq__(self, other):
+        if not isinstance(other, PriceState):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def __hash__(self):
+        return hash(self.astuple())
+
+    def __repr__(self):
+        values = ", ".join(
+            f"{attribute}={getattr(self, attribute)!r}" for attribute in self.__slots__
+        )
+        return f"PriceState({values})"
 
 
 class CalculatePrice:
@@ -11,6 +64,8 @@ class CalculatePrice:
         # The leadin factor is either linear or exponential depending on the value of self.linear
         self.linear = False
         self.factor = 1
+        # The name of a curve registered in `curves.CURVES` that replaces the linear or exponential curve, if set.
+        self.curve = None
         # price for which the cores were bought - important for renewal
         self.initial_bought_price = 1000
         # price for which the cores will be bought in the next sale
@@ -45,6 +100,24 @@ class CalculatePrice:
         """
         self.linear = linear
 
+    def get_curve(self):
+        """
+        Get the name of the lead-in factor curve in use.
+        """
+        if self.curve is not None:
+            return self.curve
+        return "linear" if self.linear else "exponential"
+
+    def change_curve(self, curve):
+        """
+        Update the lead-in factor curve.
+
+        :param curve: The name of a curve registered in `curves.CURVES`, or None to use the linear or exponential curve.
+        """
+        if curve is not None:
+            CURVES.get(curve)
+        self.curve = curve
+
     def change_factor(self, factor):
         """
         Update the factor. Of the exponential or linear function.
@@ -77,6 +150,39 @@ class CalculatePrice:
         """
         self.config = config
 
+    def snapshot(self):
+        """
+        Take an immutable snapshot of the state, to be restored with `restore`.
+        The configuration object is not part of the snapshot.
+
+        :return: The `PriceState`.
+        """
+        return PriceState(
+            **{attribute: getattr(self, attribute) for attribute in PriceState.__slots__}
+        )
+
+    def restore(self, state):
+        """
+        Restore a state taken with `snapshot`.
+
+        :param state: The `PriceState` to restore.
+        """
+        for attribute in PriceState.__slots__:
+            setattr(self, attribute, getattr(state, attribute))
+
+    def fork(self, state=None):
+        """
+        Create a new price calculator with the same configuration object, starting from the current state or from `state`.
+        The fork and the original can then be moved forward independently, e.g. to branch at a region without
+        replaying the regions before it.
+
+        :param state: The `PriceState` to start from, by default a snapshot of the current state.
+        :return: The new `CalculatePrice`.
+        """
+        forked = CalculatePrice(self.config)
+        forked.restore(self.snapshot() if state is None else state)
+        return forked
+
     def update_renewal_price(self):
         """
         Update the renewal price based on the initial bought price and the new buy price.
@@ -146,15 +252,8 @@ class CalculatePrice:
         num = max(block_now - region_start, 0)
         num = min(num, leadin_length)
 
-        # Calculate through
-        through = num / leadin_length
-
-        # Calculate the lead-in factor (LF). You need to define how LF is calculated based on through.
-        # Choose linear or exponential.
-        if self.linear:
-            LF = Linear.leadin_factor_at(through, factor=self.factor)
-        else:
-            LF = Exponential.leadin_factor_at(through, factor=self.factor)
+        # Calculate the lead-in factor (LF).
+        LF = self.__leadin_factor(num)
 
         # Calculate sale price
         sale_price = LF * self.price
@@ -164,6 +263,36 @@ class CalculatePrice:
 
         return sale_price
 
+    def __leadin_factor(self, num):
+        """
+        Calculate the lead-in factor (LF) `num` blocks into the lead-in period, with the curve of `get_curve`.
+        The factor is looked up in the table of the curve when `num` is a whole number of blocks.
+
+        :param num: The number of blocks into the lead-in period, scalar or NumPy array.
+        :return: The lead-in factor, with the same shape as `num`.
+        """
+        return CURVES.leadin_factor(
+            self.get_curve(), self.factor, self.config.leadin_length, num
+        )
+
+    def __sale_prices_calculate(self, sale_start, blocks):
+        """
+        Vectorized counterpart of `__sale_price_calculate` for an array of blocks.
+
+        :param sale_start: The starting block of the sale, scalar or NumPy array broadcastable to `blocks`.
+        :param blocks: NumPy array of blocks.
+        :return: NumPy array of sale prices.
+        """
+        leadin_length = self.config.leadin_length
+
+        num = np.clip(blocks - sale_start, 0, leadin_length)
+
+        sale_prices = self.__leadin_factor(num) * self.price
+
+        self.__sellout_price_update()
+
+        return sale_prices
+
     def __sellout_price_update(self):
         """
         Update the sellout price until we have sold less than the ideal number
@@ -221,3 +350,122 @@ class CalculatePrice:
             return self.__sale_price_calculate(
                 region_start + self.config.interlude_length, block_now
             )
+
+    def quote_price(self, region_start, block_now, bought_price=None):
+        """
+        The price at a specific block, like `calculate_price`, without updating the new buy price or the sellout price.
+
+        :param region_start: The starting block of the current region.
+        :param block_now: The current block.
+        :param bought_price: The price paid for the core being renewed, which caps the renewal price. Defaults to `initial_bought_price`.
+        :return: The price.
+        """
+        if not region_start <= block_now <= (region_start + self.config.region_length):
+            raise ValueError(
+                "Invalid input: block_now must be greater than or equal to region_start."
+            )
+        leadin_length = self.config.leadin_length
+        if block_now < region_start + self.config.interlude_length:
+            num = min(max(block_now - region_start, 0), leadin_length)
+            if bought_price is None:
+                bought_price = self.initial_bought_price
+            cap_price = bought_price * (1 + self.config.renewal_bump)
+            return min(cap_price, self.__leadin_factor(num) * self.price)
+        num = min(max(block_now - region_start - self.config.interlude_length, 0), leadin_length)
+        return self.__leadin_factor(num) * self.price
+
+    def calculate_region_prices(self, region_start, blocks):
+        """
+        Calculate the prices for a whole region at once, taking into account whether each block is in the renewal period or sale period.
+        Vectorized counterpart of `calculate_price`: the state is left exactly as if `calculate_price` had been called for every block in order.
+
+        :param region_start: The starting block of the current region.
+        :param blocks: NumPy array of blocks, all within the region.
+        :return: NumPy array of the calculated prices.
+        """
+        blocks = np.asarray(blocks)
+        region_end = region_start + self.config.region_length
+        if np.any((blocks < region_start) | (blocks > region_end)):
+            raise ValueError(
+                "Invalid input: blocks must be within the region starting at region_start."
+            )
+        if blocks.size == 0:
+            return np.empty(blocks.shape)
+
+        sale_start = region_start + self.config.interlude_length
+        in_renewal = blocks < sale_start
+
+        prices = self.__sale_prices_calculate(
+            np.where(in_renewal, region_start, sale_start), blocks
+        )
+
+        return self.__cap_renewal_prices(in_renewal, prices)
+
+    def calculate_region_curve(self, region_start):
+        """
+        Calculate the prices at every block of `engine.region_blocks`, like `calculate_region_prices`.
+        These blocks are the same offsets from the start of every region, so their lead-in factors are looked up in
+        a table of the curve that is only computed once per configuration, curve and factor.
+
+        :param region_start: The starting block of the region.
+        :return: Tuple of the NumPy arrays of the blocks and of their prices.
+        """
+        config = self.config
+        offsets = region_offsets(config)
+        blocks = region_start + offsets
+        if blocks.size == 0:
+            return blocks, np.empty(blocks.shape)
+
+        in_renewal = offsets < config.interlude_length
+        factors = CURVES.grid_table(
+            self.get_curve(),
+            self.factor,
+            config.leadin_length,
+            ("region", config.region_length, config.interlude_length),
+            lambda: np.clip(offsets - np.where(in_renewal, 0, config.interlude_length), 0, config.leadin_length),
+        )
+        prices = factors * self.price
+        self.__sellout_price_update()
+
+        return blocks, self.__cap_renewal_prices(in_renewal, prices)
+
+    def __cap_renewal_prices(self, in_renewal, prices):
+        """
+        Cap the prices of the renewal blocks, and set the new buy price to the price of the last one.
+        """
+        if in_renewal.any():
+            cap_price = self.initial_bought_price * (1 + self.config.renewal_bump)
+            prices = np.where(in_renewal, np.minimum(cap_price, prices), prices)
+            self.new_buy_price = float(prices[in_renewal][-1])
+
+        return prices
+
+    def iter_regions(
+        self,
+        monthly_renewals,
+        monthly_sales,
+        region_nb=None,
+        sale_start=SALE_START,
+        curve=False,
+    ):
+        """
+        Simulate region after region, yielding the result of each region as soon as it is computed.
+        Only the current region is held in memory, so the consumer can stop at any region, e.g. once a price crosses a budget.
+        The state is moved forward by every region that is consumed, exactly like `RegionEngine.run`.
+
+        :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+        :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+        :param region_nb: The number of regions to simulate, or None to simulate until the consumer stops.
+        :param sale_start: The first block of the first region.
+        :param curve: Also evaluate the price at every block of the region.
+        :return: Iterator of `engine.RegionResult`, or of `engine.RegionCurve` if `curve` is set.
+        """
+        engine = RegionEngine(self, sale_start)
+        step = engine.step_curve if curve else engine.step
+        regions = itertools.count() if region_nb is None else range(region_nb)
+        for region_i in regions:
+            yield step(
+                region_i,
+                monthly_renewals.get(region_i + 1, 0),
+                monthly_sales.get(region_i + 1, 0),
+            )
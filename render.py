@@ -0,0 +1,193 @@
+import altair as alt
+import numpy as np
+import pandas as pd
+
+# The number of points of the whole chart, shared by all regions.
+SCREEN_POINTS = 2000
+
+# Colors of the period boundaries, see `StreamlitApp._explaination_section`.
+BOUNDARY_COLORS = {
+    "Region start": "#F88379",
+    "Leadin start": "#dd3",
+    "Leadin end": "#097969",
+    "Region end": "#0000ff",
+}
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    The first and last points are kept and every bucket in between contributes the point that forms the
+    largest triangle with the previously selected point and the average of the next bucket.
+
+    :param x: NumPy array of increasing x values.
+    :param y: NumPy array of y values.
+    :param n_out: The number of points to keep.
+    :return: NumPy array of the indices of the kept points.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])[:max(n_out, 0)]
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # The average of every bucket, followed by the last point as the average after the last bucket.
+    counts = np.diff(edges)
+    average_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts, x[-1])
+    average_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts, y[-1])
+
+    x_list, y_list = x.tolist(), y.tolist()
+    indices = [0]
+    selected_x, selected_y = x_list[0], y_list[0]
+    for bucket_i in range(n_out - 2):
+        next_x, next_y = average_x[bucket_i + 1], average_y[bucket_i + 1]
+        best_area, best_i = -1.0, edges[bucket_i]
+        for i in range(edges[bucket_i], edges[bucket_i + 1]):
+            area = abs(
+                (selected_x - next_x) * (y_list[i] - selected_y)
+                - (selected_x - x_list[i]) * (next_y - selected_y)
+            )
+            if area > best_area:
+                best_area, best_i = area, i
+        indices.append(best_i)
+        selected_x, selected_y = x_list[best_i], y_list[best_i]
+    indices.append(n - 1)
+    return np.array(indices, dtype=np.int64)
+
+
+def minmax_lttb(x, y, n_out, minmax_ratio=4):
+    """
+    MinMaxLTTB downsampling: the minimum and maximum of equal buckets (`n_out * minmax_ratio` points in total)
+    are preselected with array operations, and LTTB then picks the final points from the preselection.
+    This keeps the extremes of the curve (e.g. the start of the lead-in) while running in linear time.
+    The global minimum and maximum are always kept, so up to two more than `n_out` points can be returned.
+
+    :param x: NumPy array of increasing x values, or a callable mapping indices to x values for evenly spaced curves.
+    :param y: NumPy array of y values.
+    :param n_out: The number of points to keep.
+    :param minmax_ratio: The number of preselected points per kept point.
+    :return: NumPy array of the indices of the kept points.
+    """
+    n = len(y)
+    x_at = x if callable(x) else x.__getitem__
+    bucket_nb = n_out * minmax_ratio // 2
+    if n <= 2 * bucket_nb or n_out < 3:
+        return lttb(x_at(np.arange(n)), y, n_out)
+
+    # Equal buckets over the inner points, the last one padded with the last inner point.
+    bucket_size = -(-(n - 2) // bucket_nb)
+    inner = y[1:n - 1]
+    padding = bucket_size * bucket_nb - len(inner)
+    if padding:
+        inner = np.concatenate([inner, np.full(padding, inner[-1])])
+    buckets = inner.reshape(bucket_nb, bucket_size)
+    offsets = 1 + np.arange(bucket_nb) * bucket_size
+    preselected = np.unique(
+        np.concatenate(
+            [
+                [0, n - 1],
+                np.minimum(offsets + np.argmin(buckets, axis=1), n - 2),
+                np.minimum(offsets + np.argmax(buckets, axis=1), n - 2),
+            ]
+        )
+    )
+    kept = preselected[lttb(x_at(preselected), y[preselected], n_out)]
+    extremes = preselected[[np.argmin(y[preselected]), np.argmax(y[preselected])]]
+    return np.union1d(kept, extremes)
+
+
+def region_block_at(config, region_start):
+    """
+    Map indices of `engine.region_blocks` to blocks without building the whole array.
+    """
+    region_length = config.region_length
+    if region_length <= 1:
+        return lambda indices: np.zeros(np.shape(indices)) + region_start
+
+    step = region_length / (region_length - 1)
+
+    def block_at(indices):
+        indices = np.asarray(indices)
+        # Like `np.linspace`, the last block is exactly the region end.
+        return np.where(
+            indices == region_length - 1,
+            region_start + region_length,
+            indices * step + region_start,
+        )
+
+    return block_at
+
+
+def chart_data(config, regions, screen_points=SCREEN_POINTS):
+    """
+    Build the downsampled curves and period boundaries of the simulated regions.
+
+    :param config: The configuration object.
+    :param regions: Sequence of `cache.CachedRegion`.
+    :param screen_points: The number of points of the whole chart, shared by all regions.
+    :return: Tuple of DataFrames (curves with columns block, price and region; boundaries with columns block and boundary).
+    """
+    points_per_region = max(3, screen_points // max(len(regions), 1))
+    blocks, prices, labels = [], [], []
+    boundaries = []
+    for region in regions:
+        region_start = region.result.region_start
+        block_at = region_block_at(config, region_start)
+        kept = minmax_lttb(block_at, region.prices, points_per_region)
+        blocks.append(block_at(kept))
+        prices.append(region.prices[kept])
+        labels.append(np.full(len(kept), f"Region {region.result.region}"))
+        boundaries.extend(
+            [
+                (region_start, "Region start"),
+                (region_start + config.interlude_length, "Leadin start"),
+                (region_start + config.interlude_length + config.leadin_length, "Leadin end"),
+                (region_start + config.region_length, "Region end"),
+            ]
+        )
+
+    curves = pd.DataFrame(
+        {
+            "block": np.concatenate(blocks) if blocks else [],
+            "price": np.concatenate(prices) if prices else [],
+            "region": np.concatenate(labels) if labels else [],
+        }
+    )
+    return curves, pd.DataFrame(boundaries, columns=["block", "boundary"])
+
+
+def price_chart(config, regions, screen_points=SCREEN_POINTS):
+    """
+    Build an interactive chart of the simulated regions: all curves are drawn by a single line mark,
+    colored by region, and the period boundaries by a single rule mark.
+
+    :param config: The configuration object.
+    :param regions: Sequence of `cache.CachedRegion`.
+    :param screen_points: The number of points of the whole chart, shared by all regions.
+    :return: `alt.LayerChart`
+    """
+    curves, boundaries = chart_data(config, regions, screen_points)
+
+    lines = alt.Chart(curves).mark_line().encode(
+        x=alt.X("block:Q", title="Block Time"),
+        y=alt.Y("price:Q", title="Sale Price"),
+        color=alt.Color("region:N", title=None, sort=None),
+        tooltip=["region:N", "block:Q", "price:Q"],
+    )
+    rules = alt.Chart(boundaries).mark_rule(strokeDash=[4, 4]).encode(
+        x="block:Q",
+        color=alt.Color(
+            "boundary:N",
+            scale=alt.Scale(
+                domain=list(BOUNDARY_COLORS), range=list(BOUNDARY_COLORS.values())
+            ),
+            legend=None,
+        ),
+    )
+    return (
+        alt.layer(rules, lines)
+        .resolve_scale(color="independent")
+        .properties(title="Sale Price over Time")
+        .interactive(bind_y=False)
+    )
@@ -0,0 +1,444 @@
+"""
+Replay of recorded broker pallet sale history through the price model.
+
+An event dump holds one event per row, in the order in which they happened, with the columns
+- `event`: `sale_initialized`, `purchased` or `renewed` (the broker's `SaleInitialized`, `Purchased` and
+  `Renewed` are accepted as well). Other events are skipped.
+- `block`: the block at which the event happened.
+- `price`: the price paid for `purchased` and `renewed`, and the regular price of the sale (the price the lead-in
+  falls to, `end_price` of the broker's event) for `sale_initialized`.
+
+Dumps are JSON lines (`.jsonl`), CSV with a header row (`.csv`) or Parquet (`.parquet`) files, read in chunks of
+`chunk_rows` events, so only one chunk and the totals of the current region are held in memory however long the
+history is. Every `sale_initialized` event starts a region: the renewals and purchases up to the next one are
+counted, and the sellout price is taken from the purchases like `do_purchase` does, instead of assuming that the
+cores were sold at the lowest price of the sale. At the end of the region they are fed into `rotate_sale`, and the
+start price the model predicts for the next region is compared with the one recorded.
+
+The position of the `sale_initialized` event of every region and the state of the model at that point are kept in
+a region index (see `ReplayEngine.index`, `save_index` and `load_index`), from which a replay resumes at any region
+without reading the events before it.
+"""
+import csv
+import json
+import os
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from engine import renewal_offset
+from price import PriceState
+
+# Event kinds.
+SALE_INITIALIZED = 0
+PURCHASED = 1
+RENEWED = 2
+
+EVENT_KINDS = {
+    "sale_initialized": SALE_INITIALIZED,
+    "SaleInitialized": SALE_INITIALIZED,
+    "purchased": PURCHASED,
+    "Purchased": PURCHASED,
+    "renewed": RENEWED,
+    "Renewed": RENEWED,
+}
+
+COLUMNS = ("event", "block", "price")
+
+FORMATS = {
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".csv": "csv",
+    ".parquet": "parquet",
+}
+
+
+class EventChunk(NamedTuple):
+    """
+    Consecutive events of a dump, one element per event in every array.
+    """
+
+    # The event kinds, -1 for the events that are skipped.
+    kinds: np.ndarray
+    blocks: np.ndarray
+    prices: np.ndarray
+    # Where the events are in the dump: the byte offset of their line for JSON lines and CSV, the row for Parquet.
+    positions: np.ndarray
+
+
+class IndexEntry(NamedTuple):
+    """
+    Where a region starts in a dump, see `ReplayEngine.index`.
+    """
+
+    region: int
+    # The block of the `sale_initialized` event of the region.
+    block: float
+    # The position of the `sale_initialized` event, see `EventChunk.positions`.
+    position: int
+    # The state of the model at the start of the region.
+    state: PriceState
+
+
+class RegionResidual(NamedTuple):
+    """
+    The recorded outcome of a region next to the one of the model.
+    """
+
+    # The number of the region, counting the `sale_initialized` events of the dump from 1.
+    region: int
+    # The block of the `sale_initialized` event of the region.
+    region_start: float
+    renewals: int
+    sales: int
+    # The recorded regular price of the sale.
+    start_price: float
+    # The price the model predicts from the regions before.
+    model_start_price: float
+    start_price_residual: float
+    # The recorded sellout price, or None if no core was purchased.
+    sellout_price: Optional[float]
+    # The sellout price assumed by the model: the lowest price of the sale.
+    model_sellout_price: float
+    sellout_price_residual: Optional[float]
+    # The mean price of the recorded renewals, or None if no core was renewed.
+    renewal_price: Optional[float]
+    # The renewal price of the model, capped by the renewal bump.
+    model_renewal_price: float
+    renewal_price_residual: Optional[float]
+
+
+def dump_format(path):
+    """
+    The format of an event dump, from the extension of its path.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Unknown event dump format: {path}. Expected one of {', '.join(FORMATS)}.")
+    return FORMATS[extension]
+
+
+def _chunk(events, blocks, prices, positions):
+    events = np.asarray(events, dtype=object)
+    kinds = np.full(len(events), -1, dtype=np.int8)
+    for name, kind in EVENT_KINDS.items():
+        kinds[events == name] = kind
+    return EventChunk(
+        kinds=kinds,
+        blocks=np.asarray(blocks, dtype=float),
+        prices=np.asarray(prices, dtype=float),
+        positions=np.asarray(positions, dtype=np.int64),
+    )
+
+
+def _price(value):
+    return np.nan if value is None or value == "" else float(value)
+
+
+def _jsonl_chunks(path, chunk_rows, position):
+    with open(path, "rb") as f:
+        f.seek(position)
+        while True:
+            events, blocks, prices, positions = [], [], [], []
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    events.append(record.get("event"))
+                    blocks.append(record.get("block"))
+                    prices.append(_price(record.get("price")))
+                    positions.append(position)
+                position += len(line)
+                if len(events) == chunk_rows:
+                    break
+            if not events:
+                return
+            yield _chunk(events, blocks, prices, positions)
+
+
+def _csv_chunks(path, chunk_rows, position):
+    with open(path, "rb") as f:
+        header = f.readline()
+        columns = next(csv.reader([header.decode()]))
+        event_i, block_i, price_i = (columns.index(column) for column in COLUMNS)
+        position = max(position, len(header))
+        f.seek(position)
+        while True:
+            lines, positions = [], []
+            for line in f:
+                if line.strip():
+                    lines.append(line.decode())
+                    positions.append(position)
+                position += len(line)
+                if len(lines) == chunk_rows:
+                    break
+            if not lines:
+                return
+            rows = list(csv.reader(lines))
+            yield _chunk(
+                [row[event_i] for row in rows],
+                [row[block_i] for row in rows],
+                [_price(row[price_i]) for row in rows],
+                positions,
+            )
+
+
+def _parquet_chunks(path, chunk_rows, position):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    # Skip the row groups before the position without reading them.
+    row_groups = []
+    first_row = 0
+    for i in range(parquet.num_row_groups):
+        rows = parquet.metadata.row_group(i).num_rows
+        if row_groups or first_row + rows > position:
+            row_groups.append(i)
+        else:
+            first_row += rows
+    if not row_groups:
+        return
+    row = first_row
+    for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=row_groups, columns=list(COLUMNS)):
+        skip = max(position - row, 0)
+        size = batch.num_rows
+        if skip < size:
+            batch = batch.slice(skip)
+            yield _chunk(
+                batch.column("event").to_numpy(zero_copy_only=False),
+                batch.column("block").to_numpy(zero_copy_only=False),
+                batch.column("price").to_numpy(zero_copy_only=False),
+                np.arange(row + skip, row + size),
+            )
+        row += size
+
+
+def read_events(path, chunk_rows=65_536, position=0):
+    """
+    Read an event dump in chunks, see the module documentation for the format.
+
+    :param path: The path of the dump. Its format is told by its extension, see `dump_format`.
+    :param chunk_rows: The maximum number of events per chunk.
+    :param position: Where to start reading, see `EventChunk.positions`.
+    :return: Iterator of `EventChunk`.
+    """
+    readers = {"jsonl": _jsonl_chunks, "csv": _csv_chunks, "parquet": _parquet_chunks}
+    return readers[dump_format(path)](path, chunk_rows, position)
+
+
+def _ideal_cores(config):
+    offered = config.limit_cores_offered if config.limit_cores_offered is not None else 0
+    ideal_bulk_proportion = config.ideal_bulk_proportion if config.ideal_bulk_proportion is not None else 0
+    return int(ideal_bulk_proportion * offered)
+
+
+def _residual(value, model_value):
+    return None if value is None else value - model_value
+
+
+class _Region:
+    """
+    The totals of the region being replayed.
+    """
+
+    __slots__ = (
+        "region",
+        "block",
+        "start_price",
+        "model_start_price",
+        "model_renewal_price",
+        "model_new_buy_price",
+        "renewals",
+        "sales",
+        "renewal_total",
+        "sellout_price",
+    )
+
+    def __init__(self, region, block, start_price, model_start_price, model_renewal_price, model_new_buy_price):
+        self.region = region
+        self.block = block
+        self.start_price = start_price
+        self.model_start_price = model_start_price
+        self.model_renewal_price = model_renewal_price
+        # The renewal price quoted in the interlude, or None if the region has no renewal block.
+        self.model_new_buy_price = model_new_buy_price
+        self.renewals = 0
+        self.sales = 0
+        self.renewal_total = 0.0
+        self.sellout_price = None
+
+    def add(self, kinds, prices, ideal):
+        """
+        Count the renewals and purchases of consecutive events of the region.
+        Like `do_purchase`, a purchase sets the sellout price while no more than the ideal number of cores
+        (renewals included) have been sold, or if there is no sellout price yet.
+        """
+        renewed = kinds == RENEWED
+        purchased = kinds == PURCHASED
+        cores_sold = self.renewals + self.sales + np.cumsum(renewed | purchased)
+        below_ideal = np.flatnonzero(purchased & (cores_sold <= ideal))
+        if len(below_ideal):
+            self.sellout_price = float(prices[below_ideal[-1]])
+        elif self.sellout_price is None and purchased.any():
+            self.sellout_price = float(prices[np.argmax(purchased)])
+        self.renewals += int(renewed.sum())
+        self.sales += int(purchased.sum())
+        self.renewal_total += float(prices[renewed].sum())
+
+    def residual(self):
+        model_sellout_price = self.model_start_price
+        renewal_price = self.renewal_total / self.renewals if self.renewals else None
+        return RegionResidual(
+            region=self.region,
+            region_start=self.block,
+            renewals=self.renewals,
+            sales=self.sales,
+            start_price=self.start_price,
+            model_start_price=self.model_start_price,
+            start_price_residual=self.start_price - self.model_start_price,
+            sellout_price=self.sellout_price,
+            model_sellout_price=model_sellout_price,
+            sellout_price_residual=_residual(self.sellout_price, model_sellout_price),
+            renewal_price=renewal_price,
+            model_renewal_price=self.model_renewal_price,
+            renewal_price_residual=_residual(renewal_price, self.model_renewal_price),
+        )
+
+
+class ReplayEngine:
+    """
+    Feeds the renewals, sales and sellout prices recorded in an event dump into a `CalculatePrice` object,
+    region after region, see the module documentation.
+
+    :param price_calculator: The `CalculatePrice` object to replay into. It is moved forward by every region.
+    :param path: The path of the event dump.
+    :param chunk_rows: The maximum number of events read at once.
+    :param anchor: Start the model from the recorded start price of the first region, which it cannot predict.
+    """
+
+    def __init__(self, price_calculator, path, chunk_rows=65_536, anchor=True):
+        self.price_calculator = price_calculator
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.anchor = anchor
+        # The `IndexEntry` of every region replayed, in order.
+        self.index = []
+
+    def __open_region(self, region, block, start_price, position, resumed):
+        calculator = self.price_calculator
+        config = calculator.config
+        if region == 1 and self.anchor and not resumed:
+            calculator.price = start_price
+        self.index.append(IndexEntry(region, block, position, calculator.snapshot()))
+
+        # The renewal price left behind by the region, like `RegionEngine.step`: only a block of the interlude
+        # sets the new buy price, otherwise the renewal price is the capped price paid.
+        offset = renewal_offset(config)
+        if offset is not None and offset < config.interlude_length:
+            new_buy_price = calculator.quote_price(block, block + offset)
+            renewal_price = new_buy_price
+        else:
+            new_buy_price = None
+            renewal_price = min(
+                calculator.initial_bought_price * (1 + config.renewal_bump), calculator.new_buy_price
+            )
+        return _Region(
+            region=region,
+            block=block,
+            start_price=start_price,
+            model_start_price=calculator.price,
+            model_renewal_price=renewal_price,
+            model_new_buy_price=new_buy_price,
+        )
+
+    def __close_region(self, tally):
+        calculator = self.price_calculator
+        if tally.model_new_buy_price is not None:
+            calculator.new_buy_price = tally.model_new_buy_price
+        calculator.update_renewal_price()
+        calculator.sellout_price = tally.sellout_price
+        calculator.rotate_sale(tally.renewals, tally.sales)
+        return tally.residual()
+
+    def run(self, start_region=1, index=None):
+        """
+        Replay the dump from `start_region` to its end, yielding the residuals of each region once it ended.
+        The last region ends with the dump.
+
+        :param start_region: The region to start from. Regions after the first one need an index.
+        :param index: The region index of an earlier replay of the dump, see `index` and `load_index`. The state of
+            the price calculator is restored from it.
+        :return: Iterator of `RegionResidual`.
+        """
+        position = 0
+        region = 0
+        self.index = []
+        if start_region > 1:
+            entries = {entry.region: entry for entry in index or ()}
+            if start_region not in entries:
+                raise ValueError(f"Region {start_region} is not in the index.")
+            entry = entries[start_region]
+            self.price_calculator.restore(entry.state)
+            self.index = [entry for entry in index if entry.region < start_region]
+            position = entry.position
+            region = start_region - 1
+        resumed = start_region > 1
+
+        ideal = _ideal_cores(self.price_calculator.config)
+        tally = None
+        for chunk in read_events(self.path, self.chunk_rows, position):
+            starts = np.flatnonzero(chunk.kinds == SALE_INITIALIZED)
+            bounds = [0, *starts.tolist(), len(chunk.kinds)]
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                if start < end and chunk.kinds[start] == SALE_INITIALIZED:
+                    if tally is not None:
+                        yield self.__close_region(tally)
+                    region += 1
+                    tally = self.__open_region(
+                        region,
+                        float(chunk.blocks[start]),
+                        float(chunk.prices[start]),
+                        int(chunk.positions[start]),
+                        resumed,
+                    )
+                    start += 1
+                # Events before the first sale of the dump belong to no region.
+                if tally is not None and start < end:
+                    tally.add(chunk.kinds[start:end], chunk.prices[start:end], ideal)
+        if tally is not None:
+            yield self.__close_region(tally)
+
+
+def save_index(index, path):
+    """
+    Write a region index to a JSON file.
+
+    :param index: List of `IndexEntry`, see `ReplayEngine.index`.
+    :param path: The path of the file.
+    """
+    with open(path, "w") as f:
+        json.dump(
+            [
+                {
+                    "region": entry.region,
+                    "block": entry.block,
+                    "position": entry.position,
+                    "state": dict(zip(PriceState.__slots__, entry.state.astuple())),
+                }
+                for entry in index
+            ],
+            f,
+        )
+
+
+def load_index(path):
+    """
+    Read a region index written by `save_index`.
+
+    :return: List of `IndexEntry`.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    return [
+        IndexEntry(entry["region"], entry["block"], entry["position"], PriceState(**entry["state"]))
+        for entry in entries
+    ]
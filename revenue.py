@@ -0,0 +1,438 @@
+"""
+Projections of the revenue of the sales and the spend of a buyer, without summing per-block prices.
+
+Cores are renewed at times spread over a window of the interlude and bought at times spread over a window of the
+sale period, uniformly unless a purchase-time density is given. The expected price over a uniform window is the mean
+of the lead-in curve over it: in closed form for the linear curve (affine) and the exponential curve (a power of
+`2 - when`), with the renewal cap handled by splitting the window where the curve crosses it, and by piecewise
+Gauss-Legendre quadrature for other registered curves (and negative factors). Windows with a density are always
+integrated by piecewise quadrature, with the density weighting the nodes. Every region costs O(1), whatever the
+number of blocks. Without an interlude there is no renewal window, and no renewal price.
+"""
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from curves import CURVES
+from engine import SALE_START, RegionEngine, renewal_offset
+from poly import Exponential, Linear
+
+# Gauss-Legendre nodes and weights on [0, 1], for curves without a closed form.
+_NODES, _WEIGHTS = np.polynomial.legendre.leggauss(32)
+_NODES = (_NODES + 1) / 2
+_WEIGHTS = _WEIGHTS / 2
+
+# Number of points at which curves without a closed form are sampled for the percentiles.
+PERCENTILE_SAMPLES = 257
+
+
+class RegionProjection(NamedTuple):
+    """
+    The projected revenue and spend of a single region.
+    """
+
+    # The number of the region, starting at 1.
+    region: int
+    # The price at which the sale of the region starts.
+    start_price: float
+    # The expected price of a renewal over the renewal window, None without an interlude.
+    renewal_price: Optional[float]
+    # The expected price of a purchase over the sale window.
+    sale_price: float
+    # The 5th, 50th and 95th percentiles of the price of a purchase over the sale window.
+    sale_price_p5: float
+    sale_price_p50: float
+    sale_price_p95: float
+    # The expected revenue of the renewals and sales of the schedule.
+    revenue: float
+    # The expected spend of the buyer's own renewals and purchases.
+    spend: float
+
+
+def _closed_form(curve):
+    """
+    The built-in curve implemented by the registered curve `curve`, or None.
+    """
+    function = CURVES.get(curve)
+    if function is Linear.leadin_factor_at:
+        return "linear"
+    if function is Exponential.leadin_factor_at:
+        return "exponential"
+    return None
+
+
+def _integral(kind, function, factor, a, b):
+    """
+    The integral of the lead-in factor over `when` from `a` to `b`, with 0 <= a <= b <= 1 and a non-negative factor.
+    """
+    if b <= a:
+        return 0.0
+    if kind == "linear":
+        return (b - a) * (1 + factor * (1 - (a + b) / 2))
+    if kind == "exponential":
+        return ((2 - a) ** (factor + 1) - (2 - b) ** (factor + 1)) / (factor + 1)
+    return (b - a) * float(np.dot(_WEIGHTS, function(a + (b - a) * _NODES, factor)))
+
+
+def _crossing(kind, factor, ratio):
+    """
+    The `when` at which a built-in lead-in curve with a non-negative factor equals `ratio`, clipped to [0, 1].
+    """
+    if factor == 0 or ratio <= 0:
+        # The curve is constant at 1.
+        return 1.0 if ratio < 1 else 0.0
+    if kind == "linear":
+        when = 1 - (ratio - 1) / factor
+    else:
+        when = 2 - ratio ** (1 / factor)
+    return min(max(when, 0.0), 1.0)
+
+
+def _cap_crossings(function, factor, a, b, cap):
+    """
+    The points of [a, b] where the lead-in curve crosses `cap`, found on a grid of `PERCENTILE_SAMPLES` points
+    and refined by bisection.
+    """
+    if not np.isfinite(cap):
+        return []
+    grid = np.linspace(a, b, PERCENTILE_SAMPLES)
+    above = np.asarray(function(grid, factor), dtype=float) > cap
+    crossings = []
+    for i in np.flatnonzero(above[1:] != above[:-1]):
+        low, high = grid[i], grid[i + 1]
+        for _ in range(60):
+            middle = (low + high) / 2
+            if (function(middle, factor) > cap) == above[i]:
+                low = middle
+            else:
+                high = middle
+        crossings.append((low + high) / 2)
+    return crossings
+
+
+def capped_mean(curve, factor, a, b, cap=np.inf):
+    """
+    The mean of `min(cap, lead-in factor)` over `when` uniform in [a, b].
+
+    :param curve: The name of a curve registered in `curves.CURVES`.
+    :param factor: The factor of the curve.
+    :param a: The start of the window, a fraction of the lead-in period.
+    :param b: The end of the window, with a <= b <= 1.
+    :param cap: The cap, relative to the price of the sale.
+    :return: The mean factor.
+    """
+    function = CURVES.get(curve)
+    if b <= a:
+        return min(cap, float(function(a, factor)))
+    kind = _closed_form(curve)
+    if kind is None or factor < 0:
+        # Integrate piecewise between the points where the curve crosses the cap, where `min` has a kink.
+        bounds = [a, *_cap_crossings(function, factor, a, b, cap), b]
+        total = 0.0
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            when = start + (end - start) * _NODES
+            total += (end - start) * float(np.dot(_WEIGHTS, np.minimum(cap, function(when, factor))))
+        return total / (b - a)
+    if not np.isfinite(cap):
+        return _integral(kind, function, factor, a, b) / (b - a)
+    # Built-in curves are non-increasing: capped before the crossing, free after it.
+    crossing = min(max(_crossing(kind, factor, cap), a), b)
+    return (cap * (crossing - a) + _integral(kind, function, factor, crossing, b)) / (b - a)
+
+
+def _window_mean(curve, factor, leadin_length, start, end, cap=np.inf, pdf=None):
+    """
+    The mean of `min(cap, lead-in factor)` over offsets in [start, end] blocks, offsets past the lead-in
+    having the factor at its end.
+
+    :param pdf: The density of the offsets, see `project`; uniform if None.
+    """
+    function = CURVES.get(curve)
+    if end <= start:
+        when = min(start / leadin_length, 1.0) if leadin_length > 0 else 1.0
+        return min(cap, float(function(when, factor)))
+    if pdf is not None:
+        return _weighted_window_mean(function, factor, leadin_length, start, end, cap, pdf)
+    leadin_end = min(end, leadin_length)
+    total = 0.0
+    if start < leadin_end:
+        total += (leadin_end - start) * capped_mean(
+            curve, factor, start / leadin_length, leadin_end / leadin_length, cap
+        )
+    if end > max(start, leadin_length):
+        total += (end - max(start, leadin_length)) * min(cap, float(function(1.0, factor)))
+    return total / (end - start)
+
+
+def _weighted_window_mean(function, factor, leadin_length, start, end, cap, pdf):
+    """
+    `_window_mean` with offsets distributed by the density `pdf`, by Gauss-Legendre quadrature of the weighted
+    factor between the end of the lead-in and the points where the curve crosses the cap, where it has kinks.
+    """
+    bounds = [start, end]
+    if start < leadin_length:
+        leadin_end = min(end, leadin_length)
+        crossings = _cap_crossings(function, factor, start / leadin_length, leadin_end / leadin_length, cap)
+        bounds[1:1] = [when * leadin_length for when in crossings] + [leadin_end]
+    total = weight = 0.0
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        if b <= a:
+            continue
+        offsets = a + (b - a) * _NODES
+        when = np.clip(offsets / leadin_length, 0, 1) if leadin_length > 0 else np.ones(len(offsets))
+        density = (b - a) * _WEIGHTS * _density(pdf, (offsets - start) / (end - start))
+        total += float(np.dot(density, np.minimum(cap, function(when, factor))))
+        weight += density.sum()
+    if not weight > 0:
+        raise ValueError("The purchase-time density must be positive somewhere in the window.")
+    return total / weight
+
+
+def _density(pdf, position):
+    """
+    The values of a purchase-time density at positions in its window, checked to be non-negative.
+    """
+    density = np.broadcast_to(np.asarray(pdf(position), dtype=float), np.shape(position))
+    if np.any(density < 0):
+        raise ValueError("The purchase-time density must not be negative.")
+    return density
+
+
+def _window_quantiles(curve, factor, leadin_length, start, end, quantiles, pdf=None):
+    """
+    The quantiles of the lead-in factor over offsets in [start, end] blocks, uniform unless `pdf` is given.
+    """
+    function = CURVES.get(curve)
+    if pdf is not None and end > start:
+        offsets = np.linspace(start, end, PERCENTILE_SAMPLES)
+        when = np.clip(offsets / leadin_length, 0, 1) if leadin_length > 0 else np.ones(len(offsets))
+        factors = np.asarray(function(when, factor), dtype=float)
+        order = np.argsort(factors, kind="stable")
+        cumulative = np.cumsum(_density(pdf, np.linspace(0, 1, PERCENTILE_SAMPLES))[order])
+        if not cumulative[-1] > 0:
+            raise ValueError("The purchase-time density must be positive somewhere in the window.")
+        index = np.searchsorted(cumulative / cumulative[-1], quantiles)
+        return factors[order][np.minimum(index, PERCENTILE_SAMPLES - 1)]
+    monotone = _closed_form(curve) is not None and factor >= 0
+    if monotone:
+        # The factor does not increase over the window, so its q-quantile is at the (1 - q) point of the window.
+        offsets = start + (end - start) * (1 - np.asarray(quantiles, dtype=float))
+    else:
+        offsets = np.linspace(start, end, PERCENTILE_SAMPLES)
+    when = np.clip(offsets / leadin_length, 0, 1) if leadin_length > 0 else np.ones(len(offsets))
+    factors = np.asarray(function(when, factor), dtype=float)
+    return factors if monotone else np.quantile(factors, quantiles)
+
+
+def _windows(config, renewal_window, sale_window):
+    """
+    The renewal window in blocks from the region start and the sale window in blocks from the sale start.
+    """
+    interlude_length = config.interlude_length
+    sale_length = config.region_length - interlude_length
+    if sale_window is None:
+        sale_window = (0.0, min(config.leadin_length / sale_length, 1.0) if sale_length > 0 else 1.0)
+    return (
+        (renewal_window[0] * interlude_length, renewal_window[1] * interlude_length),
+        (sale_window[0] * sale_length, sale_window[1] * sale_length),
+    )
+
+
+def project(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    renewal_window=(0.0, 1.0),
+    sale_window=None,
+    own_renewals=None,
+    own_purchases=None,
+    sale_start=SALE_START,
+    renewal_pdf=None,
+    sale_pdf=None,
+):
+    """
+    Project the revenue of the sales and the spend of a buyer, region by region.
+    Without an interlude nothing is renewed: the renewal price is None and the revenue and spend only count sales.
+
+    :param price_calculator: The `CalculatePrice` object to simulate from. It is not modified.
+    :param region_nb: The number of regions.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param renewal_window: The part of the interlude over which renewals are spread, as fractions of the interlude.
+    :param sale_window: The part of the sale period (from the end of the interlude to the end of the region) over
+        which purchases are spread, as fractions of the sale period; by default the lead-in.
+    :param own_renewals: Number of the buyer's cores renewed in each region, keyed by region number.
+    :param own_purchases: Number of cores bought by the buyer in each region, keyed by region number.
+    :param sale_start: The first block of the first region.
+    :param renewal_pdf: The density of the renewal times: a function of the position in the renewal window, from 0 at
+        its start to 1 at its end, vectorized over NumPy arrays. It need not be normalized. Uniform if None.
+    :param sale_pdf: The density of the purchase times over the sale window, like `renewal_pdf`.
+    :return: List of `RegionProjection`, one per region.
+    """
+    config = price_calculator.config
+    calculator = price_calculator.fork()
+    engine = RegionEngine(calculator, sale_start)
+    curve, factor = calculator.get_curve(), calculator.factor
+    leadin_length = config.leadin_length
+    (renewal_start, renewal_end), (purchase_start, purchase_end) = _windows(config, renewal_window, sale_window)
+    own_renewals = own_renewals or {}
+    own_purchases = own_purchases or {}
+
+    # The lead-in curve only depends on the region through the start price, so the means are computed once.
+    sale_factor = _window_mean(curve, factor, leadin_length, purchase_start, purchase_end, pdf=sale_pdf)
+    quantiles = _window_quantiles(
+        curve, factor, leadin_length, purchase_start, purchase_end, (0.95, 0.5, 0.05), sale_pdf
+    )
+    renews = renewal_offset(config) is not None
+
+    projections = []
+    for region_i in range(region_nb):
+        region = region_i + 1
+        price = calculator.price
+        sale_price = sale_factor * price
+        renewals = monthly_renewals.get(region, 0)
+        sales = monthly_sales.get(region, 0)
+        revenue = sales * sale_price
+        spend = own_purchases.get(region, 0) * sale_price
+        if renews:
+            cap = calculator.initial_bought_price * (1 + config.renewal_bump)
+            renewal_factor = _window_mean(
+                curve, factor, leadin_length, renewal_start, renewal_end, cap / price if price > 0 else np.inf,
+                renewal_pdf,
+            )
+            renewal_price = renewal_factor * price if price > 0 else 0.0
+            revenue += renewals * renewal_price
+            spend += own_renewals.get(region, 0) * renewal_price
+        else:
+            renewal_price = None
+
+        projections.append(
+            RegionProjection(
+                region=region,
+                start_price=price,
+                renewal_price=renewal_price,
+                sale_price=sale_price,
+                sale_price_p5=quantiles[2] * price,
+                sale_price_p50=quantiles[1] * price,
+                sale_price_p95=quantiles[0] * price,
+                revenue=revenue,
+                spend=spend,
+            )
+        )
+        engine.step(region_i, renewals, sales)
+    return projections
+
+
+def block_summed(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    renewal_window=(0.0, 1.0),
+    sale_window=None,
+    sale_start=SALE_START,
+    renewal_pdf=None,
+    sale_pdf=None,
+):
+    """
+    The expected renewal and sale prices of `project`, from the price at every whole block of the windows
+    as evaluated by `CalculatePrice.calculate_region_prices`, weighted by the densities at the blocks.
+
+    :return: List of (renewal price, sale price) tuples, one per region. The renewal price is None if no whole block
+        falls into the renewal window, e.g. without an interlude.
+    """
+    config = price_calculator.config
+    calculator = price_calculator.fork()
+    engine = RegionEngine(calculator, sale_start)
+    (renewal_start, renewal_end), (purchase_start, purchase_end) = _windows(config, renewal_window, sale_window)
+    renewal_offsets = np.arange(np.ceil(renewal_start), np.floor(renewal_end) + 1)
+    # The interlude ends before its last block.
+    renewal_offsets = renewal_offsets[renewal_offsets < config.interlude_length]
+    sale_offsets = np.arange(np.ceil(purchase_start), np.floor(purchase_end) + 1)
+    renewal_weights = _block_weights(renewal_pdf, renewal_offsets, renewal_start, renewal_end)
+    sale_weights = _block_weights(sale_pdf, sale_offsets, purchase_start, purchase_end)
+    sale_offsets = config.interlude_length + sale_offsets
+
+    prices = []
+    for region_i in range(region_nb):
+        region_start = sale_start + region_i * config.region_length
+        # The prices are evaluated on a fork, so that the state only moves forward by the region.
+        region_calculator = calculator.fork()
+        sale_prices = region_calculator.calculate_region_prices(region_start, region_start + sale_offsets)
+        sale_price = float(np.average(sale_prices, weights=sale_weights))
+        if len(renewal_offsets):
+            renewal_prices = region_calculator.calculate_region_prices(region_start, region_start + renewal_offsets)
+            prices.append((float(np.average(renewal_prices, weights=renewal_weights)), sale_price))
+        else:
+            prices.append((None, sale_price))
+        engine.step(
+            region_i, monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0)
+        )
+    return prices
+
+
+def _block_weights(pdf, offsets, start, end):
+    """
+    The weights of the blocks at `offsets` of the window [start, end] under the density `pdf`, or None if uniform.
+    """
+    if pdf is None or end <= start:
+        return None
+    return _density(pdf, (offsets - start) / (end - start))
+
+
+def check_consistency(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    renewal_window=(0.0, 1.0),
+    sale_window=None,
+    rtol=None,
+    sale_start=SALE_START,
+    renewal_pdf=None,
+    sale_pdf=None,
+):
+    """
+    Compare the closed-form expected prices of `project` with the block-summed ones of `block_summed`.
+    Renewal prices are only compared where there is a renewal window.
+
+    :param rtol: The largest relative difference allowed. By default 2 / the number of blocks in the smaller window,
+        the error of replacing a sum over whole blocks by an integral.
+    :return: The largest relative difference.
+    :raises ValueError: If the relative difference of any region is larger than `rtol`.
+    """
+    options = dict(
+        renewal_window=renewal_window,
+        sale_window=sale_window,
+        sale_start=sale_start,
+        renewal_pdf=renewal_pdf,
+        sale_pdf=sale_pdf,
+    )
+    projections = project(price_calculator, region_nb, monthly_renewals, monthly_sales, **options)
+    summed = block_summed(price_calculator, region_nb, monthly_renewals, monthly_sales, **options)
+
+    if rtol is None:
+        (renewal_start, renewal_end), (purchase_start, purchase_end) = _windows(
+            price_calculator.config, renewal_window, sale_window
+        )
+        widths = [purchase_end - purchase_start]
+        if renewal_offset(price_calculator.config) is not None:
+            widths.append(renewal_end - renewal_start)
+        rtol = 2 / max(min(widths), 1)
+    worst = 0.0
+    for projection, (renewal_price, sale_price) in zip(projections, summed):
+        for projected, block_price in (
+            (projection.renewal_price, renewal_price),
+            (projection.sale_price, sale_price),
+        ):
+            if projected is None or block_price is None:
+                continue
+            difference = abs(projected - block_price) / max(abs(block_price), 1e-12)
+            worst = max(worst, difference)
+            if difference > rtol:
+                raise ValueError(
+                    f"Region {projection.region}: projected price {projected} differs from the block-summed price "
+                    f"{block_price} by {difference:.2%}, more than {rtol:.2%}."
+                )
+    return worst
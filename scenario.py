@@ -0,0 +1,75 @@
+import itertools
+from dataclasses import dataclass
+
+from config import Config
+from price import CalculatePrice
+
+
+@dataclass
+class Scenario:
+    """
+    A single simulation scenario: a configuration together with the settings of `CalculatePrice`.
+    """
+
+    config: Config
+    # The leadin factor is either linear or exponential depending on the value of linear.
+    linear: bool = True
+    # The factor of the exponential or linear function.
+    factor: int = 1
+    # The starting price of the sale.
+    price: float = 1000
+    # The price for which the cores were bought in the previous region.
+    initial_bought_price: float = 1000
+
+    def create_calculator(self):
+        """
+        Create a `CalculatePrice` object initialized with the scenario settings.
+        """
+        price_calculator = CalculatePrice(self.config)
+        price_calculator.change_linear(self.linear)
+        price_calculator.change_factor(self.factor)
+        price_calculator.change_initial_price(self.price)
+        price_calculator.change_bought_price(self.initial_bought_price)
+        return price_calculator
+
+    def as_dict(self):
+        """
+        Return the scenario settings, including the configuration values, as a flat dictionary.
+        """
+        return {
+            **self.config.as_dict(),
+            "linear": self.linear,
+            "factor": self.factor,
+            "price": self.price,
+            "initial_bought_price": self.initial_bought_price,
+        }
+
+
+def scenario_grid(base_config, **values):
+    """
+    Build the cartesian product of scenario settings.
+
+    Keyword arguments are iterables of values, keyed either by a `Config` attribute
+    (e.g. `ideal_bulk_proportion=[0.5, 0.6]`) or by a `Scenario` setting (e.g. `linear=[True, False]`).
+    Attributes that are not given are taken from `base_config` or the `Scenario` defaults.
+
+    :param base_config: The configuration object the grid is built around.
+    :return: List of `Scenario`.
+    """
+    config_values = base_config.as_dict()
+    for key in values:
+        if key not in config_values and key not in Scenario.__dataclass_fields__:
+            raise ValueError(f"Unknown scenario setting: {key}")
+
+    keys = list(values)
+    scenarios = []
+    for combination in itertools.product(*(values[key] for key in keys)):
+        settings = dict(zip(keys, combination))
+        config = Config(
+            **{key: settings.get(key, value) for key, value in config_values.items()}
+        )
+        scenario_settings = {
+            key: value for key, value in settings.items() if key not in config_values
+        }
+        scenarios.append(Scenario(config=config, **scenario_settings))
+    return scenarios
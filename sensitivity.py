@@ -0,0 +1,333 @@
+"""
+Sensitivity of the start price and renewal price of every region to the configuration and price settings.
+
+All scenarios of an analysis (the unperturbed one and every perturbation or sample) are simulated together in one
+`BatchCalculatePrice`, so a Jacobian over a handful of parameters costs about as much as a couple of simulations
+of a single scenario. Parameters may be perturbed from a later region on, e.g. to study a change of `renewal_bump`
+after some regions: the regions before it are simulated once, for the unperturbed scenario, and shared by every
+perturbed one.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from batch import BatchCalculatePrice, BatchRegionResult
+
+# The parameters that can be perturbed, all of them attributes of `BatchCalculatePrice`.
+PARAMETERS = (
+    "ideal_bulk_proportion",
+    "renewal_bump",
+    "limit_cores_offered",
+    "factor",
+    "price",
+    "initial_bought_price",
+)
+
+# Parameters that only take whole values; they are perturbed by whole units and sampled values are rounded.
+INTEGER_PARAMETERS = ("limit_cores_offered",)
+
+OUTPUTS = ("start_price", "renewal_price")
+
+# The step of the finite differences of continuous parameters, relative to their value (or to 1 below 1).
+RELATIVE_STEP = 1e-6
+
+
+class Jacobian(NamedTuple):
+    """
+    The derivatives of the outputs of every region with respect to the parameters.
+    """
+
+    parameters: tuple
+    # The unperturbed outputs, keyed by output name, each of shape (region_nb,).
+    values: dict
+    # The derivatives, keyed by output name, each of shape (region_nb, len(parameters)).
+    derivatives: dict
+    # The finite difference step of every parameter.
+    steps: np.ndarray
+
+
+class MorrisIndices(NamedTuple):
+    """
+    Elementary effect statistics, keyed by output name, each of shape (region_nb, len(parameters)).
+    Elementary effects are changes of the output per unit of the normalized parameter range.
+    """
+
+    parameters: tuple
+    mu: dict
+    mu_star: dict
+    sigma: dict
+
+
+class SobolIndices(NamedTuple):
+    """
+    First-order and total Sobol indices, keyed by output name, each of shape (region_nb, len(parameters)).
+    Indices are NaN in regions where the output does not vary over the sampled parameters.
+    """
+
+    parameters: tuple
+    first_order: dict
+    total: dict
+
+
+def _check_parameters(parameters):
+    for name in parameters:
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown parameter: {name}. Use one of {', '.join(PARAMETERS)}.")
+
+
+def simulate_perturbed(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    values=None,
+    deltas=None,
+    from_region=1,
+):
+    """
+    Simulate copies of a scenario whose parameters are changed from region `from_region` on, all in one batch.
+    The regions before `from_region` are simulated once and shared by every copy.
+
+    :param price_calculator: The `CalculatePrice` object the scenario starts from. It is not modified.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param values: Dictionary of the values of parameters, keyed by parameter name, one element per copy.
+    :param deltas: Dictionary of changes added to the parameters, keyed by parameter name, one element per copy.
+    :param from_region: The first region simulated with the changed parameters, starting at 1.
+    :return: `BatchRegionResult` whose arrays have shape (region_nb, copies).
+    """
+    values = values or {}
+    deltas = deltas or {}
+    _check_parameters(list(values) + list(deltas))
+    if not 1 <= from_region <= max(region_nb, 1):
+        raise ValueError(f"from_region must be between 1 and {max(region_nb, 1)}.")
+    sizes = {len(np.atleast_1d(array)) for array in list(values.values()) + list(deltas.values())}
+    if len(sizes) > 1:
+        raise ValueError("All parameters must have the same number of values.")
+    size = sizes.pop() if sizes else 1
+
+    renewed = np.array([monthly_renewals.get(region_i + 1, 0) for region_i in range(region_nb)])
+    sold = np.array([monthly_sales.get(region_i + 1, 0) for region_i in range(region_nb)])
+    prefix_nb = from_region - 1
+
+    batch = BatchCalculatePrice.from_calculator(price_calculator, 1)
+    prefix = batch.run(prefix_nb, renewed[:prefix_nb], sold[:prefix_nb]) if prefix_nb else None
+
+    batch = batch.take(np.zeros(size, dtype=np.intp))
+    for name, value in values.items():
+        setattr(batch, name, np.asarray(value, dtype=float))
+    for name, delta in deltas.items():
+        setattr(batch, name, getattr(batch, name) + np.asarray(delta, dtype=float))
+    rest = batch.run(region_nb - prefix_nb, renewed[prefix_nb:], sold[prefix_nb:])
+    if prefix is None:
+        return rest
+    return BatchRegionResult(
+        *(
+            np.concatenate([np.broadcast_to(shared, (prefix_nb, size)), perturbed])
+            for shared, perturbed in zip(prefix, rest)
+        )
+    )
+
+
+def jacobian(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    parameters=PARAMETERS,
+    from_region=1,
+):
+    """
+    The central finite-difference Jacobian of the start price and renewal price of every region.
+    Continuous parameters are perturbed by `RELATIVE_STEP` of their value and integer parameters by 1;
+    where the price path has a kink, the derivative is the average of the slopes on both sides.
+    `ideal_bulk_proportion` only acts through the whole number of ideal cores sold, so it is perturbed by one
+    ideal core up and down: its derivative is the change of the outputs per unit of proportion between them.
+
+    :param price_calculator: The `CalculatePrice` object the scenario starts from. It is not modified.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param parameters: The parameters to differentiate with respect to, see `PARAMETERS`.
+    :param from_region: The first region in which the parameters are perturbed, starting at 1.
+    :return: The `Jacobian`.
+    """
+    parameters = tuple(parameters)
+    _check_parameters(parameters)
+    offered = price_calculator.config.limit_cores_offered
+    if {"limit_cores_offered", "ideal_bulk_proportion"} & set(parameters) and not offered:
+        raise ValueError("limit_cores_offered must be set to differentiate with respect to it or ideal_bulk_proportion.")
+
+    base = BatchCalculatePrice.from_calculator(price_calculator, 1)
+    # Scenario 0 is unperturbed, scenarios 2i + 1 and 2i + 2 move parameter i up and down.
+    size = 1 + 2 * len(parameters)
+    steps = np.empty(len(parameters))
+    deltas = {}
+    for i, name in enumerate(parameters):
+        value = float(getattr(base, name)[0])
+        if name == "ideal_bulk_proportion":
+            # Halfway between whole numbers of ideal cores, so that rounding cannot change them.
+            ideal = np.floor(value * offered)
+            up, down = (ideal + 1.5) / offered - value, (ideal - 0.5) / offered - value
+            steps[i] = 1 / offered
+        else:
+            steps[i] = 1.0 if name in INTEGER_PARAMETERS else RELATIVE_STEP * max(abs(value), 1.0)
+            up, down = steps[i], -steps[i]
+        delta = np.zeros(size)
+        delta[2 * i + 1] = up
+        delta[2 * i + 2] = down
+        deltas[name] = delta
+    results = simulate_perturbed(
+        price_calculator, region_nb, monthly_renewals, monthly_sales, deltas=deltas, from_region=from_region
+    )
+
+    values, derivatives = {}, {}
+    for output in OUTPUTS:
+        paths = getattr(results, output)
+        values[output] = paths[:, 0].copy()
+        derivatives[output] = (paths[:, 1::2] - paths[:, 2::2]) / (2 * steps)
+    return Jacobian(parameters, values, derivatives, steps)
+
+
+def _scale(unit, bounds):
+    """
+    Map samples of the unit hypercube, of shape (samples, parameters), to the parameter bounds.
+    """
+    samples = {}
+    for i, (name, (low, high)) in enumerate(bounds.items()):
+        values = low + unit[:, i] * (high - low)
+        samples[name] = np.round(values) if name in INTEGER_PARAMETERS else values
+    return samples
+
+
+def morris(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    bounds,
+    trajectories=32,
+    levels=4,
+    rng=None,
+    from_region=1,
+):
+    """
+    Morris screening: elementary effects along random one-at-a-time trajectories through a grid over the bounds.
+    All `trajectories * (len(bounds) + 1)` scenarios are simulated in one batch.
+
+    :param price_calculator: The `CalculatePrice` object the scenario starts from. It is not modified.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param bounds: Dictionary of (low, high) pairs, keyed by parameter name, see `PARAMETERS`.
+    :param trajectories: The number of trajectories.
+    :param levels: The number of grid levels of every parameter, an even number.
+    :param rng: The `np.random.Generator` to draw from.
+    :param from_region: The first region in which the parameters are changed, starting at 1.
+    :return: The `MorrisIndices`.
+    """
+    parameters = tuple(bounds)
+    _check_parameters(parameters)
+    rng = rng if rng is not None else np.random.default_rng()
+    count = len(parameters)
+    delta = levels / (2 * (levels - 1))
+
+    # Every trajectory starts at a grid point from which every parameter can move up by delta,
+    # then moves the parameters one at a time in a random order and direction.
+    start = rng.integers(0, levels // 2, size=(trajectories, count)) / (levels - 1)
+    up = rng.random((trajectories, count)) < 0.5
+    start = np.where(up, start, start + delta)
+    order = np.argsort(rng.random((trajectories, count)), axis=1)
+    signs = np.where(up, 1.0, -1.0)
+
+    points = np.repeat(start[:, None, :], count + 1, axis=1)
+    for step in range(count):
+        moved = order[:, step]
+        change = np.zeros((trajectories, count))
+        change[np.arange(trajectories), moved] = signs[np.arange(trajectories), moved] * delta
+        points[:, step + 1:] += change[:, None, :]
+
+    results = simulate_perturbed(
+        price_calculator,
+        region_nb,
+        monthly_renewals,
+        monthly_sales,
+        values=_scale(points.reshape(-1, count), bounds),
+        from_region=from_region,
+    )
+
+    mu, mu_star, sigma = {}, {}, {}
+    for output in OUTPUTS:
+        paths = getattr(results, output).reshape(region_nb, trajectories, count + 1)
+        # Elementary effect of the parameter moved at every step, in normalized units.
+        effects = np.diff(paths, axis=2) / (signs[np.arange(trajectories)[:, None], order] * delta)
+        by_parameter = np.empty((region_nb, trajectories, count))
+        by_parameter[:, np.arange(trajectories)[:, None], order] = effects
+        mu[output] = by_parameter.mean(axis=1)
+        mu_star[output] = np.abs(by_parameter).mean(axis=1)
+        sigma[output] = by_parameter.std(axis=1, ddof=1) if trajectories > 1 else np.zeros((region_nb, count))
+    return MorrisIndices(parameters, mu, mu_star, sigma)
+
+
+def sobol(
+    price_calculator,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    bounds,
+    samples=1024,
+    rng=None,
+    from_region=1,
+):
+    """
+    Sobol indices with the sampling scheme of Saltelli: first-order indices with the estimator of Saltelli (2010)
+    and total indices with the estimator of Jansen, from uniform samples over the bounds.
+    All `samples * (len(bounds) + 2)` scenarios are simulated in one batch.
+
+    :param price_calculator: The `CalculatePrice` object the scenario starts from. It is not modified.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param bounds: Dictionary of (low, high) pairs, keyed by parameter name, see `PARAMETERS`.
+    :param samples: The number of base samples.
+    :param rng: The `np.random.Generator` to draw from.
+    :param from_region: The first region in which the parameters are changed, starting at 1.
+    :return: The `SobolIndices`.
+    """
+    parameters = tuple(bounds)
+    _check_parameters(parameters)
+    rng = rng if rng is not None else np.random.default_rng()
+    count = len(parameters)
+
+    a = rng.random((samples, count))
+    b = rng.random((samples, count))
+    # A, B, then A with column i taken from B for every parameter i.
+    mixed = np.repeat(a[None], count, axis=0)
+    mixed[np.arange(count), :, np.arange(count)] = b.T
+    unit = np.concatenate([a, b, mixed.reshape(-1, count)])
+
+    results = simulate_perturbed(
+        price_calculator,
+        region_nb,
+        monthly_renewals,
+        monthly_sales,
+        values=_scale(unit, bounds),
+        from_region=from_region,
+    )
+
+    first_order, total = {}, {}
+    for output in OUTPUTS:
+        paths = getattr(results, output)
+        # Centering the outputs does not change the indices, but lowers the error of the first-order estimator.
+        paths = paths - paths[:, :2 * samples].mean(axis=1)[:, None]
+        f_a = paths[:, :samples]
+        f_b = paths[:, samples:2 * samples]
+        f_mixed = paths[:, 2 * samples:].reshape(region_nb, count, samples)
+        variance = np.concatenate([f_a, f_b], axis=1).var(axis=1)[:, None]
+        first = np.mean(f_b[:, None, :] * (f_mixed - f_a[:, None, :]), axis=2)
+        total_effect = 0.5 * np.mean((f_a[:, None, :] - f_mixed) ** 2, axis=2)
+        varies = variance > 1e-12 * np.maximum(np.abs(getattr(results, output)).mean(axis=1)[:, None] ** 2, 1)
+        first_order[output] = np.where(varies, first / np.where(varies, variance, 1), np.nan)
+        total[output] = np.where(varies, total_effect / np.where(varies, variance, 1), np.nan)
+    return SobolIndices(parameters, first_order, total)
@@ -0,0 +1,352 @@
+"""
+Local HTTP/JSON service that runs coretime price simulations for other applications.
+
+    python service.py --port 8000 --workers 4
+
+POST a scenario, in the same format as a scenario file of the command line (see `cli.py`), to `/simulate`:
+
+    curl -X POST localhost:8000/simulate -d '{"regions": 12, "renewals": 30, "sales": 5, "config": {"renewal_bump": 0.1}}'
+
+The response is a JSON list with one object per region, with the columns of `cli.COLUMNS`.
+Identical requests that arrive while a simulation is running share its result, and repeated
+requests are answered from a result cache. `GET /metrics` reports the queue depth, latency and
+cache statistics, as JSON or with `?format=prometheus` in the Prometheus text format.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from cli import COLUMNS, merge_settings, simulate
+from instrument import Metrics
+
+# Largest request body accepted, in bytes.
+MAX_BODY = 1 << 20
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class ServiceBusy(Exception):
+    """
+    Raised when the simulation queue of the service is full.
+    """
+
+
+def simulate_body(config_values, settings):
+    """
+    Run a simulation in a worker process.
+
+    :return: The JSON-encoded results, one object per region.
+    """
+    results = simulate(config_values, settings)
+    return json.dumps(
+        [{column: getattr(result, column) for column in COLUMNS} for result in results]
+    ).encode()
+
+
+def check_config(config_values):
+    """
+    Reject configuration values the simulation cannot run with.
+
+    :param config_values: Dictionary of configuration values, see `cli.DEFAULT_CONFIG`.
+    :raises ValueError: If a length is not positive (the interlude may be empty) or no core is ideally sold.
+    """
+    for key in ("leadin_length", "region_length"):
+        if not config_values[key] > 0:
+            raise ValueError(f"{key} must be positive.")
+    if config_values["interlude_length"] < 0:
+        raise ValueError("interlude_length must not be negative.")
+    offered = config_values["limit_cores_offered"]
+    if offered and int((config_values["ideal_bulk_proportion"] or 0) * offered) < 1:
+        raise ValueError("ideal_bulk_proportion * limit_cores_offered must be at least one core.")
+
+
+def scenario_key(config_values, settings):
+    """
+    A canonical key of a simulation request: requests with the same key have the same result.
+    """
+    return json.dumps([config_values, settings], sort_keys=True)
+
+
+class SimulationService:
+    """
+    Asyncio HTTP server that runs simulations on a bounded process pool.
+
+    :param max_workers: The number of worker processes.
+    :param max_queue: The number of simulations that may be running or waiting for a worker; more are rejected with 503.
+    :param cache_entries: The number of results kept in the LRU result cache.
+    :param max_regions: The largest number of regions a request may simulate.
+    :param executor: The executor that runs the simulations, by default a `ProcessPoolExecutor` owned by the service.
+    """
+
+    def __init__(self, max_workers=None, max_queue=256, cache_entries=1024, max_regions=10_000, executor=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.cache_entries = cache_entries
+        self.max_regions = max_regions
+        self.metrics = Metrics()
+        # Latencies of the most recent requests, in seconds.
+        self.latencies = deque(maxlen=1024)
+        self.queue_depth = 0
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._connections = {}
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """
+        Start listening. Use port 0 to pick a free port.
+
+        :return: The port the service listens on.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.port
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Closing the open connections lets their handlers finish instead of being cancelled.
+            for writer in self._connections.values():
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+            await self._server.wait_closed()
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    async def simulate(self, payload):
+        """
+        Simulate a scenario payload, sharing the result with identical requests in flight and caching it.
+
+        :param payload: Dictionary of scenario settings, see `cli.merge_settings`.
+        :return: The JSON-encoded results.
+        """
+        config_values, settings = merge_settings(payload, "request")
+        regions = settings["regions"]
+        if not isinstance(regions, int) or not 0 <= regions <= self.max_regions:
+            raise ValueError(f"regions must be an integer between 0 and {self.max_regions}.")
+        check_config(config_values)
+        key = scenario_key(config_values, settings)
+
+        body = self._results.get(key)
+        if body is not None:
+            self._results.move_to_end(key)
+            self.metrics.increment("cache_hits")
+            return body
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.metrics.increment("coalesced")
+        else:
+            if self.queue_depth >= self.max_queue:
+                raise ServiceBusy("Too many simulations queued.")
+            self.metrics.increment("computations")
+            # The slot is taken before the task first runs, so that requests arriving meanwhile see it.
+            self.queue_depth += 1
+            task = asyncio.ensure_future(self._compute(key, config_values, settings))
+            self._in_flight[key] = task
+        # A client that goes away does not cancel the simulation shared with the others.
+        return await asyncio.shield(task)
+
+    async def _compute(self, key, config_values, settings):
+        # `simulate` has already counted the simulation in `queue_depth`.
+        try:
+            start = time.perf_counter()
+            body = await asyncio.get_running_loop().run_in_executor(
+                self._executor, simulate_body, config_values, settings
+            )
+            self.metrics.add_time("simulation", time.perf_counter() - start)
+        finally:
+            self.queue_depth -= 1
+            del self._in_flight[key]
+
+        self._results[key] = body
+        while len(self._results) > self.cache_entries:
+            self._results.popitem(last=False)
+        return body
+
+    def stats(self):
+        """
+        :return: Dictionary with the queue depth, latency percentiles (in seconds) and counters.
+        """
+        latencies = sorted(self.latencies)
+        if len(latencies) >= 2:
+            p50, p95, p99 = (statistics.quantiles(latencies, n=100)[q - 1] for q in (50, 95, 99))
+        else:
+            p50 = p95 = p99 = latencies[0] if latencies else 0.0
+        metrics = self.metrics.as_dict()
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": len(self._in_flight),
+            "cached_results": len(self._results),
+            "latency_seconds": {"p50": p50, "p95": p95, "p99": p99},
+            **metrics,
+        }
+
+    def prometheus(self, prefix="coretime_service_"):
+        """
+        The statistics in the Prometheus text exposition format.
+        """
+        stats = self.stats()
+        lines = []
+        for name in ("queue_depth", "in_flight", "cached_results"):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {stats[name]}")
+        lines.append(f"# TYPE {prefix}latency_seconds summary")
+        for quantile in ("p50", "p95", "p99"):
+            lines.append(
+                f'{prefix}latency_seconds{{quantile="0.{quantile[1:]}"}} {stats["latency_seconds"][quantile]!r}'
+            )
+        return "\n".join(lines) + "\n" + self.metrics.to_prometheus(prefix)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request line."}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    if version == "HTTP/1.1"
+                    else headers.get("connection", "").lower() == "keep-alive"
+                )
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "Invalid Content-Length."}, keep_alive=False)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"error": "Request body too large."}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                start = time.perf_counter()
+                status, response, content_type = await self._dispatch(method, target, body)
+                await self._respond(writer, status, response, keep_alive, content_type)
+                self.latencies.append(time.perf_counter() - start)
+                self.metrics.increment(f"responses_{status}")
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    async def _dispatch(self, method, target, body):
+        """
+        :return: Tuple of (status, response body, content type).
+        """
+        path, _, query = target.partition("?")
+        if path == "/simulate":
+            if method != "POST":
+                return 405, {"error": "Use POST."}, None
+            try:
+                payload = json.loads(body)
+                if not isinstance(payload, dict):
+                    raise ValueError("The scenario must be a JSON object.")
+                return 200, await self.simulate(payload), None
+            except ServiceBusy as e:
+                return 503, {"error": str(e)}, None
+            except (ValueError, TypeError, KeyError) as e:
+                return 400, {"error": str(e)}, None
+            except Exception as e:
+                # The connection stays usable whatever went wrong in the simulation.
+                return 500, {"error": f"Simulation failed: {type(e).__name__}: {e}"}, None
+        if path == "/metrics":
+            if "format=prometheus" in query.split("&"):
+                return 200, self.prometheus().encode(), "text/plain; version=0.0.4"
+            return 200, self.stats(), None
+        if path == "/health":
+            return 200, {"status": "ok"}, None
+        return 404, {"error": f"Unknown path: {path}"}, None
+
+    async def _respond(self, writer, status, body, keep_alive, content_type=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        head = (
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            f"Content-Type: {content_type or 'application/json'}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host, port, **options):
+    service = SimulationService(**options)
+    await service.start(host, port)
+    print(f"Serving simulations on http://{host}:{service.port}", file=sys.stderr)
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, by default the number of CPUs.")
+    parser.add_argument("--max-queue", type=int, default=256, help="Number of simulations that may be queued before requests are rejected.")
+    parser.add_argument("--cache-entries", type=int, default=1024, help="Number of results kept in the result cache.")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(
+            serve(
+                args.host,
+                args.port,
+                max_workers=args.workers,
+                max_queue=args.max_queue,
+                cache_entries=args.cache_entries,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+Persistent store of sweep results in memory-mapped NumPy files.
+
+A store is a directory holding
+- `results.npy`: the per-region results of every scenario, float64 of shape (scenarios, regions, len(RESULT_COLUMNS)),
+- `settings.npy`: the settings of every scenario, float64 of shape (scenarios, len(SETTINGS)),
+- `done.npy`: whether the results of a scenario have been computed,
+- `hashes.npy` and `rows.npy`: the scenario hashes in increasing order and the rows they belong to,
+- `meta.json`: the number of regions and the renewal/sales schedule shared by all scenarios.
+
+Opening a store only maps the files, so it takes milliseconds whatever the number of scenarios, and
+`ResultStore.column` and `ResultStore.results` slice the mapped arrays without copying them.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from engine import SALE_START, RegionCurve, RegionResult
+from scenario import Scenario
+from sweep import RESULT_COLUMNS, simulate_scenario
+
+# The settings of a scenario, see `Scenario.as_dict`, and the type they are restored to.
+SETTINGS = (
+    ("interlude_length", int),
+    ("leadin_length", int),
+    ("region_length", int),
+    ("ideal_bulk_proportion", float),
+    ("limit_cores_offered", int),
+    ("renewal_bump", float),
+    ("linear", bool),
+    ("factor", int),
+    ("price", float),
+    ("initial_bought_price", float),
+)
+
+FILES = ("results", "settings", "done", "hashes", "rows")
+
+
+def _settings_values(scenario):
+    values = scenario.as_dict()
+    return [np.nan if values[name] is None else values[name] for name, _ in SETTINGS]
+
+
+def settings_row(scenario):
+    """
+    The settings of a scenario as a float64 row of `settings.npy`, with NaN for a missing core limit.
+    """
+    # Adding 0 turns -0.0 into 0.0, so that equal settings have equal bytes.
+    return np.array(_settings_values(scenario), dtype=float) + 0.0
+
+
+def row_hash(row):
+    """
+    The 64-bit hash of a settings row.
+    """
+    return int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=8).digest(), "little")
+
+
+def _setting(value, kind):
+    if np.isnan(value):
+        return None
+    if kind is bool:
+        return bool(value)
+    if kind is int and float(value).is_integer():
+        return int(value)
+    return float(value)
+
+
+class ResultStore:
+    """
+    A store of per-scenario, per-region sweep results, see the module documentation for the layout.
+
+    :param path: The directory of the store, see `ResultStore.create`.
+    :param writable: Whether the results may be written, which `compute` needs.
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        self.writable = writable
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["columns"] != RESULT_COLUMNS or meta["settings"] != [name for name, _ in SETTINGS]:
+            raise ValueError(f"{path} was written with different result columns or settings.")
+        self.region_nb = meta["region_nb"]
+        self.sale_start = meta["sale_start"]
+        self.schedule = [tuple(pair) for pair in meta["schedule"]]
+        mode = "r+" if writable else "r"
+        for name in FILES:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode))
+
+    @classmethod
+    def create(cls, path, scenarios, region_nb, monthly_renewals, monthly_sales, sale_start=SALE_START):
+        """
+        Create an empty store for the results of `scenarios`, to be filled by `compute`.
+
+        :param path: The directory of the store. It is created if it does not exist.
+        :param scenarios: Iterable of `Scenario`, e.g. from `scenario_grid`.
+        :param region_nb: The number of regions to simulate.
+        :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+        :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+        :param sale_start: The first block of the first region.
+        :return: The writable `ResultStore`.
+        """
+        settings = np.array([_settings_values(scenario) for scenario in scenarios], dtype=float) + 0.0
+        settings = settings.reshape(len(settings), len(SETTINGS))
+        hashes = np.array([row_hash(row) for row in settings], dtype=np.uint64)
+        order = np.argsort(hashes, kind="stable")
+
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            "settings": settings,
+            "done": np.zeros(len(settings), dtype=bool),
+            "hashes": hashes[order],
+            "rows": order.astype(np.int64),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+        results = np.lib.format.open_memmap(
+            os.path.join(path, "results.npy"),
+            mode="w+",
+            dtype=float,
+            shape=(len(settings), region_nb, len(RESULT_COLUMNS)),
+        )
+        results[:] = np.nan
+        results.flush()
+        del results
+
+        schedule = [
+            (monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0))
+            for region_i in range(region_nb)
+        ]
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "region_nb": region_nb,
+                    "sale_start": sale_start,
+                    "schedule": schedule,
+                    "columns": RESULT_COLUMNS,
+                    "settings": [name for name, _ in SETTINGS],
+                },
+                f,
+            )
+        return cls(path, writable=True)
+
+    def __len__(self):
+        return len(self.settings)
+
+    def __contains__(self, scenario):
+        return self.find(scenario) is not None
+
+    def find(self, scenario):
+        """
+        The row of a scenario, by binary search of its hash.
+
+        :return: The row, or None if the scenario is not in the store.
+        """
+        row = settings_row(scenario)
+        key = np.uint64(row_hash(row))
+        start = np.searchsorted(self.hashes, key, side="left")
+        end = np.searchsorted(self.hashes, key, side="right")
+        for i in self.rows[start:end]:
+            if np.array_equal(self.settings[i], row, equal_nan=True):
+                return int(i)
+        return None
+
+    def covers(self, region_nb, monthly_renewals, monthly_sales):
+        """
+        Whether the store holds `region_nb` regions simulated with the given renewal/sales schedule.
+        """
+        return region_nb <= self.region_nb and all(
+            self.schedule[region_i]
+            == (monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0))
+            for region_i in range(region_nb)
+        )
+
+    def scenario(self, row):
+        """
+        The `Scenario` of a row.
+        """
+        values = {
+            name: _setting(value, kind) for (name, kind), value in zip(SETTINGS, self.settings[row].tolist())
+        }
+        config_values = {key: value for key, value in values.items() if key not in Scenario.__dataclass_fields__}
+        scenario_values = {key: value for key, value in values.items() if key in Scenario.__dataclass_fields__}
+        return Scenario(config=Config(**config_values), **scenario_values)
+
+    def column(self, name):
+        """
+        A result column of every scenario and region, without copying.
+
+        :param name: One of `RESULT_COLUMNS`.
+        :return: Array of shape (scenarios, regions), mapped from the store.
+        """
+        return self.results[:, :, RESULT_COLUMNS.index(name)]
+
+    def setting(self, name):
+        """
+        A setting of every scenario, without copying.
+
+        :param name: One of the names of `SETTINGS`.
+        :return: Array with one value per scenario, mapped from the store.
+        """
+        return self.settings[:, [setting for setting, _ in SETTINGS].index(name)]
+
+    def compute(self, max_workers=None, chunksize=64, batch=4096):
+        """
+        Simulate the scenarios that have not been computed yet, `batch` scenarios at a time.
+        Every finished batch is flushed to disk, so an interrupted sweep resumes where it stopped.
+
+        :param max_workers: The number of worker processes. With 1 the sweep runs in the current process.
+        :param chunksize: The number of scenarios sent to a worker at once.
+        :param batch: The number of scenarios simulated between flushes.
+        :return: The number of scenarios computed.
+        """
+        if not self.writable:
+            raise ValueError("The store is opened read-only.")
+        worker = partial(
+            simulate_scenario,
+            region_nb=self.region_nb,
+            monthly_renewals={i + 1: renewed for i, (renewed, _) in enumerate(self.schedule)},
+            monthly_sales={i + 1: sold for i, (_, sold) in enumerate(self.schedule)},
+        )
+        pending = np.flatnonzero(~self.done)
+        executor = None if max_workers == 1 else ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            for start in range(0, len(pending), batch):
+                rows = pending[start:start + batch]
+                scenarios = [self.scenario(row) for row in rows]
+                if executor is None:
+                    results = [worker(scenario) for scenario in scenarios]
+                else:
+                    results = list(executor.map(worker, scenarios, chunksize=chunksize))
+                self.results[rows] = np.array(results, dtype=float).reshape(
+                    len(rows), self.region_nb, len(RESULT_COLUMNS)
+                )
+                self.results.flush()
+                self.done[rows] = True
+                self.done.flush()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return len(pending)
+
+    def to_frame(self, rows=None):
+        """
+        The results of some scenarios as a DataFrame laid out like the one of `sweep.run_sweep`.
+
+        :param rows: The rows to include, all of them by default.
+        :return: DataFrame with one row per scenario and region.
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        region_nb = self.region_nb
+        settings = pd.DataFrame(self.settings[rows], columns=[name for name, _ in SETTINGS])
+        for name, kind in SETTINGS:
+            if kind is bool:
+                settings[name] = settings[name].astype(bool)
+        df = settings.loc[settings.index.repeat(region_nb)].reset_index(drop=True)
+        df.insert(0, "region", np.tile(np.arange(1, region_nb + 1), len(rows)))
+        df.insert(0, "scenario", np.repeat(rows, region_nb))
+        values = self.results[rows].reshape(len(rows) * region_nb, len(RESULT_COLUMNS))
+        for i, column in enumerate(RESULT_COLUMNS):
+            df[column] = values[:, i]
+        return df
+
+    def curves(self, row, region_nb=None):
+        """
+        The per-block price curves of a stored scenario, without simulating it again: the curve of a region
+        only depends on its start price and the renewal price of the region before it.
+
+        :param row: The row of the scenario, see `find`.
+        :param region_nb: The number of regions, all of them by default.
+        :return: List of `RegionCurve`, one per region.
+        """
+        if not self.done[row]:
+            raise ValueError(f"Scenario {row} has not been computed.")
+        region_nb = self.region_nb if region_nb is None else region_nb
+        scenario = self.scenario(row)
+        calculator = scenario.create_calculator()
+        config = scenario.config
+        renewal_price = scenario.initial_bought_price
+        curves = []
+        for region_i, (start_price, next_renewal_price, sellout_price) in enumerate(
+            self.results[row, :region_nb].tolist()
+        ):
+            region_start = self.sale_start + region_i * config.region_length
+            calculator.price = start_price
+            calculator.initial_bought_price = renewal_price
+            blocks, prices = calculator.calculate_region_curve(region_start)
+            blocks.flags.writeable = False
+            prices.flags.writeable = False
+            result = RegionResult(
+                region=region_i + 1,
+                region_start=region_start,
+                start_price=start_price,
+                renewal_price=next_renewal_price,
+                sellout_price=None if np.isnan(sellout_price) else sellout_price,
+            )
+            curves.append(RegionCurve(result, blocks, prices))
+            renewal_price = next_renewal_price
+        return curves
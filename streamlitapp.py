@@ -1,18 +1,81 @@
-import numpy as np
-import matplotlib.pyplot as plt
+import os
+from typing import NamedTuple
 import streamlit as st
+import instrument
 from helpercss import create_tooltip
+from cache import SimulationCache
+from config import Config
+from engine import SALE_START
+from render import price_chart
+from scenario import Scenario
+from store import ResultStore
 
 BLOCKS_PER_DAY = 5
-SALE_START = 0
+
+
+@st.cache_resource
+def get_simulation_cache():
+    """
+    The simulation cache shared by all reruns and sessions of the app.
+    """
+    return SimulationCache()
+
+
+@st.cache_resource
+def get_result_store(path):
+    """
+    The result store at `path`, mapped once and shared by all reruns and sessions of the app.
+    """
+    return ResultStore(path)
+
+
+class AppInputs(NamedTuple):
+    """
+    The inputs of a rerun of the app. They are immutable, so that nothing a session reads can be changed by another one,
+    and the regions simulated from them are shared by all sessions through `get_simulation_cache`.
+    """
+
+    # The configuration values, as (name, value) pairs.
+    config_values: tuple
+    linear: bool
+    factor: int
+    price: float
+    initial_bought_price: float
+    region_nb: int
+    # The (renewed cores, sold cores) pairs of every region, see `cache.schedule_key`.
+    schedule: tuple
+    # The directory of a result store to plot from, or an empty string.
+    store_path: str = ""
+
+    def config(self):
+        """
+        A new `Config` with the configuration values.
+        """
+        return Config(**dict(self.config_values))
+
+    def scenario(self):
+        return Scenario(
+            config=self.config(),
+            linear=self.linear,
+            factor=self.factor,
+            price=self.price,
+            initial_bought_price=self.initial_bought_price,
+        )
+
+    def monthly_renewals(self):
+        return {region_i + 1: renewed for region_i, (renewed, _) in enumerate(self.schedule)}
+
+    def monthly_sales(self):
+        return {region_i + 1: sold for region_i, (_, sold) in enumerate(self.schedule)}
+
 
 class StreamlitApp:
-    def __init__(self, config, price_calculator):
+    def __init__(self, config):
         """
-        Initialize the Streamlit app with configuration and price calculator.
+        Initialize the Streamlit app with the default configuration, which is never modified.
+        Everything a session changes lives in its inputs (see `AppInputs`) and in `st.session_state`.
         """
         self.config = config
-        self.price_calculator = price_calculator
 
     def _get_config_input(self):
         """
@@ -60,12 +123,11 @@ class StreamlitApp:
         initial_bought_price = st.slider(
             'Y-AXIS - Start Price of the Core You Bought', min_value=0, max_value=10000, value=1000, step=10, help='This represents the initial price of the core you bought in the previous region. If we are comparing it to the graph this would be Region 0.'
         )
-        self.price_calculator.change_bought_price(initial_bought_price)
 
         price = st.slider(
             'Y-AXIS Starting Price', min_value=0, max_value=10000, value=1000, step=10, help='This is the starting price at which the price of the cores are initialized in the when the sales are started by admin.'
         )
-        self.price_calculator.change_initial_price(price)
+        return initial_bought_price, price
 
     def _get_factor_curve_input(self):
         """
@@ -77,14 +139,13 @@ class StreamlitApp:
             linear_text = 'Current value: Linear' if linear else 'Current value: Exponential'
             st.write(linear_text)
 
-            self.price_calculator.change_linear(linear)
             factor_value = st.slider(
                 'Change the Factor Value to see changes in exp or linear.', min_value=1, max_value=10, value=1, step=1,
                 help='Change the factor value for the lead-in factor curve. The defualt value is 1. This factor is not implemented in the `broker pallet` code. It is given as an example of how would an exponential function be implemented if it were to be implemented. '
             )
-            self.price_calculator.change_factor(factor_value)
+        return linear, factor_value
 
-    def _get_cores_input(self, observe_time):
+    def _get_cores_input(self, observe_time, limit_cores_offered):
         """
         Create sliders for setting the number of cores renewed and sold in each sale.
         """
@@ -97,10 +158,10 @@ class StreamlitApp:
             st.markdown("### Constant sales of cores over all regions")
 
             renewed_cores_in_each_sale = st.slider(
-                'Cores renewed in each sale', min_value=0, max_value=self.config.limit_cores_offered, value=10, step=1, help='This represents the number of cores that are renewed in each sale. This is a constant value for all the regions.'
+                'Cores renewed in each sale', min_value=0, max_value=limit_cores_offered, value=10, step=1, help='This represents the number of cores that are renewed in each sale. This is a constant value for all the regions.'
             )
 
-            max_sold_cores = self.config.limit_cores_offered - renewed_cores_in_each_sale
+            max_sold_cores = limit_cores_offered - renewed_cores_in_each_sale
             sold_cores_in_each_sale = 0 if max_sold_cores <= 0 else st.slider(
                 'Cores sold in each sale', min_value=0, max_value=max_sold_cores, value=0, step=1, help='This represents the number of cores that are sold in each sale. This is a constant value for all the regions.'
             )
@@ -113,9 +174,9 @@ class StreamlitApp:
             st.markdown("### Adjustment for each region length (28 days)")
             for month in range(1, observe_time + 1):
                 with st.expander(f"Region {month} Adjustments"):
-                    renewed_cores = st.slider(f'Cores renewed in Month {month}', min_value=0, max_value=self.config.limit_cores_offered, value=10, step=1)
-                    if self.config.limit_cores_offered - renewed_cores > 0:
-                        sold_cores = st.slider(f'Cores sold in Month {month}', min_value=0, max_value=self.config.limit_cores_offered - renewed_cores, value=0, step=1)
+                    renewed_cores = st.slider(f'Cores renewed in Month {month}', min_value=0, max_value=limit_cores_offered, value=10, step=1)
+                    if limit_cores_offered - renewed_cores > 0:
+                        sold_cores = st.slider(f'Cores sold in Month {month}', min_value=0, max_value=limit_cores_offered - renewed_cores, value=0, step=1)
                     else:
                         sold_cores = 0
                     monthly_renewals[month] = renewed_cores
@@ -125,41 +186,93 @@ class StreamlitApp:
         return monthly_renewals, monthly_sales
 
 
-    def _get_slider_input(self):
+    def _get_slider_input(self, config_values):
         """
         Combine all slider inputs into one method.
+
+        :return: The `AppInputs` of the rerun, without a result store.
         """
         observe_time = self._get_observation_time_input()
-        observe_blocks = observe_time * self.config.region_length
-
-        self._get_price_input()
-        self._get_factor_curve_input()
-        monthly_renewals, monthly_sales = self._get_cores_input(observe_time)
-
-        return observe_blocks, monthly_renewals, monthly_sales
-
-    def _plot_sale_price(self, ax, block_times, sale_prices, region_start, label):
-        ax.axvline(x=region_start, color='#F88379', linestyle='--')
-        ax.axvline(x=region_start + self.config.interlude_length, color='#dd3', linestyle='--')
-        ax.axvline(x=region_start + self.config.interlude_length + self.config.leadin_length, color='#097969', linestyle='--')
-        ax.plot(block_times, sale_prices, label=label)
-        ax.axvline(x=region_start + self.config.region_length, color='b', linestyle='--')
+        observe_blocks = observe_time * config_values["region_length"]
+        region_nb = int(observe_blocks / config_values["region_length"])
+
+        initial_bought_price, price = self._get_price_input()
+        linear, factor = self._get_factor_curve_input()
+        monthly_renewals, monthly_sales = self._get_cores_input(observe_time, config_values["limit_cores_offered"])
+
+        return AppInputs(
+            config_values=tuple(config_values.items()),
+            linear=linear,
+            factor=factor,
+            price=price,
+            initial_bought_price=initial_bought_price,
+            region_nb=region_nb,
+            schedule=tuple(
+                (monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0))
+                for region_i in range(region_nb)
+            ),
+        )
 
     def _create_sidebar(self):
         """
         Creates sidebar for configuration input and slider input.
+
+        :return: Tuple of the `AppInputs` of the rerun and whether to collect metrics.
         """
         with st.sidebar:
             st.header("Configuration Settings")
-            # Update the configuration based on user input
-            updated_values = self._get_config_input()
-            self.config.update_config(updated_values)
-            self.price_calculator.update_config(self.config)
+            config_values = {**self.config.as_dict(), **self._get_config_input()}
 
             st.header("Sale Settings")
-            observe_blocks, monthly_renewals, monthly_sales = self._get_slider_input()
+            inputs = self._get_slider_input(config_values)
+
+            with st.expander("Result store"):
+                inputs = inputs._replace(store_path=self._get_store_input())
+
+            self.performance_panel = st.expander("Performance")
+            with self.performance_panel:
+                collect = self._get_performance_input()
 
-        return observe_blocks, monthly_renewals, monthly_sales
+        return inputs, collect
+
+    def _get_store_input(self):
+        """
+        Create an input for the directory of a result store of a finished sweep.
+        """
+        path = st.text_input('Store directory', value='', help='Directory of a result store written by `store.ResultStore`. Scenarios found in the store are plotted from it instead of being simulated.')
+        if not path:
+            return ""
+        if not os.path.isfile(os.path.join(path, "meta.json")):
+            st.warning(f"No result store in {path}.")
+            return ""
+        store = get_result_store(path)
+        st.write("Scenarios: ", len(store), ", regions: ", store.region_nb)
+        return path
+
+    def _get_performance_input(self):
+        """
+        Create a toggle for timing the pricing hot paths of each rerun.
+        """
+        return st.toggle('Collect metrics', value=False, help='Time the pricing hot paths and count the blocks evaluated, regions rotated and cache hits of each rerun. Only the reruns of this session are measured, which adds a small overhead.')
+
+    def _performance_section(self, session_metrics):
+        """
+        Show the metrics of the rerun in the performance panel of the sidebar.
+        """
+        metrics = session_metrics.as_dict()
+        cache = get_simulation_cache()
+        with self.performance_panel:
+            st.dataframe(
+                [
+                    {"phase": name, "calls": timer["calls"], "ms": round(timer["seconds"] * 1000, 3)}
+                    for name, timer in metrics["timers"].items()
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+            for name, value in metrics["counters"].items():
+                st.write(name.replace("_", " ").capitalize(), ": ", value)
+            st.write("Cache entries: ", len(cache), ", hits: ", cache.hits, ", misses: ", cache.misses)
 
     def _explaination_section(self):
         st.markdown("#### 🎉 Welcome to the Coretime Price Simulator! 🎉")
@@ -169,35 +282,66 @@ class StreamlitApp:
         st.markdown(create_tooltip("Yellow-Green: LEADIN PERIOD", "The area between the yellow and green section represents the LEADIN Period, this is the time when new sales occur."), unsafe_allow_html=True)
         st.markdown(create_tooltip("Green-Green: REGION PERIOD", "The area between two green sections represents a REGION Period, This represents the duration of each core allocation following the sale."), unsafe_allow_html=True)
 
-    def _plot_graph(self, observe_blocks, monthly_renewals, monthly_sales):
-        region_nb = int(observe_blocks / self.config.region_length)
-
-        fig, ax = plt.subplots()
-        for region_i in range(region_nb):
-            region_start = SALE_START + region_i * self.config.region_length
-            block_times = np.linspace(region_start, region_start + self.config.region_length, self.config.region_length)
-            
-            sale_prices = [self.price_calculator.calculate_price(region_start, block_now) for block_now in block_times]
-            self._plot_sale_price(ax, block_times, sale_prices, region_start, f'Region {region_i+1}')
+    def _stored_regions(self, inputs):
+        """
+        The regions of the inputs from their result store, or None if it does not hold them.
+        """
+        if not inputs.store_path:
+            return None
+        store = get_result_store(inputs.store_path)
+        if store.sale_start != SALE_START:
+            return None
+        if not store.covers(inputs.region_nb, inputs.monthly_renewals(), inputs.monthly_sales()):
+            return None
+        row = store.find(inputs.scenario())
+        if row is None or not store.done[row]:
+            return None
+        return store.curves(row, inputs.region_nb)
+
+    def _simulate(self, inputs):
+        """
+        The regions of the inputs. The regions of the last rerun of the session are kept in `st.session_state`,
+        and regions are shared with other sessions and reruns through the simulation cache.
+        """
+        last = st.session_state.get("last_simulation")
+        if last is not None and last[0] == inputs:
+            return last[1]
+
+        regions = self._stored_regions(inputs)
+        if regions is None:
+            # Regions are reused from earlier reruns and other sessions up to the first changed input.
+            # The price calculator belongs to this rerun only.
+            regions = get_simulation_cache().simulate(
+                inputs.scenario().create_calculator(),
+                inputs.region_nb,
+                inputs.monthly_renewals(),
+                inputs.monthly_sales(),
+                sale_start=SALE_START,
+            )
+        st.session_state["last_simulation"] = (inputs, regions)
+        return regions
 
-            # Recalculate the price of renewal of the core
-            self.price_calculator.update_renewal_price()
-            # Recalculate the price at the end of each region
-            self.price_calculator.rotate_sale(monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0))
+    def _plot_graph(self, inputs):
+        regions = self._simulate(inputs)
 
-        ax.set_xlabel('Block Time')
-        ax.set_ylabel('Sale Price')
-        ax.set_title('Sale Price over Time')
-        ax.legend()
-        st.pyplot(fig)
+        with instrument.timer("plot"):
+            st.altair_chart(price_chart(inputs.config(), regions), use_container_width=True)
 
     def run(self):
         """
         Run the Streamlit application.
         """
-        observe_blocks, monthly_renewals, monthly_sales = self._create_sidebar()
+        inputs, collect = self._create_sidebar()
 
         st.title('Coretime Sale Price over Time')
 
         self._explaination_section()
-        self._plot_graph(observe_blocks, monthly_renewals, monthly_sales)
+        if collect:
+            # The metrics of this session only, while other sessions keep running unmeasured.
+            session_metrics = st.session_state.setdefault("metrics", instrument.Metrics())
+            session_metrics.reset()
+            with instrument.collect(session_metrics):
+                self._plot_graph(inputs)
+            self._performance_section(session_metrics)
+        else:
+            self._plot_graph(inputs)
@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from engine import RegionEngine
+from scenario import Scenario, scenario_grid
+
+RESULT_COLUMNS = ["start_price", "renewal_price", "sellout_price"]
+
+
+def simulate_scenario(scenario, region_nb, monthly_renewals, monthly_sales):
+    """
+    Run a single scenario for `region_nb` regions.
+
+    :return: Tuple of (start price, renewal price, sellout price) per region.
+    """
+    engine = RegionEngine(scenario.create_calculator())
+    return tuple(
+        (result.start_price, result.renewal_price, result.sellout_price)
+        for result in engine.run(region_nb, monthly_renewals, monthly_sales)
+    )
+
+
+def run_sweep(
+    scenarios,
+    region_nb,
+    monthly_renewals,
+    monthly_sales,
+    max_workers=None,
+    chunksize=64,
+):
+    """
+    Run every scenario and collect the per-region results.
+
+    Scenarios are sent to the worker processes in chunks of `chunksize`, so that small
+    scenarios are not dominated by the cost of inter-process communication.
+
+    :param scenarios: Iterable of `Scenario`, e.g. from `scenario_grid`.
+    :param region_nb: The number of regions to simulate.
+    :param monthly_renewals: Number of cores renewed in each region, keyed by region number starting at 1.
+    :param monthly_sales: Number of cores sold in each region, keyed by region number starting at 1.
+    :param max_workers: The number of worker processes. With 1 the sweep runs in the current process.
+    :param chunksize: The number of scenarios sent to a worker at once.
+    :return: DataFrame with one row per scenario and region.
+    """
+    scenarios = list(scenarios)
+    worker = partial(
+        simulate_scenario,
+        region_nb=region_nb,
+        monthly_renewals=monthly_renewals,
+        monthly_sales=monthly_sales,
+    )
+    if max_workers == 1:
+        results = [worker(scenario) for scenario in scenarios]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(worker, scenarios, chunksize=chunksize))
+
+    values = np.array(
+        [row for result in results for row in result], dtype=float
+    ).reshape(len(scenarios) * region_nb, len(RESULT_COLUMNS))
+
+    settings = pd.DataFrame([scenario.as_dict() for scenario in scenarios])
+    df = settings.loc[settings.index.repeat(region_nb)].reset_index(drop=True)
+    df.insert(0, "region", np.tile(np.arange(1, region_nb + 1), len(scenarios)))
+    df.insert(0, "scenario", np.repeat(np.arange(len(scenarios)), region_nb))
+    for i, column in enumerate(RESULT_COLUMNS):
+        df[column] = values[:, i]
+    return df
@@ -0,0 +1,126 @@
+import unittest
+import numpy as np
+from batch import BatchCalculatePrice
+from config import Config
+from engine import RegionEngine
+from price import CalculatePrice
+
+
+class TestBatchCalculatePrice(unittest.TestCase):
+    def setUp(self):
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20, 5: 0, 6: 45}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0, 5: 3, 6: 5}
+        self.calculators = []
+        for interlude_length, limit_cores_offered, linear, factor in [
+            (35, 50, True, 1),
+            (35, 50, False, 2),
+            (10, 40, True, 3),
+            (0, 50, True, 1),
+            (35, None, False, 1),
+        ]:
+            config = Config(
+                interlude_length=interlude_length,
+                leadin_length=35,
+                region_length=140,
+                ideal_bulk_proportion=0.6,
+                limit_cores_offered=limit_cores_offered,
+                renewal_bump=0.05,
+            )
+            calculator = CalculatePrice(config)
+            calculator.change_linear(linear)
+            calculator.change_factor(factor)
+            self.calculators.append(calculator)
+
+    def test_matches_engine(self):
+        batch = BatchCalculatePrice.from_calculators(self.calculators)
+
+        results = batch.run(6, self.monthly_renewals, self.monthly_sales)
+
+        self.assertEqual(results.start_price.shape, (6, len(self.calculators)))
+        for i, calculator in enumerate(self.calculators):
+            expected = RegionEngine(calculator).run(
+                6, self.monthly_renewals, self.monthly_sales
+            )
+            np.testing.assert_allclose(
+                results.start_price[:, i], [result.start_price for result in expected]
+            )
+            np.testing.assert_allclose(
+                results.renewal_price[:, i], [result.renewal_price for result in expected]
+            )
+            np.testing.assert_allclose(
+                results.sellout_price[:, i], [result.sellout_price for result in expected]
+            )
+            self.assertAlmostEqual(batch.price[i], calculator.price)
+            self.assertAlmostEqual(batch.new_buy_price[i], calculator.new_buy_price)
+
+    def test_per_scenario_schedules(self):
+        batch = BatchCalculatePrice.from_calculator(self.calculators[0], 3)
+        renewals = np.array([[10, 30, 45], [10, 30, 45]])
+        sales = np.array([[0, 5, 5], [0, 5, 5]])
+
+        results = batch.run(2, renewals, sales)
+
+        for i in range(3):
+            calculator = CalculatePrice(self.calculators[0].config)
+            calculator.change_linear(True)
+            expected = RegionEngine(calculator).run(
+                2, {1: renewals[0, i], 2: renewals[1, i]}, {1: sales[0, i], 2: sales[1, i]}
+            )
+            np.testing.assert_allclose(
+                results.start_price[:, i], [result.start_price for result in expected]
+            )
+            self.assertAlmostEqual(batch.price[i], calculator.price)
+
+    def test_run_matches_steps(self):
+        batch = BatchCalculatePrice.from_calculators(self.calculators)
+        stepped = BatchCalculatePrice.from_calculators(self.calculators)
+
+        results = batch.run(6, self.monthly_renewals, self.monthly_sales)
+
+        for region_i in range(6):
+            expected = stepped.step_region(
+                self.monthly_renewals[region_i + 1], self.monthly_sales[region_i + 1]
+            )
+            for values, expected_values in zip(results, expected):
+                np.testing.assert_array_equal(values[region_i], expected_values)
+        for name in ("price", "initial_bought_price", "new_buy_price", "sellout_price", "cores_sold"):
+            np.testing.assert_array_equal(getattr(batch, name), getattr(stepped, name))
+
+    def test_replaced_settings(self):
+        batch = BatchCalculatePrice.from_calculators(self.calculators)
+        batch.run(2, self.monthly_renewals, self.monthly_sales)
+        for calculator in self.calculators:
+            RegionEngine(calculator).run(2, self.monthly_renewals, self.monthly_sales)
+            calculator.change_factor(calculator.factor + 1)
+            calculator.config.limit_cores_offered = 60
+
+        # The factor and the cores offered change the cached lead-in factor and ideal number of cores.
+        batch.factor = batch.factor + 1
+        batch.limit_cores_offered = np.full(len(batch), 60.0)
+        results = batch.run(2, [20, 45], [5, 5])
+
+        for i, calculator in enumerate(self.calculators):
+            engine = RegionEngine(calculator)
+            expected = [engine.step(2, 20, 5), engine.step(3, 45, 5)]
+            np.testing.assert_allclose(
+                results.renewal_price[:, i], [result.renewal_price for result in expected]
+            )
+            np.testing.assert_allclose(results.start_price[:, i], [result.start_price for result in expected])
+
+    def test_take(self):
+        batch = BatchCalculatePrice.from_calculators(self.calculators)
+        batch.run(2, self.monthly_renewals, self.monthly_sales)
+
+        taken = batch.take([1, 1, 3])
+        self.assertEqual(len(taken), 3)
+        np.testing.assert_array_equal(taken.price, batch.price[[1, 1, 3]])
+        np.testing.assert_array_equal(taken.renewal_offset, batch.renewal_offset[[1, 1, 3]])
+
+        # The taken scenarios continue like the originals.
+        expected = batch.run(2, [0, 3], [5, 0])
+        results = taken.run(2, [0, 3], [5, 0])
+        np.testing.assert_array_equal(results.start_price, expected.start_price[:, [1, 1, 3]])
+
+
+if __name__ == "__main__":
+    unittest.main()
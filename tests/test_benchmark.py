@@ -0,0 +1,34 @@
+import unittest
+from benchmark import Benchmark, benchmarks, compare, measure
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_measure(self):
+        benchmark = Benchmark("sum", lambda: lambda: sum(range(1000)), 1000)
+
+        result = measure(benchmark, repeat=2)
+
+        self.assertGreater(result["seconds"], 0)
+        self.assertGreaterEqual(result["peak_bytes"], 0)
+        self.assertAlmostEqual(result["calls_per_second"], 1000 / result["seconds"])
+
+    def test_compare(self):
+        baseline = {"fast": {"seconds": 1.0}, "slow": {"seconds": 1.0}}
+        results = {
+            "fast": {"seconds": 1.1},
+            "slow": {"seconds": 1.5},
+            "new": {"seconds": 9.0},
+        }
+
+        self.assertEqual(compare(results, baseline, threshold=0.2), [("slow", 1.0, 1.5)])
+
+    def test_scenarios_are_unique(self):
+        names = [benchmark.name for benchmark in benchmarks()]
+
+        self.assertEqual(len(names), len(set(names)))
+        self.assertIn("region_loop[production,20]", names)
+        self.assertIn("engine[production,500]", names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import threading
+import unittest
+import numpy as np
+from cache import SimulationCache
+from config import Config
+from engine import region_blocks
+from price import CalculatePrice
+
+
+class TestSimulationCache(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.monthly_renewals = {month: 30 + month for month in range(1, 11)}
+        self.monthly_sales = {month: 5 for month in range(1, 11)}
+
+    def _calculator(self):
+        calculator = CalculatePrice(self.config)
+        calculator.change_linear(True)
+        return calculator
+
+    def _uncached(self, region_nb, monthly_renewals, monthly_sales):
+        calculator = self._calculator()
+        curves = []
+        for region_i in range(region_nb):
+            region_start = region_i * self.config.region_length
+            curves.append(
+                calculator.calculate_region_prices(
+                    region_start, region_blocks(self.config, region_start)
+                )
+            )
+            calculator.update_renewal_price()
+            calculator.rotate_sale(
+                monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0)
+            )
+        return curves, calculator
+
+    def _assert_matches_uncached(self, regions, region_nb, monthly_renewals, monthly_sales):
+        curves, _ = self._uncached(region_nb, monthly_renewals, monthly_sales)
+        self.assertEqual(len(regions), region_nb)
+        for region, curve in zip(regions, curves):
+            np.testing.assert_allclose(region.prices, curve)
+
+    def test_reuses_prefix_when_window_grows(self):
+        cache = SimulationCache()
+
+        cache.simulate(self._calculator(), 4, self.monthly_renewals, self.monthly_sales)
+        calculator = self._calculator()
+        regions = cache.simulate(calculator, 10, self.monthly_renewals, self.monthly_sales)
+
+        self.assertEqual(cache.regions_reused, 4)
+        self.assertEqual(cache.regions_computed, 4 + 6)
+        self._assert_matches_uncached(regions, 10, self.monthly_renewals, self.monthly_sales)
+        _, uncached = self._uncached(10, self.monthly_renewals, self.monthly_sales)
+        self.assertAlmostEqual(calculator.price, uncached.price)
+
+    def test_recomputes_after_changed_region(self):
+        cache = SimulationCache()
+        cache.simulate(self._calculator(), 10, self.monthly_renewals, self.monthly_sales)
+        changed_renewals = {**self.monthly_renewals, 7: 0}
+
+        regions = cache.simulate(self._calculator(), 10, changed_renewals, self.monthly_sales)
+
+        self.assertEqual(cache.regions_reused, 6)
+        self._assert_matches_uncached(regions, 10, changed_renewals, self.monthly_sales)
+
+        cache.simulate(self._calculator(), 10, changed_renewals, self.monthly_sales)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+    def test_different_scenarios_do_not_share_regions(self):
+        cache = SimulationCache()
+        cache.simulate(self._calculator(), 5, self.monthly_renewals, self.monthly_sales)
+        calculator = self._calculator()
+        calculator.change_factor(3)
+
+        cache.simulate(calculator, 5, self.monthly_renewals, self.monthly_sales)
+
+        self.assertEqual(cache.regions_reused, 0)
+        self.assertEqual(len(cache), 2)
+
+    def test_eviction(self):
+        region_bytes = self.config.region_length * 8
+        cache = SimulationCache(max_entries=2, max_bytes=12 * (region_bytes + 512))
+        for renewals in range(3):
+            cache.simulate(self._calculator(), 5, {1: renewals}, {})
+        self.assertEqual(len(cache), 2)
+
+        cache.simulate(self._calculator(), 10, self.monthly_renewals, self.monthly_sales)
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+
+    def test_shared_regions_counted_once(self):
+        region_bytes = self.config.region_length * 8 + 512
+        cache = SimulationCache()
+        cache.simulate(self._calculator(), 10, self.monthly_renewals, self.monthly_sales)
+        for region_nb in range(1, 10):
+            cache.simulate(self._calculator(), region_nb, self.monthly_renewals, self.monthly_sales)
+
+        self.assertEqual(len(cache), 10)
+        self.assertEqual(cache.nbytes, 10 * region_bytes)
+
+        cache.max_entries = 1
+        cache.simulate(self._calculator(), 3, {1: 0}, {})
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.nbytes, 3 * region_bytes)
+
+    def test_concurrent_sessions_share_one_simulation(self):
+        cache = SimulationCache()
+        barrier = threading.Barrier(8)
+        results = [None] * 8
+
+        def session(i):
+            calculator = self._calculator()
+            barrier.wait()
+            results[i] = cache.simulate(calculator, 10, self.monthly_renewals, self.monthly_sales)
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.hits, 7)
+        self.assertEqual(cache.regions_computed, 10)
+        for regions in results:
+            self._assert_matches_uncached(regions, 10, self.monthly_renewals, self.monthly_sales)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import numpy as np
+from calibrate import Calibrator, Point
+from config import Config
+from engine import RegionEngine
+from price import CalculatePrice
+
+
+class TestCalibrator(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.monthly_renewals = {i + 1: int(cores) for i, cores in enumerate(rng.integers(10, 35, 50))}
+        self.monthly_sales = {i + 1: int(cores) for i, cores in enumerate(rng.integers(0, 15, 50))}
+        truth = CalculatePrice(
+            Config(
+                interlude_length=20,
+                leadin_length=35,
+                region_length=140,
+                ideal_bulk_proportion=0.55,
+                limit_cores_offered=50,
+                renewal_bump=0.08,
+            )
+        )
+        truth.change_linear(False)
+        truth.change_factor(2)
+        truth.change_bought_price(3000)
+        results = RegionEngine(truth).run(50, self.monthly_renewals, self.monthly_sales)
+        self.start_prices = [result.start_price for result in results]
+        self.renewal_prices = [result.renewal_price for result in results]
+
+        self.calculator = CalculatePrice(
+            Config(
+                interlude_length=20,
+                leadin_length=35,
+                region_length=140,
+                ideal_bulk_proportion=0.6,
+                limit_cores_offered=50,
+                renewal_bump=0.05,
+            )
+        )
+        self.calculator.change_bought_price(3000)
+
+    def _calibrator(self, **kwargs):
+        return Calibrator(
+            self.calculator, self.monthly_renewals, self.monthly_sales, self.start_prices, self.renewal_prices, **kwargs
+        )
+
+    def test_recovers_parameters(self):
+        calibration = self._calibrator().fit(rng=np.random.default_rng(0))
+
+        self.assertLess(calibration.score, 1e-8)
+        self.assertFalse(calibration.point.linear)
+        self.assertEqual(calibration.point.factor, 2)
+        self.assertAlmostEqual(calibration.point.renewal_bump, 0.08, places=4)
+        # Only the whole number of ideal cores sold matters.
+        self.assertEqual(int(calibration.point.ideal_bulk_proportion * 50), int(0.55 * 50))
+        self.assertEqual(calibration.config.renewal_bump, calibration.point.renewal_bump)
+        self.assertEqual(self.calculator.config.renewal_bump, 0.05)
+
+    def test_coarse_grid(self):
+        for grid in (3, 4):
+            with self.subTest(grid=grid):
+                calibration = self._calibrator().fit(rng=np.random.default_rng(0), grid=grid)
+                self.assertLess(calibration.score, 1e-6)
+                self.assertAlmostEqual(calibration.point.renewal_bump, 0.08, places=3)
+        with self.assertRaises(ValueError):
+            self._calibrator().fit(grid=2)
+
+    def test_refinement_reuses_cache(self):
+        calibrator = self._calibrator()
+        first = calibrator.fit(rng=np.random.default_rng(0))
+        again = calibrator.fit(rng=np.random.default_rng(0))
+        refined = calibrator.fit(rng=np.random.default_rng(0), tolerance=1e-6)
+
+        self.assertEqual(again.evaluations, 0)
+        self.assertEqual(again.point, first.point)
+        self.assertLessEqual(refined.score, first.score)
+        self.assertLess(refined.evaluations, first.evaluations)
+        self.assertEqual(len(calibrator.cache), calibrator.evaluations)
+
+    def test_score_matches_simulation(self):
+        calibrator = self._calibrator()
+        truth = Point(linear=False, factor=2, ideal_bulk_proportion=0.55, renewal_bump=0.08)
+        other = truth._replace(renewal_bump=0.1)
+
+        scores = calibrator.score([truth, other, truth])
+
+        self.assertAlmostEqual(scores[0], 0)
+        self.assertGreater(scores[1], 0)
+        self.assertEqual(calibrator.evaluations, 2)
+        self.assertEqual(calibrator.cache_hits, 1)
+
+    def test_missing_observations(self):
+        self.start_prices[10:20] = [np.nan] * 10
+        calibrator = Calibrator(self.calculator, self.monthly_renewals, self.monthly_sales, self.start_prices)
+
+        score = calibrator.score([Point(linear=False, factor=2, ideal_bulk_proportion=0.55, renewal_bump=0.08)])
+
+        self.assertAlmostEqual(score[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import pyarrow.parquet as pq
+from cli import main, simulate
+from config import Config
+from engine import RegionEngine
+from scenario import Scenario
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_flags_to_csv(self):
+        output = self._path("results.csv")
+
+        main(["--regions", "4", "--renewals", "30,40,20,35", "--sales", "5", "--exponential", "--factor", "2", "-o", output])
+
+        with open(output) as f:
+            rows = list(csv.DictReader(f))
+        scenario = Scenario(
+            Config(35, 35, 140, 0.6, 50, 0.05), linear=False, factor=2
+        )
+        expected = RegionEngine(scenario.create_calculator()).run(
+            4, {1: 30, 2: 40, 3: 20, 4: 35}, {month: 5 for month in range(1, 5)}
+        )
+        self.assertEqual(len(rows), 4)
+        for row, result in zip(rows, expected):
+            self.assertEqual(int(row["region"]), result.region)
+            self.assertAlmostEqual(float(row["start_price"]), result.start_price)
+            self.assertAlmostEqual(float(row["renewal_price"]), result.renewal_price)
+
+    def test_config_file(self):
+        toml_path = self._path("scenario.toml")
+        with open(toml_path, "w") as f:
+            f.write("regions = 3\nrenewals = [30, 35]\nsales = 4\n\n[config]\nideal_bulk_proportion = 0.5\n")
+        json_path = self._path("scenario.json")
+        with open(json_path, "w") as f:
+            json.dump({"regions": 3, "renewals": [30, 35], "sales": 4, "config": {"ideal_bulk_proportion": 0.5}}, f)
+
+        main(["--config", toml_path, "--renewal-bump", "0.1", "-o", self._path("toml.json")])
+        main(["--config", json_path, "--renewal-bump", "0.1", "-o", self._path("json.parquet")])
+
+        with open(self._path("toml.json")) as f:
+            from_toml = json.load(f)
+        from_json = pq.read_table(self._path("json.parquet")).to_pylist()
+        self.assertEqual(len(from_toml), 3)
+        self.assertEqual(from_toml, from_json)
+
+        config_values = {"interlude_length": 35, "leadin_length": 35, "region_length": 140, "ideal_bulk_proportion": 0.5, "limit_cores_offered": 50, "renewal_bump": 0.1}
+        settings = {"regions": 3, "linear": True, "factor": 1, "price": 1000, "initial_bought_price": 1000, "renewals": [30, 35], "sales": 4}
+        self.assertEqual(
+            [result.renewal_price for result in simulate(config_values, settings)],
+            [row["renewal_price"] for row in from_toml],
+        )
+
+    def test_trace(self):
+        main(["--regions", "3", "-o", self._path("results.csv"), "--trace", self._path("trace")])
+
+        self.assertEqual(
+            sorted(os.listdir(self._path("trace"))), ["region=1", "region=2", "region=3"]
+        )
+
+    def test_unknown_file_setting(self):
+        json_path = self._path("scenario.json")
+        with open(json_path, "w") as f:
+            json.dump({"observe": 3}, f)
+
+        with self.assertRaises(ValueError):
+            main(["--config", json_path])
+
+    def test_metrics(self):
+        metrics_output = self._path("metrics.json")
+
+        main(["--regions", "3", "-o", self._path("results.csv"), "--metrics", "json", "--metrics-output", metrics_output])
+
+        with open(metrics_output) as f:
+            metrics = json.load(f)
+        self.assertEqual(metrics["timers"]["region_step"]["calls"], 3)
+        self.assertEqual(metrics["counters"]["regions_rotated"], 3)
+        self.assertIn("simulate_regions", metrics["timers"])
+
+    def test_no_ui_imports(self):
+        code = "import sys, cli; print(sorted(m for m in ('streamlit', 'matplotlib', 'altair', 'pandas') if m in sys.modules))"
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout
+
+        self.assertEqual(output.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
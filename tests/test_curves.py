@@ -0,0 +1,195 @@
+import threading
+import unittest
+import numpy as np
+from batch import BatchCalculatePrice
+from cache import SimulationCache
+from config import Config
+from curves import CURVES, CurveRegistry
+from engine import RegionEngine
+from poly import Linear, Exponential
+from price import CalculatePrice
+
+
+def _step(when, factor=1):
+    return np.where(np.asarray(when) < 0.5, 1 + factor, 1.0) if isinstance(when, np.ndarray) else (1 + factor if when < 0.5 else 1.0)
+
+
+class TestCurveRegistry(unittest.TestCase):
+    def test_table(self):
+        registry = CurveRegistry()
+        registry.register("linear", Linear.leadin_factor_at)
+        registry.register("exponential", Exponential.leadin_factor_at)
+
+        table = registry.table("exponential", 3, 35)
+
+        self.assertEqual(len(table), 36)
+        for num in (0, 7, 35):
+            self.assertAlmostEqual(table[num], Exponential.leadin_factor_at(num / 35, 3))
+        self.assertIs(registry.table("exponential", 3, 35), table)
+        self.assertEqual((registry.hits, registry.misses), (1, 1))
+        with self.assertRaises(ValueError):
+            table[0] = 0
+
+    def test_leadin_factor_whole_and_fractional_blocks(self):
+        registry = CurveRegistry()
+        registry.register("linear", Linear.leadin_factor_at)
+        num = np.array([0, 3, 10, 35])
+
+        np.testing.assert_allclose(
+            registry.leadin_factor("linear", 2, 35, num), Linear.leadin_factor_at(num / 35, 2)
+        )
+        self.assertEqual(registry.misses, 1)
+        self.assertAlmostEqual(
+            registry.leadin_factor("linear", 2, 35, 3.5), Linear.leadin_factor_at(3.5 / 35, 2)
+        )
+        self.assertEqual(registry.misses, 1)
+
+    def test_scalars_bypass_tables(self):
+        registry = CurveRegistry()
+        registry.register("exponential", Exponential.leadin_factor_at)
+
+        self.assertEqual(registry.leadin_factor("exponential", 2, 35, 7), Exponential.leadin_factor_at(7 / 35, 2))
+        self.assertEqual((registry.hits, registry.misses), (0, 0))
+
+    def test_grid_table(self):
+        registry = CurveRegistry()
+        registry.register("linear", Linear.leadin_factor_at)
+        num = np.linspace(0, 35, 10)
+
+        table = registry.grid_table("linear", 2, 35, "grid", lambda: num)
+
+        np.testing.assert_array_equal(table, Linear.leadin_factor_at(num / 35, 2))
+        self.assertIs(registry.grid_table("linear", 2, 35, "grid", lambda: None), table)
+        self.assertEqual((registry.hits, registry.misses), (1, 1))
+        registry.unregister("linear")
+        with self.assertRaises(ValueError):
+            registry.grid_table("linear", 2, 35, "grid", lambda: num)
+
+    def test_eviction(self):
+        registry = CurveRegistry(max_tables=2)
+        registry.register("linear", Linear.leadin_factor_at)
+        for leadin_length in (10, 20, 30):
+            registry.table("linear", 1, leadin_length)
+
+        registry.table("linear", 1, 10)
+
+        self.assertEqual(registry.misses, 4)
+        registry.register("linear", Linear.leadin_factor_at)
+        registry.table("linear", 1, 10)
+        self.assertEqual(registry.misses, 5)
+
+    def test_least_recently_used_eviction(self):
+        registry = CurveRegistry(max_tables=2)
+        registry.register("linear", Linear.leadin_factor_at)
+        first = registry.table("linear", 1, 10)
+        registry.table("linear", 1, 20)
+
+        self.assertIs(registry.table("linear", 1, 10), first)
+        registry.table("linear", 1, 30)
+
+        self.assertIs(registry.table("linear", 1, 10), first)
+        self.assertEqual(registry.misses, 3)
+
+    def test_concurrent_hits_counted(self):
+        registry = CurveRegistry()
+        registry.register("linear", Linear.leadin_factor_at)
+        registry.table("linear", 1, 10)
+
+        def lookups():
+            for _ in range(2_000):
+                registry.table("linear", 1, 10)
+
+        threads = [threading.Thread(target=lookups) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((registry.hits, registry.misses), (16_000, 1))
+
+    def test_replaced_curve_table_not_cached(self):
+        registry = CurveRegistry()
+
+        def replaced_while_computing(when, factor):
+            registry.register("curve", Exponential.leadin_factor_at)
+            return Linear.leadin_factor_at(when, factor)
+
+        registry.register("curve", replaced_while_computing)
+        registry.table("curve", 2, 10)
+
+        np.testing.assert_array_equal(
+            registry.table("curve", 2, 10), Exponential.leadin_factor_at(np.arange(11) / 10, 2)
+        )
+        self.assertEqual(registry.generation("curve"), 2)
+
+    def test_unknown_curve(self):
+        with self.assertRaises(ValueError):
+            CurveRegistry().get("quadratic")
+
+
+class TestRegisteredCurve(unittest.TestCase):
+    def setUp(self):
+        CURVES.register("step", _step)
+        self.addCleanup(CURVES.unregister, "step")
+        self.config = Config(
+            interlude_length=35,
+            leadin_length=35,
+            region_length=140,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+
+    def test_calculate_price_with_registered_curve(self):
+        calculator = CalculatePrice(self.config)
+        calculator.change_curve("step")
+        calculator.change_factor(3)
+
+        self.assertEqual(calculator.calculate_price(0, 40), 4000)
+        self.assertEqual(calculator.calculate_price(0, 60), 1000)
+        np.testing.assert_allclose(
+            calculator.calculate_region_prices(0, np.array([40, 60])), [4000, 1000]
+        )
+        with self.assertRaises(ValueError):
+            calculator.change_curve("quadratic")
+
+    def test_region_curve_uses_grid_table(self):
+        calculator = CalculatePrice(self.config)
+        calculator.change_curve("step")
+        misses = CURVES.misses
+
+        for region_i in range(3):
+            region_start = region_i * self.config.region_length
+            blocks, prices = calculator.calculate_region_curve(region_start)
+            expected = calculator.fork().calculate_region_prices(region_start, blocks)
+            np.testing.assert_allclose(prices, expected)
+
+        self.assertEqual(CURVES.misses, misses + 1)
+
+    def test_simulation_cache_sees_replaced_curve(self):
+        cache = SimulationCache()
+        calculator = CalculatePrice(self.config)
+        calculator.change_curve("step")
+        before = cache.simulate(calculator.fork(), 2, {1: 30}, {1: 5})
+
+        CURVES.register("step", lambda when, factor=1: _step(when, 2 * factor))
+        after = cache.simulate(calculator.fork(), 2, {1: 30}, {1: 5})
+
+        self.assertEqual(cache.misses, 2)
+        self.assertGreater(after[0].prices.max(), before[0].prices.max())
+
+    def test_batch_with_registered_curve(self):
+        calculator = CalculatePrice(self.config)
+        calculator.change_curve("step")
+        batch = BatchCalculatePrice.from_calculator(calculator, 2)
+
+        results = batch.run(3, {1: 30, 2: 45, 3: 10}, {1: 5, 2: 5, 3: 5})
+
+        expected = RegionEngine(calculator).run(3, {1: 30, 2: 45, 3: 10}, {1: 5, 2: 5, 3: 5})
+        np.testing.assert_allclose(
+            results.renewal_price[:, 0], [result.renewal_price for result in expected]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from config import Config
+from price import CalculatePrice
+from engine import RegionEngine, region_blocks
+
+
+class TestRegionEngine(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20, 5: 0, 6: 45, 7: 30, 8: 10}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0, 5: 3, 6: 5, 7: 0, 8: 20}
+
+    def _per_block(self, calculator, region_nb):
+        results = []
+        for region_i in range(region_nb):
+            region_start = region_i * self.config.region_length
+            for block_now in region_blocks(self.config, region_start):
+                calculator.calculate_price(region_start, block_now)
+            start_price = calculator.price
+            sellout_price = calculator.sellout_price
+            calculator.update_renewal_price()
+            results.append(
+                (start_price, calculator.initial_bought_price, sellout_price)
+            )
+            calculator.rotate_sale(
+                self.monthly_renewals.get(region_i + 1, 0),
+                self.monthly_sales.get(region_i + 1, 0),
+            )
+        return results
+
+    def _assert_matches_per_block(self, linear, factor, initial_bought_price):
+        region_nb = 10
+        per_block = CalculatePrice(config=self.config)
+        stepped = CalculatePrice(config=self.config)
+        for calculator in (per_block, stepped):
+            calculator.change_linear(linear)
+            calculator.change_factor(factor)
+            calculator.change_bought_price(initial_bought_price)
+
+        expected = self._per_block(per_block, region_nb)
+        results = RegionEngine(stepped).run(
+            region_nb, self.monthly_renewals, self.monthly_sales
+        )
+
+        self.assertEqual([result.region for result in results], list(range(1, 11)))
+        for result, (start_price, renewal_price, sellout_price) in zip(results, expected):
+            self.assertAlmostEqual(result.start_price, start_price)
+            self.assertAlmostEqual(result.renewal_price, renewal_price)
+            self.assertAlmostEqual(result.sellout_price, sellout_price)
+        for attribute in ("price", "initial_bought_price", "new_buy_price", "sellout_price"):
+            self.assertAlmostEqual(
+                getattr(stepped, attribute), getattr(per_block, attribute)
+            )
+
+    def test_matches_per_block_linear(self):
+        self._assert_matches_per_block(linear=True, factor=1, initial_bought_price=1000)
+
+    def test_matches_per_block_exponential(self):
+        self._assert_matches_per_block(linear=False, factor=2, initial_bought_price=300)
+
+    def test_matches_per_block_long_interlude(self):
+        self.config.update_config({"interlude_length": 30 * 5})
+        self._assert_matches_per_block(linear=True, factor=1, initial_bought_price=1500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pyarrow.dataset as ds
+from config import Config
+from engine import region_blocks
+from export import export_trace, trace_batches
+from price import CalculatePrice
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.monthly_renewals = {1: 30, 2: 40, 3: 20}
+        self.monthly_sales = {1: 5, 2: 5, 3: 0}
+
+    def _calculator(self):
+        calculator = CalculatePrice(self.config)
+        calculator.change_linear(True)
+        return calculator
+
+    def test_trace_batches(self):
+        batches = list(
+            trace_batches(self._calculator(), 3, self.monthly_renewals, self.monthly_sales, batch_rows=50)
+        )
+
+        self.assertTrue(all(batch.num_rows <= 50 for batch in batches))
+        self.assertEqual(sum(batch.num_rows for batch in batches), 3 * self.config.region_length)
+
+        calculator = self._calculator()
+        first_region = [batch for batch in batches if batch.column(0)[0].as_py() == 1]
+        prices = np.concatenate([batch.column(3).to_numpy() for batch in first_region])
+        np.testing.assert_allclose(
+            prices, calculator.calculate_region_prices(0, region_blocks(self.config, 0))
+        )
+        phases = np.concatenate(
+            [batch.column(2).to_pylist() for batch in first_region]
+        )
+        blocks = region_blocks(self.config, 0)
+        np.testing.assert_array_equal(phases[blocks < 35], "interlude")
+        np.testing.assert_array_equal(phases[(blocks >= 35) & (blocks < 70)], "leadin")
+        np.testing.assert_array_equal(phases[blocks >= 70], "fixed")
+
+    def test_export_trace(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rows = export_trace(
+                directory,
+                self._calculator(),
+                3,
+                self.monthly_renewals,
+                self.monthly_sales,
+                batch_rows=64,
+            )
+
+            self.assertEqual(rows, 3 * self.config.region_length)
+            self.assertEqual(sorted(os.listdir(directory)), ["region=1", "region=2", "region=3"])
+            dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+            table = dataset.to_table(filter=ds.field("region") == 2).sort_by("block")
+
+            calculator = self._calculator()
+            expected = list(
+                trace_batches(calculator, 2, self.monthly_renewals, self.monthly_sales)
+            )[-1]
+            self.assertEqual(table.num_rows, self.config.region_length)
+            np.testing.assert_allclose(table.column("price").to_numpy(), expected.column(3).to_numpy())
+            np.testing.assert_allclose(
+                table.column("sellout_price").to_numpy(), expected.column(5).to_numpy()
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import math
+import unittest
+import numpy as np
+from batch import BatchCalculatePrice
+from config import Config
+from engine import renewal_offset
+from fixed import ACCURACY, NO_PRICE, FixedBatchCalculatePrice, from_rational, mul_int, perbill_mul
+from price import CalculatePrice
+
+
+def _nearest(numerator, denominator):
+    # Nearest integer, halves down.
+    quotient, remainder = divmod(numerator, denominator)
+    return quotient + (2 * remainder > denominator)
+
+
+def _reference(calculator, region_nb, monthly_renewals, monthly_sales, unit):
+    """
+    The start and renewal prices of a scenario stepped with Python integers, region by region.
+    """
+    config = calculator.config
+    bump = round(config.renewal_bump * ACCURACY)
+    offered = config.limit_cores_offered or 0
+    ideal = _nearest(round(config.ideal_bulk_proportion * ACCURACY) * offered, ACCURACY)
+    offset = renewal_offset(config)
+    price = round(calculator.price * unit)
+    bought = round(calculator.initial_bought_price * unit)
+    new_buy = round(calculator.new_buy_price * unit)
+    sellout = NO_PRICE if calculator.sellout_price is None else round(calculator.sellout_price * unit)
+    renewed, sold = calculator.cores_sold_in_renewal, calculator.cores_sold_in_sale
+    block = None if offset is None else min(math.floor(offset), config.leadin_length)
+    through = _nearest((block or 0) * ACCURACY, config.leadin_length)
+    if calculator.linear:
+        factor = ACCURACY + calculator.factor * (ACCURACY - through)
+    else:
+        factor = ACCURACY
+        for _ in range(calculator.factor):
+            factor = _nearest(factor * (2 * ACCURACY - through), ACCURACY)
+
+    start_prices, renewal_prices = [], []
+    for region_i in range(region_nb):
+        cap = bought + _nearest(bump * bought, ACCURACY)
+        if block is not None:
+            new_buy = min(cap, factor * price // ACCURACY)
+        if (renewed <= ideal and sold > 0) or sellout == NO_PRICE:
+            sellout = price
+        start_prices.append(price)
+        bought = min(cap, new_buy)
+        renewal_prices.append(bought)
+
+        renewed, sold = monthly_renewals.get(region_i + 1, 0), monthly_sales.get(region_i + 1, 0)
+        cores_sold = renewed + sold
+        purchase_price = sellout if cores_sold >= ideal else price
+        if offered and purchase_price != NO_PRICE:
+            if cores_sold <= ideal:
+                adapt = _nearest(max(cores_sold, 1) * ACCURACY, max(ideal, 1))
+            else:
+                adapt = ACCURACY + _nearest((cores_sold - ideal) * ACCURACY, offered - ideal)
+            price = adapt * purchase_price // ACCURACY
+    return start_prices, renewal_prices
+
+
+class TestFixedPoint(unittest.TestCase):
+    def test_rounding(self):
+        self.assertEqual(from_rational(1, 3), 333_333_333)
+        self.assertEqual(from_rational(2, 3), 666_666_667)
+        # Halves are rounded down.
+        self.assertEqual(from_rational(1, 2 * ACCURACY), 0)
+        self.assertEqual(from_rational(3, 2 * ACCURACY), 1)
+        self.assertEqual(perbill_mul(500_000_000, 5), 2)
+        self.assertEqual(perbill_mul(500_000_001, 5), 3)
+        self.assertEqual(perbill_mul(600_000_000, 50), 30)
+        self.assertEqual(mul_int(1_999_999_999, 1), 1)
+
+    def test_wide_products(self):
+        rng = np.random.default_rng(0)
+        fixed = rng.integers(0, 5 * ACCURACY, 500)
+        for bound in (10**12, 10**17, 2**62):
+            values = rng.integers(0, bound, 500)
+            with self.subTest(bound=bound):
+                expected = [x * y // ACCURACY for x, y in zip(fixed.tolist(), values.tolist())]
+                self.assertEqual([int(value) for value in mul_int(fixed, values)], expected)
+                parts = fixed % ACCURACY
+                expected = [_nearest(x * y, ACCURACY) for x, y in zip(parts.tolist(), values.tolist())]
+                self.assertEqual([int(value) for value in perbill_mul(parts, values)], expected)
+        self.assertEqual(mul_int(np.array([3 * ACCURACY]), np.array([2**62]))[0], 3 * 2**62)
+
+
+class TestFixedBatchCalculatePrice(unittest.TestCase):
+    def setUp(self):
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20, 5: 0, 6: 45}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0, 5: 3, 6: 5}
+        self.calculators = []
+        for interlude_length, limit_cores_offered, linear, factor in [
+            (35, 50, True, 1),
+            (35, 50, False, 2),
+            (10, 40, True, 3),
+            (0, 50, True, 1),
+            (35, None, False, 1),
+        ]:
+            config = Config(
+                interlude_length=interlude_length,
+                leadin_length=35,
+                region_length=140,
+                ideal_bulk_proportion=0.6,
+                limit_cores_offered=limit_cores_offered,
+                renewal_bump=0.05,
+            )
+            calculator = CalculatePrice(config)
+            calculator.change_linear(linear)
+            calculator.change_factor(factor)
+            self.calculators.append(calculator)
+
+    def test_matches_integer_reference(self):
+        for unit in (10**10, 10**30):
+            with self.subTest(unit=unit):
+                batch = FixedBatchCalculatePrice.from_calculators(self.calculators, unit=unit)
+                results = batch.run(6, self.monthly_renewals, self.monthly_sales)
+                self.assertEqual(results.start_price.dtype, np.int64 if unit == 10**10 else object)
+                for i, calculator in enumerate(self.calculators):
+                    expected, _ = _reference(calculator, 6, self.monthly_renewals, self.monthly_sales, unit)
+                    self.assertEqual([int(price) for price in results.start_price[:, i]], expected)
+
+    def test_near_int64_limit(self):
+        # Prices of 1000 are 9 * 10**18, just below 2**63: the renewal cap and the prices that follow do not fit.
+        unit = 9 * 10**15
+        batch = FixedBatchCalculatePrice.from_calculators(self.calculators, unit=unit)
+        self.assertEqual(batch.initial_bought_price.dtype, np.int64)
+
+        results = batch.run(6, self.monthly_renewals, self.monthly_sales)
+
+        for i, calculator in enumerate(self.calculators):
+            start_prices, renewal_prices = _reference(
+                calculator, 6, self.monthly_renewals, self.monthly_sales, unit
+            )
+            self.assertEqual([int(price) for price in results.start_price[:, i]], start_prices)
+            self.assertEqual([int(price) for price in results.renewal_price[:, i]], renewal_prices)
+
+    def test_close_to_float(self):
+        unit = 10**10
+        batch = FixedBatchCalculatePrice.from_calculators(self.calculators, unit=unit)
+        results = batch.run(6, self.monthly_renewals, self.monthly_sales)
+        expected = BatchCalculatePrice.from_calculators(self.calculators).run(
+            6, self.monthly_renewals, self.monthly_sales
+        )
+
+        np.testing.assert_allclose(results.start_price / unit, expected.start_price, rtol=1e-8)
+        np.testing.assert_allclose(results.sellout_price / unit, expected.sellout_price, rtol=1e-8)
+
+    def test_exponential_stays_int64(self):
+        calculator = self.calculators[1]
+        calculator.change_factor(5)
+        size, region_nb = 20_000, 50
+        rng = np.random.default_rng(0)
+        # Around the ideal of 30 cores, so that prices stay bounded.
+        renewals = np.full((region_nb, size), 25)
+        sales = rng.integers(4, 7, (region_nb, size))
+
+        batch = FixedBatchCalculatePrice.from_calculator(calculator, size, unit=10**10)
+        results = batch.run(region_nb, renewals, sales)
+
+        # Python integers would be more than ten times slower than the float path, see `batch[fixed]` in benchmark.py.
+        for values in results:
+            self.assertEqual(values.dtype, np.int64)
+
+    def test_per_scenario_schedules(self):
+        batch = FixedBatchCalculatePrice.from_calculator(self.calculators[0], 3, unit=10**10)
+        renewals = np.array([[10, 30, 45], [10, 30, 45]])
+        sales = np.array([[0, 5, 5], [0, 5, 5]])
+
+        results = batch.run(2, renewals, sales)
+
+        for i in range(3):
+            monthly_renewals = {1: int(renewals[0, i]), 2: int(renewals[1, i])}
+            monthly_sales = {1: int(sales[0, i]), 2: int(sales[1, i])}
+            expected, _ = _reference(self.calculators[0], 3, monthly_renewals, monthly_sales, 10**10)
+            self.assertEqual(results.start_price[:, i].tolist(), expected[:2])
+            self.assertEqual(batch.price[i], expected[2])
+
+    def test_custom_curve_unsupported(self):
+        self.calculators[0].change_curve("linear")
+        with self.assertRaises(ValueError):
+            FixedBatchCalculatePrice.from_calculators(self.calculators)
+
+
+if __name__ == "__main__":
+    unittest.main()
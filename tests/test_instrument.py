@@ -0,0 +1,105 @@
+import threading
+import unittest
+import instrument
+from cache import SimulationCache
+from config import Config
+from engine import RegionEngine
+from price import CalculatePrice
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=35,
+            leadin_length=35,
+            region_length=140,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.metrics = instrument.Metrics()
+
+    def tearDown(self):
+        instrument.disable()
+
+    def test_disabled_by_default(self):
+        rotate_sale = CalculatePrice.__dict__["rotate_sale"]
+
+        RegionEngine(CalculatePrice(self.config)).run(2, {}, {})
+
+        self.assertFalse(instrument.enabled())
+        self.assertIs(CalculatePrice.__dict__["rotate_sale"], rotate_sale)
+
+    def test_profile(self):
+        rotate_sale = CalculatePrice.__dict__["rotate_sale"]
+        calculator = CalculatePrice(self.config)
+
+        with instrument.profile(metrics=self.metrics):
+            self.assertTrue(instrument.enabled())
+            cache = SimulationCache()
+            cache.simulate(calculator, 3, {1: 10}, {1: 5})
+            calculator.restore(CalculatePrice(self.config).snapshot())
+            cache.simulate(calculator, 3, {1: 10}, {1: 5})
+            with instrument.timer("plot"):
+                pass
+
+        metrics = self.metrics.as_dict()
+        self.assertFalse(instrument.enabled())
+        self.assertIs(CalculatePrice.__dict__["rotate_sale"], rotate_sale)
+        self.assertEqual(metrics["timers"]["simulate"]["calls"], 2)
+        self.assertEqual(metrics["timers"]["rotate_sale"]["calls"], 3)
+        self.assertEqual(metrics["timers"]["plot"]["calls"], 1)
+        self.assertGreater(metrics["timers"]["sellout_price_update"]["calls"], 0)
+        self.assertEqual(
+            metrics["counters"],
+            {
+                "blocks_evaluated": 3 * self.config.region_length,
+                "cache_hits": 1,
+                "cache_misses": 1,
+                "regions_rotated": 3,
+            },
+        )
+
+    def test_collect_measures_the_current_thread_only(self):
+        rotate_sale = CalculatePrice.__dict__["rotate_sale"]
+        other_metrics = instrument.Metrics()
+        collecting = threading.Event()
+        done = threading.Event()
+
+        def other_session():
+            with instrument.collect(other_metrics):
+                collecting.set()
+                done.wait()
+
+        thread = threading.Thread(target=other_session)
+        thread.start()
+        collecting.wait()
+        try:
+            with instrument.collect(self.metrics):
+                self.assertTrue(instrument.enabled())
+                RegionEngine(CalculatePrice(self.config)).run(3, {}, {})
+            # The other session still collects, but this thread is not measured anymore.
+            self.assertFalse(instrument.enabled())
+            RegionEngine(CalculatePrice(self.config)).run(2, {}, {})
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(self.metrics.as_dict()["counters"]["regions_rotated"], 3)
+        self.assertEqual(other_metrics.as_dict()["counters"], {})
+        self.assertIs(CalculatePrice.__dict__["rotate_sale"], rotate_sale)
+
+    def test_prometheus(self):
+        self.metrics.add_time("rotate_sale", 0.5)
+        self.metrics.add_time("rotate_sale", 0.25)
+        self.metrics.increment("regions_rotated", 2)
+
+        text = self.metrics.to_prometheus()
+
+        self.assertIn('coretime_phase_calls_total{phase="rotate_sale"} 2\n', text)
+        self.assertIn('coretime_phase_seconds_total{phase="rotate_sale"} 0.75\n', text)
+        self.assertIn("# TYPE coretime_regions_rotated_total counter\ncoretime_regions_rotated_total 2\n", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import numpy as np
+import kernel
+from config import Config
+from engine import RegionEngine
+from price import CalculatePrice
+
+
+class TestKernel(unittest.TestCase):
+    def setUp(self):
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20, 5: 0, 6: 45}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0, 5: 3, 6: 5}
+        self.calculators = []
+        for interlude_length, limit_cores_offered, linear, factor in [
+            (35, 50, True, 1),
+            (35, 50, False, 2),
+            (10, 40, True, 3),
+            (0, 50, True, 1),
+            (35, None, False, 1),
+            (200, 50, True, 2),
+            (20, 50, False, 3),
+        ]:
+            config = Config(
+                interlude_length=interlude_length,
+                leadin_length=35,
+                region_length=140,
+                ideal_bulk_proportion=0.6,
+                limit_cores_offered=limit_cores_offered,
+                renewal_bump=0.05,
+            )
+            calculator = CalculatePrice(config)
+            calculator.change_linear(linear)
+            calculator.change_factor(factor)
+            self.calculators.append(calculator)
+
+    def tearDown(self):
+        kernel.set_backend(None)
+
+    def _kernel(self, curves):
+        """
+        Run `region_kernel` as plain Python, whatever the backends available.
+        """
+        size = len(self.calculators)
+        renewed = np.array([[self.monthly_renewals[region] for _ in range(size)] for region in range(1, 7)], dtype=float)
+        sold = np.array([[self.monthly_sales[region] for _ in range(size)] for region in range(1, 7)], dtype=float)
+        outputs = [np.empty((6, size)) for _ in range(3)]
+        prices = np.empty((6, size, 140 if curves else 0))
+        kernel.region_kernel(
+            0.0, *kernel._kernel_arguments(self.calculators), renewed, sold, *outputs, prices
+        )
+        return outputs, prices
+
+    def _assert_matches(self, results, expected, curves):
+        for values, expected_values in zip(results, expected):
+            if expected_values is None:
+                continue
+            if curves:
+                # NumPy's vectorized `pow` may round the exponential curve differently in the last bit.
+                np.testing.assert_allclose(values, expected_values, rtol=1e-14)
+            else:
+                np.testing.assert_array_equal(values, expected_values)
+
+    def test_kernel_matches_calculator(self):
+        for curves in (False, True):
+            with self.subTest(curves=curves):
+                expected = kernel.run(
+                    self.calculators, 6, self.monthly_renewals, self.monthly_sales, curves=curves, backend="python"
+                )
+                outputs, prices = self._kernel(curves)
+                self._assert_matches([*outputs, prices if curves else None], expected, curves)
+
+    def test_python_backend(self):
+        results = kernel.run(self.calculators, 6, self.monthly_renewals, self.monthly_sales, backend="python")
+
+        self.assertIsNone(results.prices)
+        for i, calculator in enumerate(self.calculators):
+            expected = RegionEngine(calculator.fork()).run(6, self.monthly_renewals, self.monthly_sales)
+            self.assertEqual(results.start_price[:, i].tolist(), [result.start_price for result in expected])
+            self.assertEqual(results.renewal_price[:, i].tolist(), [result.renewal_price for result in expected])
+        # The calculators are not moved forward.
+        self.assertEqual(self.calculators[0].price, 1000)
+
+    @unittest.skipUnless(kernel.numba is not None, "Numba is not installed")
+    def test_numba_backend(self):
+        for curves in (False, True):
+            with self.subTest(curves=curves):
+                expected = kernel.run(
+                    self.calculators, 6, self.monthly_renewals, self.monthly_sales, curves=curves, backend="python"
+                )
+                results = kernel.run(
+                    self.calculators, 6, self.monthly_renewals, self.monthly_sales, curves=curves, backend="numba"
+                )
+                self._assert_matches(results, expected, curves)
+
+    def test_backend_selection(self):
+        with self.assertRaises(ValueError):
+            kernel.set_backend("fortran")
+        self.assertEqual(kernel.get_backend(), "python")
+        if kernel.numba is not None:
+            kernel.set_backend("numba")
+            self.assertEqual(kernel.get_backend(), "numba")
+        kernel.set_backend(None)
+        self.assertEqual(kernel.get_backend(), "python")
+        self.assertIn("python", kernel.available_backends())
+        if kernel.numba is None:
+            self.assertEqual(kernel.available_backends(), ["python"])
+            with self.assertRaises(ValueError):
+                kernel.run(self.calculators, 6, self.monthly_renewals, self.monthly_sales, backend="numba")
+
+    def test_curves_need_same_region_length(self):
+        self.calculators[0].update_config(
+            Config(
+                interlude_length=35,
+                leadin_length=35,
+                region_length=100,
+                ideal_bulk_proportion=0.6,
+                limit_cores_offered=50,
+                renewal_bump=0.05,
+            )
+        )
+        with self.assertRaises(ValueError):
+            kernel.run(self.calculators, 6, self.monthly_renewals, self.monthly_sales, curves=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import numpy as np
+from config import Config
+from market import Agents, MarketEngine
+from price import CalculatePrice
+
+
+class TestMarketEngine(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=10,
+            leadin_length=10,
+            region_length=30,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=5,
+            renewal_bump=0.05,
+        )
+        self.calculator = CalculatePrice(self.config)
+        self.calculator.change_linear(True)
+
+    def test_buy_when_affordable(self):
+        # The linear lead-in falls from 2x to 1x over 10 blocks: 1500 is affordable 5 blocks into the sale.
+        agents = Agents(budget=[1500], renewal_budget=[0], arrival=[0], renew_at=[0])
+        results = MarketEngine(self.calculator, agents).run(1)
+
+        self.assertEqual(results[0].sales, 1)
+        self.assertEqual(results[0].renewals, 0)
+        self.assertAlmostEqual(results[0].revenue, 1500)
+        self.assertTrue(agents.holding[0])
+        self.assertAlmostEqual(agents.paid[0], 1500)
+
+    def test_late_arrival(self):
+        agents = Agents(budget=[5000], renewal_budget=[0], arrival=[0.5], renew_at=[0])
+        results = MarketEngine(self.calculator, agents).run(1)
+
+        # The agent arrives 10 blocks into the sale, at the end of the lead-in.
+        self.assertAlmostEqual(results[0].revenue, 1000)
+
+    def test_unaffordable(self):
+        agents = Agents(budget=[900], renewal_budget=[0], arrival=[0], renew_at=[0])
+        results = MarketEngine(self.calculator, agents).run(2)
+
+        # Nothing sells in the first region, so the price of the second falls within the budget.
+        self.assertEqual([result.sales for result in results], [0, 1])
+        self.assertEqual([result.events for result in results], [0, 1])
+        self.assertLess(results[1].start_price, 900)
+
+    def test_renewal(self):
+        agents = Agents(
+            budget=[0, 0], renewal_budget=[2000, 1000], arrival=[0, 0], renew_at=[0, 0],
+            holding=[True, True], paid=[1000, 1000],
+        )
+        results = MarketEngine(self.calculator, agents).run(1)
+
+        # The renewal price is capped at the price paid plus the renewal bump.
+        self.assertEqual(results[0].renewals, 1)
+        self.assertAlmostEqual(results[0].revenue, 1050)
+        self.assertEqual(agents.holding.tolist(), [True, False])
+        self.assertAlmostEqual(agents.paid[0], 1050)
+
+    def test_failed_renewal_buys_in_sale(self):
+        agents = Agents(
+            budget=[1500], renewal_budget=[1000], arrival=[0], renew_at=[0], holding=[True], paid=[1000],
+        )
+        results = MarketEngine(self.calculator, agents).run(1)
+
+        self.assertEqual((results[0].renewals, results[0].sales), (0, 1))
+        self.assertEqual(results[0].events, 2)
+        self.assertAlmostEqual(agents.paid[0], 1500)
+
+    def test_sellout(self):
+        # Five cores offered, ideal three: the third purchase sets the sellout price and the sixth agent misses out.
+        agents = Agents(budget=[2000, 1800, 1600, 1400, 1200, 1000], renewal_budget=[0] * 6, arrival=[0] * 6, renew_at=[0] * 6)
+        results = MarketEngine(self.calculator, agents).run(1)
+
+        self.assertEqual((results[0].sales, results[0].missed), (5, 1))
+        self.assertAlmostEqual(results[0].sellout_price, 1600)
+        self.assertAlmostEqual(results[0].revenue, 2000 + 1800 + 1600 + 1400 + 1200)
+        self.assertEqual(agents.holding.tolist(), [True] * 5 + [False])
+
+    def test_rotates_sale_from_purchases(self):
+        agents = Agents.random(200, np.random.default_rng(1), holding=3)
+        results = MarketEngine(self.calculator, agents).run(5)
+
+        # Replaying the outcome of every region through `rotate_sale` gives the same start prices.
+        replay = CalculatePrice(self.config)
+        replay.change_linear(True)
+        for result in results:
+            self.assertAlmostEqual(result.start_price, replay.price)
+            replay.sellout_price = result.sellout_price
+            replay.rotate_sale(result.renewals, result.sales)
+        self.assertAlmostEqual(replay.price, self.calculator.price)
+
+    def test_events_bounded_by_agents(self):
+        config = Config(
+            interlude_length=100,
+            leadin_length=100,
+            region_length=400,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=300,
+            renewal_bump=0.05,
+        )
+        calculator = CalculatePrice(config)
+        agents = Agents.random(1000, np.random.default_rng(2), holding=100)
+        results = MarketEngine(calculator, agents).run(10)
+
+        self.assertEqual(len(results), 10)
+        for result in results:
+            self.assertLessEqual(result.renewals + result.sales, 300)
+            self.assertLessEqual(result.events, 2 * len(agents))
+        self.assertEqual(agents.holding.sum(), results[-1].renewals + results[-1].sales)
+
+
+if __name__ == "__main__":
+    unittest.main()
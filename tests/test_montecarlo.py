@@ -0,0 +1,113 @@
+import unittest
+import numpy as np
+from batch import BatchCalculatePrice
+from config import Config
+from montecarlo import PriceElasticDemand, RegionAggregator, run_monte_carlo
+from price import CalculatePrice
+
+
+class TestRegionAggregator(unittest.TestCase):
+    def test_statistics(self):
+        rng = np.random.default_rng(1)
+        values = rng.lognormal(mean=7, sigma=0.5, size=20_000)
+        aggregator = RegionAggregator(1, metrics=("price",))
+        for chunk in np.array_split(values, 7):
+            aggregator.update(0, "price", chunk)
+
+        self.assertEqual(aggregator.count[0, 0], values.size)
+        self.assertAlmostEqual(aggregator.mean()[0, 0], values.mean())
+        self.assertAlmostEqual(aggregator.std()[0, 0], values.std(), places=4)
+        self.assertEqual(aggregator.minimum[0, 0], values.min())
+        self.assertEqual(aggregator.maximum[0, 0], values.max())
+        for q in (0.05, 0.5, 0.95):
+            expected = np.quantile(values, q, method="lower")
+            self.assertAlmostEqual(
+                aggregator.quantile(q)[0, 0] / expected, 1, delta=2 * aggregator.relative_accuracy
+            )
+        tail = np.sort(values)[int(0.95 * (values.size - 1)):]
+        self.assertAlmostEqual(
+            aggregator.tail_mean(0.95)[0, 0] / tail.mean(), 1, delta=aggregator.relative_accuracy
+        )
+
+    def test_merge(self):
+        values = np.arange(1, 101, dtype=float)
+        whole = RegionAggregator(2, metrics=("price",))
+        whole.update(1, "price", values)
+        first = RegionAggregator(2, metrics=("price",))
+        first.update(1, "price", values[:30])
+        second = RegionAggregator(2, metrics=("price",))
+        second.update(1, "price", np.append(values[30:], np.nan))
+
+        merged = first.merge(second)
+
+        np.testing.assert_array_equal(merged.histogram, whole.histogram)
+        np.testing.assert_array_equal(merged.count, [[0], [100]])
+        self.assertTrue(np.isnan(merged.quantile(0.5)[0, 0]))
+
+
+class TestMonteCarlo(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.price_calculator = CalculatePrice(self.config)
+        self.price_calculator.change_linear(True)
+
+    def test_demand_reacts_to_price(self):
+        demand = PriceElasticDemand(renewals=20, sales=20, sale_elasticity=2)
+        batch = BatchCalculatePrice.from_calculator(self.price_calculator, 10_000)
+        rng = np.random.default_rng(0)
+
+        _, sold_at_reference = demand.sample(rng, batch)
+        batch.price = batch.price * 2
+        renewed, sold_at_double = demand.sample(rng, batch)
+
+        self.assertAlmostEqual(sold_at_reference.mean(), 20, delta=0.5)
+        self.assertAlmostEqual(sold_at_double.mean(), 5, delta=0.5)
+        self.assertTrue(np.all(renewed + sold_at_double <= self.config.limit_cores_offered))
+
+    def test_reproducible_across_workers(self):
+        demand = PriceElasticDemand(renewals=25, sales=8)
+
+        serial = run_monte_carlo(
+            self.price_calculator, demand, 5, 2_500, seed=7, chunk_size=1_000
+        )
+        parallel = run_monte_carlo(
+            self.price_calculator, demand, 5, 2_500, seed=7, chunk_size=1_000, max_workers=2
+        )
+
+        np.testing.assert_array_equal(serial.count[:, 0], [2_500] * 5)
+        np.testing.assert_array_equal(serial.histogram, parallel.histogram)
+        np.testing.assert_allclose(serial.mean(), parallel.mean())
+        summary = serial.summary()
+        self.assertEqual(len(summary), 5 * 3)
+        self.assertIn("q50", summary.columns)
+
+    def test_independent_of_chunk_size(self):
+        demand = PriceElasticDemand(renewals=25, sales=8)
+
+        small = run_monte_carlo(self.price_calculator, demand, 5, 2_500, seed=3, chunk_size=1)
+        large = run_monte_carlo(self.price_calculator, demand, 5, 2_500, seed=3, chunk_size=10_000)
+
+        np.testing.assert_array_equal(small.histogram, large.histogram)
+        np.testing.assert_array_equal(small.minimum, large.minimum)
+        np.testing.assert_allclose(small.mean(), large.mean())
+
+    def test_constant_demand_matches_batch(self):
+        demand = PriceElasticDemand(renewals=30, sales=0, renewal_elasticity=0, sale_elasticity=0)
+        demand.sample = lambda rng, batch: (np.full(len(batch), 30), np.full(len(batch), 5))
+
+        aggregator = run_monte_carlo(self.price_calculator, demand, 4, 100, chunk_size=30)
+
+        expected = BatchCalculatePrice.from_calculator(self.price_calculator, 1).run(4, [30] * 4, [5] * 4)
+        np.testing.assert_allclose(aggregator.mean()[:, 0], expected.start_price[:, 0])
+        np.testing.assert_allclose(aggregator.mean()[:, 1], expected.renewal_price[:, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import itertools
+import unittest
+import numpy as np
+from config import Config
+from optimizer import BUY, RENEW, SKIP, market_prices, optimize_purchases
+from price import CalculatePrice
+
+
+class TestOptimizePurchases(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=10,
+            leadin_length=10,
+            region_length=30,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.calculator = CalculatePrice(self.config)
+        self.calculator.change_linear(True)
+        self.renewals = {1: 45, 2: 40, 3: 45, 4: 10}
+        self.sales = {1: 5, 2: 5, 3: 5, 4: 0}
+
+    def _cost(self, actions, prices, time_steps, sellout):
+        """
+        The cost of a sequence of (action, time index) pairs, or inf if it is not allowed.
+        """
+        interlude, region, leadin = 10, 30, 10
+        renewal_offsets = np.linspace(0, interlude, time_steps, endpoint=False)
+        sale_offsets = np.linspace(interlude, region, time_steps)
+        fractions = np.linspace(0, 1, time_steps)
+        paid, cost = self.calculator.initial_bought_price, 0.0
+        for region_i, (action, t) in enumerate(actions):
+            if action == RENEW:
+                if paid is None:
+                    return np.inf
+                factor = 2 - min(renewal_offsets[t], leadin) / leadin
+                paid = min(paid * 1.05, factor * prices[region_i])
+            elif action == BUY:
+                if not fractions[t] < sellout.get(region_i + 1, np.inf):
+                    return np.inf
+                paid = (2 - min(sale_offsets[t] - interlude, leadin) / leadin) * prices[region_i]
+            else:
+                paid = None
+                continue
+            cost += paid
+        return cost
+
+    def test_matches_exhaustive_search(self):
+        time_steps = 3
+        needed = {2: False, 3: False}
+        sellout = {1: 0.5, 4: 0.7}
+        prices = market_prices(self.calculator, 4, self.renewals, self.sales)
+        choices = [(action, t) for action in (RENEW, BUY) for t in range(time_steps)]
+        best = min(
+            self._cost(actions, prices, time_steps, sellout)
+            for actions in itertools.product(
+                choices, choices + [(SKIP, None)], choices + [(SKIP, None)], choices
+            )
+        )
+
+        policy = optimize_purchases(
+            self.calculator, 4, self.renewals, self.sales, needed, sellout, time_steps=time_steps
+        )
+
+        self.assertAlmostEqual(policy.cost, best)
+        self.assertAlmostEqual(sum(decision.price for decision in policy.decisions), policy.cost)
+        self.assertEqual([decision.region for decision in policy.decisions], [1, 2, 3, 4])
+
+    def test_skip_when_renewing_is_dearer(self):
+        # The price falls while few cores are sold: skipping and buying later beats keeping the renewal.
+        renewals = {month: 0 for month in range(1, 6)}
+        sales = {month: 0 for month in range(1, 6)}
+
+        policy = optimize_purchases(
+            self.calculator, 5, renewals, sales, needed={2: False, 3: False, 4: False}
+        )
+
+        self.assertEqual(
+            [decision.action for decision in policy.decisions[1:]], [SKIP, SKIP, SKIP, BUY]
+        )
+
+    def test_calculator_is_not_modified(self):
+        state = self.calculator.snapshot()
+
+        optimize_purchases(self.calculator, 4, self.renewals, self.sales)
+
+        self.assertEqual(self.calculator.snapshot(), state)
+
+    def test_no_renewal_without_interlude(self):
+        calculator = CalculatePrice(Config(**{**self.config.as_dict(), "interlude_length": 0}))
+        calculator.change_linear(True)
+
+        policy = optimize_purchases(calculator, 4, self.renewals, self.sales)
+
+        self.assertEqual([decision.action for decision in policy.decisions], [BUY] * 4)
+        self.assertTrue(np.isfinite(policy.cost))
+
+    def test_infeasible(self):
+        with self.assertRaises(ValueError):
+            optimize_purchases(self.calculator, 2, self.renewals, self.sales, holding=False, sellout={1: 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
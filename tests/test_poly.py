@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 from poly import Linear, Exponential
 
 
@@ -28,5 +29,32 @@ class TestExponentialNoPanic(unittest.TestCase):
                         self.assertTrue(price <= 1)
 
 
+class TestLeadinFactorArrays(unittest.TestCase):
+    def test_leadin_factor_accepts_arrays(self):
+        when = np.linspace(0, 1, 11)
+        for curve in (Linear, Exponential):
+            for factor in (1, 2, 5):
+                factors = curve.leadin_factor_at(when, factor=factor)
+
+                self.assertEqual(factors.shape, when.shape)
+                for i, w in enumerate(when):
+                    self.assertAlmostEqual(
+                        factors[i], curve.leadin_factor_at(float(w), factor=factor)
+                    )
+
+
+class TestLinearAdaptPriceArrays(unittest.TestCase):
+    def test_adapt_price_accepts_arrays(self):
+        limit = 9
+        target = np.array([1, 4, 8])
+        for sold in range(limit + 1):
+            prices = Linear.adapt_price(np.full(3, sold), target, limit)
+
+            for i in range(3):
+                self.assertAlmostEqual(
+                    prices[i], Linear.adapt_price(sold, int(target[i]), limit)
+                )
+
+
 if __name__ == "__main__":
     unittest.main()
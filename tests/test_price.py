@@ -1,6 +1,7 @@
 import unittest
 from config import Config
 from price import CalculatePrice
+from engine import RegionEngine
 
 
 class TestCalculatePrice(unittest.TestCase):
@@ -60,5 +61,76 @@ class TestCalculatePrice(unittest.TestCase):
         self.assertEqual(calculated_price, 2000)
 
 
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=35,
+            leadin_length=35,
+            region_length=140,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.calculate_price_obj = CalculatePrice(config=self.config)
+        self.calculate_price_obj.change_linear(True)
+
+    def test_snapshot_is_immutable(self):
+        state = self.calculate_price_obj.snapshot()
+
+        with self.assertRaises(AttributeError):
+            state.price = 0
+        with self.assertRaises(AttributeError):
+            state.other = 0
+        self.assertEqual(state, self.calculate_price_obj.snapshot())
+        self.assertEqual(hash(state), hash(self.calculate_price_obj.snapshot()))
+
+    def test_restore(self):
+        state = self.calculate_price_obj.snapshot()
+        RegionEngine(self.calculate_price_obj).run(3, {1: 10, 2: 45, 3: 30}, {1: 5, 2: 5, 3: 0})
+        self.assertNotEqual(self.calculate_price_obj.snapshot(), state)
+
+        self.calculate_price_obj.restore(state)
+
+        self.assertEqual(self.calculate_price_obj.snapshot(), state)
+
+    def test_fork_matches_replay(self):
+        renewals = {1: 10, 2: 45, 3: 30, 4: 20}
+        sales = {1: 5, 2: 5, 3: 0, 4: 10}
+        engine = RegionEngine(self.calculate_price_obj)
+        engine.run(2, renewals, sales)
+
+        branches = {}
+        for renewed in (0, 20, 40):
+            fork = self.calculate_price_obj.fork()
+            branches[renewed] = [
+                RegionEngine(fork).step(region_i, renewed, sales[region_i + 1])
+                for region_i in (2, 3)
+            ]
+
+        for renewed, results in branches.items():
+            replay = CalculatePrice(config=self.config)
+            replay.change_linear(True)
+            expected = RegionEngine(replay).run(4, {**renewals, 3: renewed, 4: renewed}, sales)
+            self.assertEqual(results, expected[2:])
+        self.assertEqual(
+            self.calculate_price_obj.snapshot(),
+            self.calculate_price_obj.fork().snapshot(),
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
+
+    def test_quote_price(self):
+        calculator = self.calculate_price_obj
+        calculator.change_bought_price(800)
+        for block in (0, 10, 34, 35, 50, 70, 140):
+            state = calculator.snapshot()
+            quote = calculator.quote_price(0, block)
+            self.assertEqual(calculator.snapshot(), state)
+            self.assertAlmostEqual(quote, calculator.calculate_price(0, block))
+            calculator.restore(state)
+        # The renewal price is capped by the price the renewer paid, not the initial bought price.
+        self.assertAlmostEqual(calculator.quote_price(0, 0, bought_price=100), 105)
+        with self.assertRaises(ValueError):
+            calculator.quote_price(0, 141)
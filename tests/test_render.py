@@ -0,0 +1,77 @@
+import unittest
+import numpy as np
+from cache import SimulationCache
+from config import Config
+from price import CalculatePrice
+from engine import region_blocks
+from render import chart_data, lttb, minmax_lttb, price_chart, region_block_at
+
+
+class TestDownsampling(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.x = np.arange(10_000, dtype=float)
+        self.y = np.cumsum(rng.normal(size=10_000))
+
+    def test_lttb(self):
+        indices = lttb(self.x, self.y, 100)
+
+        self.assertEqual(len(indices), 100)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], len(self.x) - 1)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        np.testing.assert_array_equal(lttb(self.x[:50], self.y[:50], 100), np.arange(50))
+
+    def test_minmax_lttb_keeps_extremes(self):
+        indices = minmax_lttb(self.x, self.y, 200)
+
+        self.assertLessEqual(len(indices), 202)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertIn(np.argmax(self.y), indices)
+        self.assertIn(np.argmin(self.y), indices)
+
+
+class TestPriceChart(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 14400,
+            leadin_length=7 * 14400,
+            region_length=28 * 14400,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        calculator = CalculatePrice(self.config)
+        calculator.change_linear(True)
+        self.regions = SimulationCache().simulate(
+            calculator, 20, {month: 40 for month in range(1, 21)}, {}
+        )
+
+    def test_chart_data(self):
+        curves, boundaries = chart_data(self.config, self.regions, screen_points=2000)
+
+        self.assertLessEqual(len(curves), 2000 + 2 * 20)
+        self.assertEqual(curves["region"].nunique(), 20)
+        self.assertEqual(len(boundaries), 4 * 20)
+        for region in self.regions:
+            rows = curves[curves["region"] == f"Region {region.result.region}"]
+            self.assertAlmostEqual(rows["price"].max(), region.prices.max())
+            self.assertAlmostEqual(rows["price"].min(), region.prices.min())
+
+    def test_region_block_at(self):
+        region_start = 3 * self.config.region_length
+        indices = np.arange(self.config.region_length)
+
+        np.testing.assert_array_equal(
+            region_block_at(self.config, region_start)(indices),
+            region_blocks(self.config, region_start),
+        )
+
+    def test_price_chart(self):
+        spec = price_chart(self.config, self.regions).to_dict()
+
+        self.assertEqual(len(spec["layer"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
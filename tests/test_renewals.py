@@ -1,6 +1,8 @@
 import unittest
+import numpy as np
 from config import Config
 from price import CalculatePrice
+from engine import RegionEngine, region_blocks
 
 
 class TestCalculatePrice(unittest.TestCase):
@@ -70,5 +72,125 @@ class TestCalculatePrice(unittest.TestCase):
             self.calculate_price_obj.calculate_price(region_start, block_now)
 
 
+class TestCalculateRegionPrices(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+
+    def _assert_matches_per_block(self, linear, factor, initial_bought_price):
+        region_start = 3 * self.config.region_length
+        blocks = np.linspace(
+            region_start,
+            region_start + self.config.region_length,
+            self.config.region_length,
+        )
+        per_block = CalculatePrice(config=self.config)
+        vectorized = CalculatePrice(config=self.config)
+        for calculator in (per_block, vectorized):
+            calculator.change_linear(linear)
+            calculator.change_factor(factor)
+            calculator.change_bought_price(initial_bought_price)
+
+        expected = [per_block.calculate_price(region_start, block) for block in blocks]
+        calculated = vectorized.calculate_region_prices(region_start, blocks)
+
+        np.testing.assert_allclose(calculated, expected)
+        self.assertAlmostEqual(vectorized.new_buy_price, per_block.new_buy_price)
+        self.assertEqual(vectorized.sellout_price, per_block.sellout_price)
+
+    def test_matches_per_block_linear(self):
+        self._assert_matches_per_block(linear=True, factor=1, initial_bought_price=1000)
+
+    def test_matches_per_block_exponential(self):
+        self._assert_matches_per_block(linear=False, factor=3, initial_bought_price=500)
+
+    def test_integer_blocks(self):
+        calculator = CalculatePrice(config=self.config)
+        blocks = np.arange(0, self.config.region_length + 1)
+
+        calculated = calculator.calculate_region_prices(0, blocks)
+
+        self.assertEqual(calculated.shape, blocks.shape)
+        self.assertAlmostEqual(
+            calculated[-1], calculator.calculate_price(0, self.config.region_length)
+        )
+
+    def test_blocks_outside_region(self):
+        calculator = CalculatePrice(config=self.config)
+
+        with self.assertRaises(ValueError):
+            calculator.calculate_region_prices(0, np.array([-1, 0, 1]))
+
+        with self.assertRaises(ValueError):
+            calculator.calculate_region_prices(
+                0, np.array([self.config.region_length + 1])
+            )
+
+
+class TestIterRegions(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20, 5: 0, 6: 45}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0, 5: 3, 6: 5}
+
+    def test_matches_engine(self):
+        expected = RegionEngine(CalculatePrice(self.config)).run(
+            6, self.monthly_renewals, self.monthly_sales
+        )
+        results = list(
+            CalculatePrice(self.config).iter_regions(
+                self.monthly_renewals, self.monthly_sales, region_nb=6
+            )
+        )
+
+        self.assertEqual(results, expected)
+
+    def test_curve(self):
+        calculator = CalculatePrice(self.config)
+        reference = CalculatePrice(self.config)
+
+        for region in calculator.iter_regions(
+            self.monthly_renewals, self.monthly_sales, region_nb=3, curve=True
+        ):
+            start = region.result.region_start
+            np.testing.assert_array_equal(region.blocks, region_blocks(self.config, start))
+            np.testing.assert_allclose(
+                region.prices, reference.calculate_region_prices(start, region.blocks)
+            )
+            self.assertFalse(region.prices.flags.writeable)
+            reference.update_renewal_price()
+            reference.rotate_sale(
+                self.monthly_renewals[region.result.region],
+                self.monthly_sales[region.result.region],
+            )
+
+    def test_stop_early(self):
+        calculator = CalculatePrice(self.config)
+        regions = calculator.iter_regions({}, {})
+
+        for result in regions:
+            if result.start_price < 500:
+                break
+
+        reference = CalculatePrice(self.config)
+        RegionEngine(reference).run(result.region, {}, {})
+        self.assertLess(result.start_price, 500)
+        self.assertGreater(result.region, 1)
+        self.assertEqual(calculator.price, reference.price)
+
+
 if __name__ == "__main__":
     unittest.main()
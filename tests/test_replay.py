@@ -0,0 +1,143 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import Config
+from engine import RegionEngine
+from price import CalculatePrice
+from replay import ReplayEngine, load_index, read_events, save_index
+
+# Three regions: renewals, purchases on the way down the lead-in and a skipped event.
+EVENTS = [
+    {"event": "purchased", "block": 0, "price": 900},
+    {"event": "sale_initialized", "block": 100, "price": 1000},
+    {"event": "renewed", "block": 102, "price": 1050},
+    {"event": "renewed", "block": 104, "price": 1050},
+    {"event": "purchased", "block": 112, "price": 1500},
+    {"event": "purchased", "block": 115, "price": 1400},
+    {"event": "purchased", "block": 118, "price": 1300},
+    {"event": "sale_initialized", "block": 130, "price": 1560},
+    {"event": "Renewed", "block": 131, "price": 1102.5},
+    {"event": "transferred", "block": 132, "price": None},
+    {"event": "Purchased", "block": 145, "price": 1700},
+    {"event": "sale_initialized", "block": 160, "price": 1500},
+]
+
+
+class TestReplayEngine(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=10,
+            leadin_length=10,
+            region_length=30,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=5,
+            renewal_bump=0.05,
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _calculator(self):
+        calculator = CalculatePrice(self.config)
+        calculator.change_linear(True)
+        return calculator
+
+    def _dump(self, extension):
+        path = os.path.join(self.directory.name, f"events{extension}")
+        if extension == ".jsonl":
+            with open(path, "w") as f:
+                for event in EVENTS:
+                    f.write(json.dumps(event) + "\n")
+        elif extension == ".csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=["event", "who", "block", "price"])
+                writer.writeheader()
+                for event in EVENTS:
+                    writer.writerow({**event, "who": "alice, bob"})
+        else:
+            pq.write_table(pa.Table.from_pylist(EVENTS), path, row_group_size=5)
+        return path
+
+    def test_region_totals(self):
+        residuals = list(ReplayEngine(self._calculator(), self._dump(".jsonl")).run())
+
+        self.assertEqual([residual.region for residual in residuals], [1, 2, 3])
+        first, second, third = residuals
+        self.assertEqual((first.renewals, first.sales), (2, 3))
+        # The ideal is 3 cores and the two renewals count: only the first purchase is below it.
+        self.assertEqual(first.sellout_price, 1500)
+        self.assertEqual(first.renewal_price, 1050)
+        self.assertEqual(first.start_price_residual, 0)
+        self.assertEqual((second.renewals, second.sales), (1, 1))
+        self.assertEqual(second.sellout_price, 1700)
+        self.assertEqual((third.renewals, third.sales), (0, 0))
+        self.assertIsNone(third.sellout_price)
+        self.assertIsNone(third.renewal_price_residual)
+
+    def test_feeds_recorded_sales_into_model(self):
+        residuals = list(ReplayEngine(self._calculator(), self._dump(".jsonl")).run())
+
+        calculator = self._calculator()
+        calculator.price = 1000
+        calculator.sellout_price = 1500
+        calculator.rotate_sale(2, 3)
+        self.assertAlmostEqual(residuals[1].model_start_price, calculator.price)
+        self.assertAlmostEqual(residuals[1].start_price_residual, 1560 - calculator.price)
+
+    def test_zero_interlude_keeps_renewal_price(self):
+        self.config = Config(**{**self.config.as_dict(), "interlude_length": 0})
+        calculator = self._calculator()
+
+        residuals = list(ReplayEngine(calculator, self._dump(".jsonl")).run())
+
+        # Without a renewal block, the new buy price is never set, like in `RegionEngine.step`.
+        expected = RegionEngine(self._calculator()).run(3, {1: 2, 2: 1}, {1: 3, 2: 1})
+        self.assertEqual(
+            [residual.model_renewal_price for residual in residuals], [result.renewal_price for result in expected]
+        )
+        self.assertEqual(calculator.initial_bought_price, 1000)
+        self.assertEqual(calculator.new_buy_price, 1000)
+
+    def test_formats_and_chunks_agree(self):
+        expected = list(ReplayEngine(self._calculator(), self._dump(".jsonl")).run())
+        for extension in (".jsonl", ".csv", ".parquet"):
+            for chunk_rows in (1, 4, 1000):
+                with self.subTest(extension=extension, chunk_rows=chunk_rows):
+                    engine = ReplayEngine(self._calculator(), self._dump(extension), chunk_rows=chunk_rows)
+                    self.assertEqual(list(engine.run()), expected)
+
+    def test_resume_from_index(self):
+        for extension in (".jsonl", ".csv", ".parquet"):
+            with self.subTest(extension=extension):
+                path = self._dump(extension)
+                engine = ReplayEngine(self._calculator(), path)
+                expected = list(engine.run())
+                index_path = os.path.join(self.directory.name, "index.json")
+                save_index(engine.index, index_path)
+                index = load_index(index_path)
+                self.assertEqual(index, engine.index)
+
+                resumed = ReplayEngine(self._calculator(), path)
+                self.assertEqual(list(resumed.run(start_region=2, index=index)), expected[1:])
+                self.assertEqual(resumed.index, engine.index)
+
+                first = next(read_events(path, chunk_rows=1, position=index[2].position))
+                self.assertEqual(first.blocks[0], 160)
+
+    def test_resume_needs_index(self):
+        engine = ReplayEngine(self._calculator(), self._dump(".jsonl"))
+        with self.assertRaises(ValueError):
+            list(engine.run(start_region=2))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            read_events("events.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
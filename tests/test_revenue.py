@@ -0,0 +1,129 @@
+import unittest
+import warnings
+import numpy as np
+from config import Config
+from curves import CURVES
+from price import CalculatePrice
+from revenue import block_summed, capped_mean, check_consistency, project
+
+
+class TestRevenue(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 14400,
+            leadin_length=7 * 14400,
+            region_length=28 * 14400,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.renewals = {month: 20 + 15 * (month % 2) for month in range(1, 7)}
+        self.sales = {month: 5 for month in range(1, 7)}
+
+    def _calculator(self, linear, factor):
+        calculator = CalculatePrice(self.config)
+        calculator.change_linear(linear)
+        calculator.change_factor(factor)
+        calculator.change_bought_price(1200)
+        return calculator
+
+    def test_capped_mean(self):
+        when = np.linspace(0.1, 0.9, 400_001)
+        for curve, factor, values in (
+            ("linear", 2, 1 + 2 * (1 - when)),
+            ("exponential", 3, (2 - when) ** 3),
+        ):
+            for cap in (np.inf, 2.0, 0.5):
+                self.assertAlmostEqual(
+                    capped_mean(curve, factor, 0.1, 0.9, cap), np.minimum(cap, values).mean(), places=5
+                )
+
+    def test_consistent_with_block_sums(self):
+        for linear, factor in ((True, 1), (False, 3)):
+            for sale_window in (None, (0.0, 1.0), (0.1, 0.4)):
+                worst = check_consistency(
+                    self._calculator(linear, factor), 6, self.renewals, self.sales,
+                    renewal_window=(0.5, 1.0), sale_window=sale_window,
+                )
+                self.assertLess(worst, 1e-5)
+
+    def test_inconsistency_is_reported(self):
+        config = Config(35, 35, 140, 0.6, 50, 0.05)
+        calculator = CalculatePrice(config)
+        calculator.change_factor(3)
+
+        with self.assertRaises(ValueError):
+            check_consistency(calculator, 3, self.renewals, self.sales, rtol=1e-6)
+
+    def test_project(self):
+        calculator = self._calculator(True, 1)
+        state = calculator.snapshot()
+
+        projections = project(
+            calculator, 6, self.renewals, self.sales, own_renewals={1: 2}, own_purchases={2: 1}
+        )
+
+        self.assertEqual(calculator.snapshot(), state)
+        first, second = projections[:2]
+        # Purchases spread over the linear lead-in pay 1.5 times the start price on average.
+        self.assertAlmostEqual(first.sale_price, 1.5 * first.start_price)
+        self.assertAlmostEqual(first.sale_price_p50, 1.5 * first.start_price)
+        self.assertAlmostEqual(first.sale_price_p5, 1.05 * first.start_price)
+        self.assertAlmostEqual(first.sale_price_p95, 1.95 * first.start_price)
+        self.assertLessEqual(first.renewal_price, 1200 * 1.05)
+        self.assertAlmostEqual(first.revenue, 35 * first.renewal_price + 5 * first.sale_price)
+        self.assertAlmostEqual(first.spend, 2 * first.renewal_price)
+        self.assertAlmostEqual(second.spend, second.sale_price)
+
+    def test_purchase_time_density(self):
+        # Most purchases early in the window, most renewals late.
+        early = lambda position: 2 * (1 - position)
+        late = lambda position: position**2
+        for linear, factor in ((True, 1), (False, 3)):
+            calculator = self._calculator(linear, factor)
+            worst = check_consistency(
+                calculator, 6, self.renewals, self.sales, renewal_pdf=late, sale_pdf=early
+            )
+            self.assertLess(worst, 1e-4)
+
+            uniform = project(calculator, 2, self.renewals, self.sales, sale_pdf=lambda position: 1)
+            weighted = project(calculator, 2, self.renewals, self.sales, sale_pdf=early)
+            expected = project(calculator, 2, self.renewals, self.sales)
+            self.assertAlmostEqual(uniform[0].sale_price, expected[0].sale_price)
+            self.assertAlmostEqual(uniform[0].sale_price_p50 / expected[0].sale_price_p50, 1, places=2)
+            # Early purchases pay more of the lead-in.
+            self.assertGreater(weighted[0].sale_price, expected[0].sale_price)
+            self.assertGreater(weighted[0].sale_price_p50, expected[0].sale_price_p50)
+
+        with self.assertRaises(ValueError):
+            project(self._calculator(True, 1), 1, self.renewals, self.sales, sale_pdf=lambda position: -position)
+
+    def test_no_interlude(self):
+        config = Config(0, 35, 140, 0.6, 50, 0.05)
+        calculator = CalculatePrice(config)
+        calculator.change_factor(2)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            projections = project(calculator, 3, self.renewals, self.sales, own_renewals={1: 2})
+            summed = block_summed(calculator, 3, self.renewals, self.sales)
+            check_consistency(calculator, 3, self.renewals, self.sales)
+
+        self.assertEqual([projection.renewal_price for projection in projections], [None] * 3)
+        self.assertEqual([renewal_price for renewal_price, _ in summed], [None] * 3)
+        first = projections[0]
+        self.assertAlmostEqual(first.revenue, 5 * first.sale_price)
+        self.assertEqual(first.spend, 0)
+
+    def test_registered_curve(self):
+        CURVES.register("cosine", lambda when, factor: 1 + factor * np.cos(np.pi * when / 2))
+        calculator = self._calculator(True, 2)
+        calculator.change_curve("cosine")
+
+        worst = check_consistency(calculator, 3, self.renewals, self.sales)
+
+        self.assertLess(worst, 1e-3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import numpy as np
+from config import Config
+from engine import RegionEngine
+from price import CalculatePrice
+from sensitivity import PARAMETERS, jacobian, morris, simulate_perturbed, sobol
+
+
+class TestSensitivity(unittest.TestCase):
+    def setUp(self):
+        self.values = dict(
+            interlude_length=35,
+            leadin_length=35,
+            region_length=140,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.calculator = self._calculator()
+        self.region_nb = 12
+        self.monthly_renewals = {i: 20 + (i % 4) * 8 for i in range(1, self.region_nb + 1)}
+        self.monthly_sales = {i: (i % 3) * 4 for i in range(1, self.region_nb + 1)}
+
+    def _calculator(self, price=1000, **values):
+        calculator = CalculatePrice(Config(**{**self.values, **values}))
+        calculator.change_linear(True)
+        calculator.change_initial_price(price)
+        return calculator
+
+    def _outputs(self, calculator, from_region=1, **values):
+        """
+        The start and renewal prices of a scenario whose configuration changes at region `from_region`.
+        """
+        engine = RegionEngine(calculator)
+        results = engine.run(from_region - 1, self.monthly_renewals, self.monthly_sales)
+        if values:
+            calculator.update_config(Config(**{**calculator.config.as_dict(), **values}))
+        results += [
+            engine.step(region_i, self.monthly_renewals.get(region_i + 1, 0), self.monthly_sales.get(region_i + 1, 0))
+            for region_i in range(from_region - 1, self.region_nb)
+        ]
+        return (
+            np.array([result.start_price for result in results]),
+            np.array([result.renewal_price for result in results]),
+        )
+
+    def test_simulate_perturbed(self):
+        results = simulate_perturbed(
+            self.calculator,
+            self.region_nb,
+            self.monthly_renewals,
+            self.monthly_sales,
+            values={"renewal_bump": [0.01, 0.05, 0.2], "limit_cores_offered": [40, 50, 60]},
+        )
+
+        self.assertEqual(results.start_price.shape, (self.region_nb, 3))
+        for i, (bump, offered) in enumerate([(0.01, 40), (0.05, 50), (0.2, 60)]):
+            start_prices, renewal_prices = self._outputs(
+                self._calculator(renewal_bump=bump, limit_cores_offered=offered)
+            )
+            np.testing.assert_allclose(results.start_price[:, i], start_prices)
+            np.testing.assert_allclose(results.renewal_price[:, i], renewal_prices)
+        self.assertEqual(self.calculator.snapshot(), self._calculator().snapshot())
+
+    def test_jacobian(self):
+        result = jacobian(self.calculator, self.region_nb, self.monthly_renewals, self.monthly_sales)
+
+        self.assertEqual(result.parameters, PARAMETERS)
+        self.assertEqual(result.derivatives["start_price"].shape, (self.region_nb, len(PARAMETERS)))
+        np.testing.assert_allclose(result.values["start_price"], self._outputs(self._calculator())[0])
+
+        for name, up, down, step in [
+            ("renewal_bump", {"renewal_bump": 0.05 + 1e-6}, {"renewal_bump": 0.05 - 1e-6}, 1e-6),
+            ("limit_cores_offered", {"limit_cores_offered": 51}, {"limit_cores_offered": 49}, 1),
+            # One ideal core up and down: 31 and 29 of 50 cores.
+            ("ideal_bulk_proportion", {"ideal_bulk_proportion": 0.63}, {"ideal_bulk_proportion": 0.59}, 0.02),
+        ]:
+            i = PARAMETERS.index(name)
+            for output, expected_up, expected_down in zip(
+                ("start_price", "renewal_price"),
+                self._outputs(self._calculator(**up)),
+                self._outputs(self._calculator(**down)),
+            ):
+                np.testing.assert_allclose(
+                    result.derivatives[output][:, i],
+                    (expected_up - expected_down) / (2 * step),
+                    rtol=1e-5,
+                    atol=1e-6,
+                    err_msg=f"{output} by {name}",
+                )
+
+        # The first start price is the initial price itself.
+        np.testing.assert_allclose(result.derivatives["start_price"][0], [0, 0, 0, 0, 1, 0], atol=1e-9)
+
+    def test_jacobian_from_region(self):
+        result = jacobian(
+            self.calculator, self.region_nb, self.monthly_renewals, self.monthly_sales,
+            parameters=["renewal_bump", "limit_cores_offered"], from_region=5,
+        )
+
+        np.testing.assert_array_equal(result.derivatives["start_price"][:4], 0)
+        np.testing.assert_array_equal(result.derivatives["renewal_price"][:4], 0)
+        up = self._outputs(self._calculator(), from_region=5, limit_cores_offered=51)
+        down = self._outputs(self._calculator(), from_region=5, limit_cores_offered=49)
+        np.testing.assert_allclose(result.derivatives["start_price"][:, 1], (up[0] - down[0]) / 2, atol=1e-9)
+
+    def test_unknown_parameter(self):
+        with self.assertRaises(ValueError):
+            jacobian(self.calculator, 3, {}, {}, parameters=["region_length"])
+        with self.assertRaises(ValueError):
+            jacobian(self._calculator(limit_cores_offered=None), 3, {}, {}, parameters=["ideal_bulk_proportion"])
+
+    def test_morris(self):
+        bounds = {"renewal_bump": (0.01, 0.2), "ideal_bulk_proportion": (0.4, 0.8), "price": (500, 2000)}
+        result = morris(
+            self.calculator, self.region_nb, self.monthly_renewals, self.monthly_sales, bounds,
+            trajectories=16, rng=np.random.default_rng(0),
+        )
+
+        self.assertEqual(result.parameters, tuple(bounds))
+        self.assertEqual(result.mu_star["start_price"].shape, (self.region_nb, 3))
+        # The start price does not depend on the renewal bump, and the first one is the initial price.
+        np.testing.assert_array_equal(result.mu_star["start_price"][:, 0], 0)
+        np.testing.assert_allclose(result.mu["start_price"][0], [0, 0, 1500])
+        np.testing.assert_allclose(result.sigma["start_price"][0], 0, atol=1e-9)
+        self.assertTrue((result.mu_star["renewal_price"][1:, 0] > 0).any())
+        self.assertTrue(np.all(result.mu_star["start_price"] >= np.abs(result.mu["start_price"]) - 1e-9))
+
+    def test_sobol(self):
+        bounds = {"renewal_bump": (0.01, 0.2), "ideal_bulk_proportion": (0.4, 0.8), "price": (500, 2000)}
+        result = sobol(
+            self.calculator, self.region_nb, self.monthly_renewals, self.monthly_sales, bounds,
+            samples=4096, rng=np.random.default_rng(0),
+        )
+
+        self.assertEqual(result.first_order["start_price"].shape, (self.region_nb, 3))
+        # The first start price is the initial price: all of its variance comes from the price.
+        np.testing.assert_allclose(result.first_order["start_price"][0], [0, 0, 1], atol=0.05)
+        np.testing.assert_allclose(result.total["start_price"][0], [0, 0, 1], atol=0.05)
+        np.testing.assert_array_equal(result.total["start_price"][:, 0], 0)
+        self.assertTrue(np.all(result.total["start_price"] >= -1e-9))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from cli import merge_settings, simulate
+import service
+from service import SimulationService
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    response = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    if headers["content-type"] == "application/json":
+        response = json.loads(response)
+    return status, response
+
+
+class BlockingExecutor(ThreadPoolExecutor):
+    """
+    Thread pool whose tasks wait until `release` is set, so that requests pile up while a simulation runs.
+    """
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.release = threading.Event()
+        self.calls = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.calls += 1
+
+        def blocked():
+            self.release.wait(5)
+            return fn(*args, **kwargs)
+
+        return super().submit(blocked)
+
+
+class TestSimulationService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.executor = BlockingExecutor()
+        self.service = SimulationService(max_queue=2, executor=self.executor)
+        self.port = await self.service.start(port=0)
+
+    async def asyncTearDown(self):
+        self.executor.release.set()
+        await self.service.close()
+        self.executor.shutdown()
+
+    async def test_simulate(self):
+        self.executor.release.set()
+        payload = {"regions": 3, "renewals": [30, 40, 20], "sales": 5, "config": {"renewal_bump": 0.1}}
+
+        status, rows = await request(self.port, "POST", "/simulate", payload)
+
+        expected = simulate(*merge_settings(payload))
+        self.assertEqual(status, 200)
+        self.assertEqual([row["region"] for row in rows], [1, 2, 3])
+        for row, result in zip(rows, expected):
+            self.assertAlmostEqual(row["renewal_price"], result.renewal_price)
+            self.assertAlmostEqual(row["start_price"], result.start_price)
+
+    async def test_coalesce_and_cache(self):
+        payload = {"regions": 4, "renewals": 30}
+        pending = [
+            asyncio.ensure_future(request(self.port, "POST", "/simulate", payload)) for _ in range(10)
+        ]
+        while self.service.stats()["counters"].get("coalesced", 0) < 9:
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.service.stats()["queue_depth"], 1)
+        self.executor.release.set()
+
+        responses = await asyncio.gather(*pending)
+        status, cached = await request(self.port, "POST", "/simulate", payload)
+
+        self.assertEqual(self.executor.calls, 1)
+        self.assertTrue(all(response == responses[0] for response in responses))
+        self.assertEqual((status, cached), responses[0])
+        counters = self.service.stats()["counters"]
+        self.assertEqual(counters["cache_hits"], 1)
+        self.assertEqual(counters["computations"], 1)
+
+    async def test_queue_full(self):
+        pending = [
+            asyncio.ensure_future(request(self.port, "POST", "/simulate", {"regions": regions}))
+            for regions in (1, 2)
+        ]
+        while self.service.queue_depth < 2:
+            await asyncio.sleep(0.01)
+
+        status, response = await request(self.port, "POST", "/simulate", {"regions": 3})
+
+        self.assertEqual(status, 503)
+        self.executor.release.set()
+        self.assertEqual([status for status, _ in await asyncio.gather(*pending)], [200, 200])
+
+    async def test_queue_full_before_computing(self):
+        # The simulations are started in the same step of the event loop, before any of them runs.
+        pending = [
+            asyncio.ensure_future(self.service.simulate({"regions": regions})) for regions in (1, 2, 3)
+        ]
+
+        with self.assertRaises(service.ServiceBusy):
+            await pending[2]
+        self.assertEqual(self.service.queue_depth, 2)
+        self.executor.release.set()
+        await asyncio.gather(*pending[:2])
+        self.assertEqual(self.service.queue_depth, 0)
+
+    async def test_errors(self):
+        self.assertEqual((await request(self.port, "POST", "/simulate", {"colour": 1}))[0], 400)
+        self.assertEqual((await request(self.port, "POST", "/simulate", [1, 2]))[0], 400)
+        self.assertEqual((await request(self.port, "POST", "/simulate", {"regions": -1}))[0], 400)
+        self.assertEqual((await request(self.port, "GET", "/simulate"))[0], 405)
+        self.assertEqual((await request(self.port, "GET", "/unknown"))[0], 404)
+
+    async def test_invalid_config(self):
+        for config, settings in (
+            ({"leadin_length": 0}, {}),
+            ({"region_length": -140}, {}),
+            ({"interlude_length": -1}, {}),
+            ({"ideal_bulk_proportion": 0}, {"renewals": 0}),
+        ):
+            with self.subTest(config=config):
+                status, response = await request(self.port, "POST", "/simulate", {"config": config, **settings})
+                self.assertEqual(status, 400)
+                self.assertIn("error", response)
+
+    async def test_failed_simulation(self):
+        self.executor.release.set()
+        # Selling more cores than offered with an ideal of every offered core divides by zero.
+        payload = {"regions": 2, "renewals": 60, "config": {"ideal_bulk_proportion": 1.0}}
+
+        status, response = await request(self.port, "POST", "/simulate", payload)
+
+        self.assertEqual(status, 500)
+        self.assertIn("ZeroDivisionError", response["error"])
+        self.assertEqual((await request(self.port, "POST", "/simulate", {"regions": 2}))[0], 200)
+
+    async def test_invalid_content_length(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(b"POST /simulate HTTP/1.1\r\nContent-Length: ten\r\n\r\n")
+        await writer.drain()
+
+        status_line = await reader.readline()
+        writer.close()
+
+        self.assertEqual(int(status_line.split()[1]), 400)
+
+    async def test_metrics(self):
+        self.executor.release.set()
+        await request(self.port, "POST", "/simulate", {"regions": 2})
+
+        status, stats = await request(self.port, "GET", "/metrics")
+        _, text = await request(self.port, "GET", "/metrics?format=prometheus")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(stats["counters"]["responses_200"], 1)
+        self.assertIn(b"coretime_service_queue_depth 0\n", text)
+        self.assertIn(b'coretime_service_latency_seconds{quantile="0.99"}', text)
+
+
+class TestProcessPool(unittest.IsolatedAsyncioTestCase):
+    async def test_process_pool(self):
+        simulation = SimulationService(max_workers=1)
+        port = await simulation.start(port=0)
+        try:
+            status, rows = await request(port, "POST", "/simulate", {"regions": 2, "linear": False})
+        finally:
+            await simulation.close()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(service.simulate_body(*merge_settings({"regions": 2, "linear": False}))), rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from cache import SimulationCache
+from config import Config
+from engine import RegionEngine
+from scenario import Scenario, scenario_grid
+from store import ResultStore
+from sweep import run_sweep
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0}
+        self.scenarios = scenario_grid(
+            self.config, renewal_bump=[0.05, 0.1], factor=[1, 3], linear=[True, False], limit_cores_offered=[50, None]
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "store")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _create(self):
+        store = ResultStore.create(self.path, self.scenarios, 4, self.monthly_renewals, self.monthly_sales)
+        self.assertEqual(store.compute(max_workers=1), len(self.scenarios))
+        return ResultStore(self.path)
+
+    def test_matches_sweep(self):
+        store = self._create()
+        df = run_sweep(self.scenarios, 4, self.monthly_renewals, self.monthly_sales, max_workers=1)
+
+        stored = store.to_frame()
+        self.assertEqual(list(stored.columns), list(df.columns))
+        for column in ("start_price", "renewal_price", "sellout_price"):
+            np.testing.assert_array_equal(stored[column].to_numpy(), df[column].to_numpy())
+        self.assertEqual(stored["limit_cores_offered"].isna().sum(), df["limit_cores_offered"].isna().sum())
+
+    def test_find(self):
+        store = self._create()
+
+        for row, scenario in enumerate(self.scenarios):
+            self.assertEqual(store.find(scenario), row)
+            self.assertEqual(store.scenario(row).as_dict(), scenario.as_dict())
+        # Equal settings are found whatever their Python type.
+        self.assertEqual(store.find(Scenario(self.config, factor=1.0, price=1000)), store.find(self.scenarios[0]))
+        self.assertIsNone(store.find(Scenario(self.config, price=1234)))
+        self.assertNotIn(Scenario(self.config, price=1234), store)
+
+    def test_zero_copy(self):
+        store = self._create()
+
+        column = store.column("start_price")
+        self.assertEqual(column.shape, (len(self.scenarios), 4))
+        self.assertTrue(np.shares_memory(column, store.results))
+        self.assertFalse(store.results.flags.writeable)
+        expected = RegionEngine(self.scenarios[5].create_calculator()).run(4, self.monthly_renewals, self.monthly_sales)
+        np.testing.assert_array_equal(column[5], [result.start_price for result in expected])
+        np.testing.assert_array_equal(store.setting("renewal_bump")[:2], [0.05, 0.05])
+
+    def test_resume(self):
+        store = ResultStore.create(self.path, self.scenarios, 4, self.monthly_renewals, self.monthly_sales)
+        store.done[:10] = True
+        self.assertEqual(store.compute(max_workers=1), len(self.scenarios) - 10)
+        self.assertTrue(np.isnan(store.results[:10]).all())
+        self.assertFalse(np.isnan(store.results[10:, :, 0]).any())
+        self.assertEqual(store.compute(max_workers=1), 0)
+
+        with self.assertRaises(ValueError):
+            ResultStore(self.path).compute(max_workers=1)
+
+    def test_curves_match_simulation(self):
+        store = self._create()
+
+        for row, scenario in enumerate(self.scenarios):
+            expected = SimulationCache().simulate(
+                scenario.create_calculator(), 3, self.monthly_renewals, self.monthly_sales
+            )
+            curves = store.curves(row, 3)
+            self.assertEqual(len(curves), 3)
+            for curve, region in zip(curves, expected):
+                np.testing.assert_allclose(curve.prices, region.prices, rtol=1e-12)
+                self.assertEqual(curve.result.region_start, region.result.region_start)
+                self.assertAlmostEqual(curve.result.start_price, region.result.start_price)
+                self.assertAlmostEqual(curve.result.renewal_price, region.result.renewal_price)
+
+    def test_covers(self):
+        store = self._create()
+
+        self.assertTrue(store.covers(4, self.monthly_renewals, self.monthly_sales))
+        self.assertTrue(store.covers(2, {1: 10, 2: 35}, {2: 5}))
+        self.assertFalse(store.covers(5, self.monthly_renewals, self.monthly_sales))
+        self.assertFalse(store.covers(2, {1: 10, 2: 36}, {2: 5}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from config import Config
+from engine import RegionEngine
+from sweep import Scenario, run_sweep, scenario_grid
+
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(
+            interlude_length=7 * 5,
+            leadin_length=7 * 5,
+            region_length=28 * 5,
+            ideal_bulk_proportion=0.6,
+            limit_cores_offered=50,
+            renewal_bump=0.05,
+        )
+        self.monthly_renewals = {1: 10, 2: 35, 3: 40, 4: 20}
+        self.monthly_sales = {1: 0, 2: 5, 3: 10, 4: 0}
+
+    def test_scenario_grid(self):
+        scenarios = scenario_grid(
+            self.config,
+            ideal_bulk_proportion=[0.5, 0.6, 0.7],
+            linear=[True, False],
+        )
+
+        self.assertEqual(len(scenarios), 6)
+        self.assertEqual(
+            sorted({scenario.config.ideal_bulk_proportion for scenario in scenarios}),
+            [0.5, 0.6, 0.7],
+        )
+        self.assertEqual(scenarios[0].config.renewal_bump, self.config.renewal_bump)
+        self.assertEqual(self.config.ideal_bulk_proportion, 0.6)
+
+        with self.assertRaises(ValueError):
+            scenario_grid(self.config, not_a_setting=[1])
+
+    def test_run_sweep_matches_engine(self):
+        scenarios = scenario_grid(
+            self.config, renewal_bump=[0.05, 0.1], factor=[1, 3], linear=[True, False]
+        )
+
+        df = run_sweep(
+            scenarios, 4, self.monthly_renewals, self.monthly_sales, max_workers=1
+        )
+
+        self.assertEqual(len(df), len(scenarios) * 4)
+        for scenario_i, scenario in enumerate(scenarios):
+            expected = RegionEngine(scenario.create_calculator()).run(
+                4, self.monthly_renewals, self.monthly_sales
+            )
+            rows = df[df["scenario"] == scenario_i]
+            self.assertEqual(list(rows["region"]), [1, 2, 3, 4])
+            self.assertEqual(list(rows["renewal_bump"]), [scenario.config.renewal_bump] * 4)
+            for result, (_, row) in zip(expected, rows.iterrows()):
+                self.assertAlmostEqual(row["start_price"], result.start_price)
+                self.assertAlmostEqual(row["renewal_price"], result.renewal_price)
+                self.assertAlmostEqual(row["sellout_price"], result.sellout_price)
+
+    def test_run_sweep_process_pool(self):
+        scenarios = [Scenario(self.config, factor=factor) for factor in range(1, 6)]
+
+        serial = run_sweep(
+            scenarios, 4, self.monthly_renewals, self.monthly_sales, max_workers=1
+        )
+        parallel = run_sweep(
+            scenarios,
+            4,
+            self.monthly_renewals,
+            self.monthly_sales,
+            max_workers=2,
+            chunksize=2,
+        )
+
+        self.assertTrue(serial.equals(parallel))
+
+
+if __name__ == "__main__":
+    unittest.main()